@@ -0,0 +1,68 @@
+"""Latence de create_sale selon la taille du panier (1, 10 et 50 lignes).
+
+Usage:
+    python benchmarks/bench_create_sale.py [--sales 200]
+
+La base est créée dans un dossier temporaire: la base de l'application
+n'est jamais touchée.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+CART_SIZES = (1, 10, 50)
+
+
+def run(sales: int) -> None:
+    from pharmacy_pos.database import init_db
+    from pharmacy_pos.services.auth_service import ensure_default_admin
+    from pharmacy_pos.services.product_service import create_product
+    from pharmacy_pos.services.sales_service import create_sale
+    from pharmacy_pos.services.stock_service import add_stock
+
+    init_db()
+    ensure_default_admin()
+    product_ids = []
+    for idx in range(max(CART_SIZES)):
+        pid = create_product(f"Produit bench {idx:03d}", f"BENCH{idx:05d}", "Bench", 1, 2, 0, 0, False)
+        # Plusieurs lots par produit pour exercer l'allocation FIFO.
+        for lot in range(3):
+            add_stock(pid, f"B{idx}-{lot}", f"203{lot}-01-01", sales * 2)
+        product_ids.append(pid)
+
+    print(f"{'lignes':>7} {'ventes':>7} {'p50 ms':>9} {'p95 ms':>9} {'ventes/s':>9}")
+    for size in CART_SIZES:
+        cart = [{"product_id": pid, "quantity": 1} for pid in product_ids[:size]]
+        timings = []
+        for _ in range(sales):
+            start = time.perf_counter()
+            create_sale(1, cart, "cash")
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(
+            f"{size:>7} {sales:>7} {statistics.median(timings):>9.3f} {p95:>9.3f} "
+            f"{sales / (sum(timings) / 1000):>9.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sales", type=int, default=200, help="ventes par taille de panier")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_POS_DB"] = os.path.join(tmp, "bench.db")
+        run(args.sales)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Débit de create_sale avec plusieurs caisses dans un même processus:
+verrou SQLite partagé (appel direct) contre écrivain unique (group commit).
+
+Usage:
+    python benchmarks/bench_group_commit.py [--tills 1 4 16] [--sales 300]
+
+La base est créée dans un dossier temporaire: la base de l'application
+n'est jamais touchée.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+PRODUCTS = 50
+
+
+def run(tills_list: list[int], sales: int) -> None:
+    from pharmacy_pos.database import init_db
+    from pharmacy_pos.services.auth_service import ensure_default_admin
+    from pharmacy_pos.services.product_service import create_product
+    from pharmacy_pos.services.sales_service import create_sale
+    from pharmacy_pos.services.stock_service import add_stock
+    from pharmacy_pos.writer import start_writer, stop_writer, writer_stats
+
+    init_db()
+    ensure_default_admin()
+    product_ids = []
+    for idx in range(PRODUCTS):
+        pid = create_product(f"Produit bench {idx:03d}", f"BENCH{idx:05d}", "Bench", 1, 2, 0, 0, False)
+        add_stock(pid, f"B{idx}", "2090-01-01", 2 * sales * max(tills_list) * len(tills_list))
+        product_ids.append(pid)
+
+    def till(offset: int, timings: list[float]) -> None:
+        for i in range(sales):
+            cart = [{"product_id": product_ids[(offset + i + k) % PRODUCTS], "quantity": 1} for k in range(3)]
+            start = time.perf_counter()
+            create_sale(1, cart, "cash")
+            timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"{'mode':>9} {'postes':>7} {'ventes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'ventes/tx':>9}")
+    for tills in tills_list:
+        for mode in ("direct", "écrivain"):
+            if mode == "écrivain":
+                start_writer()
+            timings: list[float] = []
+            threads = [threading.Thread(target=till, args=(n * 7, timings)) for n in range(tills)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            stats = writer_stats()
+            stop_writer()
+            per_tx = stats["operations"] / stats["batches"] if stats.get("batches") else 1.0
+            timings.sort()
+            print(
+                f"{mode:>9} {tills:>7} {len(timings) / elapsed:>9.0f} {statistics.median(timings):>8.2f} "
+                f"{timings[int(len(timings) * 0.95)]:>8.2f} {per_tx:>9.1f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tills", type=int, nargs="+", default=[1, 4, 16], help="caisses (threads) en parallèle")
+    parser.add_argument("--sales", type=int, default=300, help="ventes par caisse")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_POS_DB"] = os.path.join(tmp, "bench.db")
+        run(args.tills, args.sales)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Construction de bases de benchmark à volumétrie réaliste.
+
+S'appuie sur le générateur du seed démo (historique simulé, écrit par
+executemany sur le profil `bulk_import`).
+"""
+
+# ~3 lignes par vente: 1k -> ~60k lignes, 20k -> ~1.2M, 100k -> ~5M.
+SCALES = {
+    "1k": {"products": 1_000, "months": 2, "sales_per_day": 330},
+    "20k": {"products": 20_000, "months": 12, "sales_per_day": 1_100},
+    "100k": {"products": 100_000, "months": 12, "sales_per_day": 4_700},
+}
+
+
+def build_dataset(products: int, months: int, sales_per_day: int, seed: int = 42) -> dict:
+    """Remplit la base courante (PHARMACY_POS_DB), supposée vide."""
+    from pharmacy_pos.database import init_db
+    from pharmacy_pos.services.auth_service import ensure_default_admin
+    from pharmacy_pos.services.demo_seed_service import generate_demo_dataset
+
+    init_db()
+    ensure_default_admin()
+    return generate_demo_dataset(products=products, months=months, sales_per_day=sales_per_day, seed=seed)
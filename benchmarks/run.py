@@ -0,0 +1,231 @@
+"""Benchmarks de la couche services à volumétrie réaliste.
+
+Usage:
+    python benchmarks/run.py --scale 1k
+    python benchmarks/run.py --scale 1k 20k --output benchmarks/results
+    python benchmarks/run.py --scale 20k --compare benchmarks/results/20k-<commit>.json
+
+Chaque échelle est mesurée dans un processus séparé sur une copie de sa
+base de référence, construite une fois puis réutilisée (--data-dir).
+Les résultats (p50/p95/p99, débit) sont écrits en JSON pour comparer les
+commits entre eux.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.dataset import SCALES, build_dataset  # noqa: E402
+
+DEFAULT_DATA_DIR = ROOT / "benchmarks" / "data"
+DEFAULT_OUTPUT_DIR = ROOT / "benchmarks" / "results"
+
+# Nombre d'itérations par opération (les plus lourdes sont moins répétées).
+ITERATIONS = {
+    "create_sale": 200,
+    "search_products": 200,
+    "list_products": 5,
+    "list_products_page": 100,
+    "get_low_stock_products": 20,
+    "get_expiring_batches": 20,
+    "get_expiry_calendar": 10,
+    "sales_summary": 20,
+    "top_products": 10,
+    "list_sales": 50,
+    "cancel_sale": 100,
+    "export_reports_csv": 3,
+}
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(timings_ms: list[float]) -> dict:
+    ordered = sorted(timings_ms)
+    total_s = sum(ordered) / 1000
+    return {
+        "iterations": len(ordered),
+        "p50_ms": round(_percentile(ordered, 50), 3),
+        "p95_ms": round(_percentile(ordered, 95), 3),
+        "p99_ms": round(_percentile(ordered, 99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "ops_per_s": round(len(ordered) / total_s, 1) if total_s else None,
+    }
+
+
+def _timed(func, iterations: int) -> list[float]:
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run_scale(scale: str, seed: int, factor: float) -> dict:
+    """Mesure toutes les opérations sur la base courante (PHARMACY_POS_DB)."""
+    from pharmacy_pos.database import db_cursor
+    from pharmacy_pos.services.product_service import list_products, list_products_page, search_products
+    from pharmacy_pos.services.report_service import sales_summary, top_products
+    from pharmacy_pos.services.sales_service import cancel_sale, create_sale, list_sales
+    from pharmacy_pos.services.stock_service import get_expiring_batches, get_expiry_calendar, get_low_stock_products
+    from pharmacy_pos.utils.report_export import export_reports_csv
+
+    rng = random.Random(seed)
+    with db_cursor() as cur:
+        cur.execute("SELECT id FROM products WHERE stock_valid >= 50 ORDER BY id")
+        sellable = [row["id"] for row in cur.fetchall()]
+    periods = ("jour", "semaine", "mois", "annee")
+    created_sales: list[int] = []
+    export_dir = tempfile.mkdtemp(prefix="bench_export_")
+
+    def sale(_i: int) -> None:
+        cart = [{"product_id": rng.choice(sellable), "quantity": 1, "prescription_ok": True} for _ in range(3)]
+        created_sales.append(create_sale(1, cart, "cash"))
+
+    def search(_i: int) -> None:
+        term = rng.choice(("para", "amox", "vitamine", "GEN042", "ibu", "zinc 500"))
+        search_products(term, 20)
+
+    operations = {
+        "create_sale": sale,
+        "search_products": search,
+        "list_products": lambda _i: list_products(),
+        "list_products_page": lambda _i: list_products_page(("M", 0), 200),
+        "get_low_stock_products": lambda _i: get_low_stock_products(),
+        "get_expiring_batches": lambda _i: get_expiring_batches(90),
+        "get_expiry_calendar": lambda i: get_expiry_calendar(180, ("week", "month")[i % 2]),
+        "sales_summary": lambda i: sales_summary(periods[i % len(periods)]),
+        "top_products": lambda i: top_products(20, periods[i % len(periods)]),
+        "list_sales": lambda _i: list_sales(100),
+        "cancel_sale": lambda i: cancel_sale(created_sales[i], "Benchmark"),
+        "export_reports_csv": lambda _i: export_reports_csv(export_dir),
+    }
+
+    results = {}
+    try:
+        for name, func in operations.items():
+            iterations = max(1, int(ITERATIONS[name] * factor))
+            if name == "cancel_sale":
+                iterations = min(iterations, len(created_sales))
+            results[name] = summarize(_timed(func, iterations))
+            print(f"  {name:<24} p50={results[name]['p50_ms']:>9.3f} ms  p95={results[name]['p95_ms']:>9.3f} ms  "
+                  f"p99={results[name]['p99_ms']:>9.3f} ms  {results[name]['ops_per_s']} op/s", flush=True)
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+def compare(current: dict, previous_path: str) -> None:
+    previous = json.loads(Path(previous_path).read_text(encoding="utf-8"))
+    print(f"Comparaison avec {previous.get('commit')} ({previous_path}):")
+    for name, stats in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if not old or not old["p50_ms"]:
+            continue
+        delta = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        print(f"  {name:<24} p50 {old['p50_ms']:>9.3f} -> {stats['p50_ms']:>9.3f} ms ({delta:+.1f}%)")
+
+
+def _child(args, mode: str, scale: str, db_path: Path) -> None:
+    cmd = [sys.executable, __file__, mode, "--scale", scale, "--seed", str(args.seed),
+           "--factor", str(args.factor), "--output", args.output]
+    subprocess.run(cmd, check=True, env={**os.environ, "PHARMACY_POS_DB": str(db_path)})
+
+
+def bench_scale(args, scale: str) -> None:
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    reference = data_dir / f"{scale}-seed{args.seed}.db"
+    if not reference.exists() or args.rebuild:
+        building = reference.with_suffix(".tmp")
+        building.unlink(missing_ok=True)
+        _child(args, "--internal-build", scale, building)
+        os.replace(building, reference)
+
+    # Les mesures modifient la base: on travaille sur une copie.
+    with tempfile.TemporaryDirectory() as tmp:
+        working = Path(tmp) / reference.name
+        shutil.copyfile(reference, working)
+        _child(args, "--internal-run", scale, working)
+
+    if args.compare:
+        current = json.loads((Path(args.output) / f"{scale}-{_git_commit()}.json").read_text(encoding="utf-8"))
+        compare(current, args.compare)
+
+
+def internal_build(args) -> None:
+    scale = args.scale[0]
+    print(f"Construction de la base {scale}...", flush=True)
+    start = time.perf_counter()
+    dataset = build_dataset(seed=args.seed, **SCALES[scale])
+    print(f"  {dataset} en {time.perf_counter() - start:.1f} s", flush=True)
+
+    from pharmacy_pos.database import close_connections
+
+    close_connections()
+
+
+def internal_run(args) -> None:
+    scale = args.scale[0]
+    print(f"Échelle {scale}:", flush=True)
+    report = {
+        "scale": scale,
+        "dataset": SCALES[scale],
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": run_scale(scale, args.seed, args.factor),
+    }
+    out_dir = Path(args.output)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_file = out_dir / f"{scale}-{report['commit']}.json"
+    out_file.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Résultats: {out_file}", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks des services pharmacy_pos")
+    parser.add_argument("--scale", nargs="+", choices=sorted(SCALES), default=["1k"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--factor", type=float, default=1.0, help="multiplie le nombre d'itérations")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR))
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT_DIR))
+    parser.add_argument("--compare", help="fichier JSON d'un run précédent (même échelle)")
+    parser.add_argument("--rebuild", action="store_true", help="reconstruit la base de l'échelle")
+    # Modes internes: le chemin de la base (PHARMACY_POS_DB) est lu à l'import
+    # de la config, chaque base est donc traitée dans son propre processus.
+    parser.add_argument("--internal-build", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--internal-run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.internal_build:
+        internal_build(args)
+    elif args.internal_run:
+        internal_run(args)
+    else:
+        for scale in args.scale:
+            bench_scale(args, scale)
+
+
+if __name__ == "__main__":
+    main()
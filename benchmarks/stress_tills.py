@@ -0,0 +1,194 @@
+"""Stress multi-postes: N caisses en parallèle sur la même base.
+
+Usage:
+    python benchmarks/stress_tills.py [--tills 8] [--seconds 10] [--products 20] [--stock 400]
+
+Chaque poste est un processus qui enchaîne ventes (~85 %), annulations
+(~10 %) et retours partiels (~5 %) sur quelques produits très demandés, aux
+lots volontairement limités: les ruptures et la contention sur le verrou
+d'écriture sont le cas nominal. À la fin, les invariants sont vérifiés
+(aucune survente, aucun lot négatif, registre = lots, compteurs = lots);
+code de sortie 1 si l'un d'eux est violé.
+
+La base est créée dans un dossier temporaire: la base de l'application
+n'est jamais touchée.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+LOTS_PER_PRODUCT = 3
+
+
+def setup(products: int, stock: int) -> dict[int, int]:
+    """Crée les produits et leurs lots. Retourne le stock initial par produit."""
+    from pharmacy_pos.database import init_db
+    from pharmacy_pos.services.auth_service import ensure_default_admin
+    from pharmacy_pos.services.product_service import create_product
+    from pharmacy_pos.services.stock_service import add_stock
+
+    init_db()
+    ensure_default_admin()
+    initial = {}
+    per_lot = max(1, stock // LOTS_PER_PRODUCT)
+    for idx in range(products):
+        pid = create_product(f"Produit stress {idx:03d}", f"STRESS{idx:05d}", "Stress", 1, 2, 0, 0, False)
+        for lot in range(LOTS_PER_PRODUCT):
+            add_stock(pid, f"S{idx}-{lot}", f"{2090 + lot}-01-01", per_lot)
+        initial[pid] = per_lot * LOTS_PER_PRODUCT
+    return initial
+
+
+def till(seed: int, product_ids: list[int], seconds: float, results) -> None:
+    from pharmacy_pos.database import contention_stats
+    from pharmacy_pos.services.sales_service import cancel_sale, create_sale, get_sale_items, return_sale_item
+
+    rng = random.Random(seed)
+    counts = {"sales": 0, "cancels": 0, "returns": 0, "stock_outs": 0, "busy": 0, "errors": 0}
+    latencies: list[float] = []
+    open_sales: list[int] = []
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        start = time.perf_counter()
+        try:
+            if roll < 0.10 and open_sales:
+                cancel_sale(open_sales.pop(rng.randrange(len(open_sales))), "Stress")
+                counts["cancels"] += 1
+            elif roll < 0.15 and open_sales:
+                items = get_sale_items(rng.choice(open_sales))
+                item = rng.choice(items)
+                return_sale_item(item["sale_item_id"], 1, "Stress")
+                counts["returns"] += 1
+            else:
+                cart = [
+                    {"product_id": pid, "quantity": rng.randint(1, 3)}
+                    for pid in rng.sample(product_ids, rng.randint(1, min(3, len(product_ids))))
+                ]
+                open_sales.append(create_sale(1, cart, "cash"))
+                counts["sales"] += 1
+        except ValueError as exc:
+            message = str(exc)
+            if message.startswith("Stock insuffisant"):
+                counts["stock_outs"] += 1
+            elif message.startswith("Base occupée"):
+                counts["busy"] += 1
+            elif message.startswith("Quantité retour"):
+                pass  # ligne déjà entièrement retournée
+            else:
+                counts["errors"] += 1
+        except Exception:
+            counts["errors"] += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    results.put({"counts": counts, "latencies": latencies, "contention": contention_stats()})
+
+
+def check_invariants(initial: dict[int, int]) -> list[str]:
+    from pharmacy_pos.database import db_cursor
+    from pharmacy_pos.services.ledger_service import reconcile_stock_ledger
+    from pharmacy_pos.services.stock_service import verify_stock_counters
+
+    failures = []
+    with db_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM batches WHERE quantity < 0")
+        if cur.fetchone()["n"]:
+            failures.append("lots négatifs")
+        cur.execute(
+            """
+            SELECT si.product_id,
+                   SUM(si.quantity) - COALESCE(SUM((SELECT SUM(r.quantity) FROM returns r WHERE r.sale_item_id = si.id)), 0) AS sold
+            FROM sale_items si
+            WHERE si.sale_id NOT IN (SELECT sale_id FROM sale_cancellations)
+            GROUP BY si.product_id
+            """
+        )
+        sold = {row["product_id"]: row["sold"] for row in cur.fetchall()}
+        cur.execute("SELECT product_id, SUM(quantity) AS total FROM batches GROUP BY product_id")
+        stock = {row["product_id"]: row["total"] for row in cur.fetchall()}
+
+    for pid, quantity in initial.items():
+        if sold.get(pid, 0) > quantity:
+            failures.append(f"survente produit {pid}: {sold[pid]} > {quantity}")
+        if stock.get(pid, 0) != quantity - sold.get(pid, 0):
+            failures.append(f"stock produit {pid}: {stock.get(pid, 0)} != {quantity} - {sold.get(pid, 0)}")
+    if reconcile_stock_ledger():
+        failures.append("registre de mouvements != lots")
+    if verify_stock_counters():
+        failures.append("compteurs produits != lots")
+    return failures
+
+
+def run(tills: int, seconds: float, products: int, stock: int) -> int:
+    initial = setup(products, stock)
+    product_ids = sorted(initial)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=till, args=(seed, product_ids, seconds, results)) for seed in range(tills)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    counts = {key: sum(r["counts"][key] for r in reports) for key in reports[0]["counts"]}
+    contention = {key: sum(r["contention"][key] for r in reports) for key in reports[0]["contention"]}
+    latencies = sorted(ms for r in reports for ms in r["latencies"])
+    done = counts["sales"] + counts["cancels"] + counts["returns"]
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    print(f"postes: {tills}  durée: {elapsed:.1f} s  opérations validées: {done} ({done / elapsed:.0f}/s)")
+    print("  " + "  ".join(f"{key}={value}" for key, value in counts.items()))
+    print(
+        f"  latence ms: p50={statistics.median(latencies) if latencies else 0:.2f} "
+        f"p95={pct(0.95):.2f} p99={pct(0.99):.2f} max={latencies[-1] if latencies else 0:.2f}"
+    )
+    waits = contention["write_transactions"] or 1
+    print(
+        f"  verrou: transactions={contention['write_transactions']} attente moyenne={contention['lock_wait_ms'] / waits:.2f} ms "
+        f"max={max(r['contention']['max_lock_wait_ms'] for r in reports):.1f} ms "
+        f"rejeux={contention['retries']} échecs={contention['busy_failures']}"
+    )
+
+    failures = check_invariants(initial)
+    if counts["errors"]:
+        failures.append(f"{counts['errors']} erreurs inattendues")
+    for failure in failures:
+        print(f"ÉCHEC: {failure}")
+    if not failures:
+        print("invariants OK")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tills", type=int, default=8, help="postes (processus) en parallèle")
+    parser.add_argument("--seconds", type=float, default=10.0, help="durée du test")
+    parser.add_argument("--products", type=int, default=20, help="produits très demandés")
+    parser.add_argument("--stock", type=int, default=400, help="stock initial par produit")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_POS_DB"] = os.path.join(tmp, "stress.db")
+        code = run(args.tills, args.seconds, args.products, args.stock)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,66 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-DB_PATH = BASE_DIR / "pharmacy_pos.db"
+DB_PATH = Path(os.environ.get("PHARMACY_POS_DB", BASE_DIR / "pharmacy_pos.db"))
 DATE_FMT = "%Y-%m-%d"
+
+# Profils de connexion SQLite.
+# - terminal: caisse, transactions courtes, latence minimale.
+# - reporting: lectures lourdes (rapports, exports), cache plus large.
+# - bulk_import: imports massifs, durabilité relâchée au profit du débit.
+DB_PROFILES = {
+    "terminal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8_000,  # KiB (valeur négative = taille en KiB)
+        "mmap_size": 64 * 1024 * 1024,
+        "busy_timeout": 5_000,  # ms
+        "temp_store": "MEMORY",
+    },
+    "reporting": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64_000,
+        "mmap_size": 256 * 1024 * 1024,
+        "busy_timeout": 10_000,
+        "temp_store": "MEMORY",
+    },
+    "bulk_import": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256_000,
+        "mmap_size": 256 * 1024 * 1024,
+        "busy_timeout": 30_000,
+        "temp_store": "MEMORY",
+    },
+}
+DB_PROFILE = os.environ.get("PHARMACY_POS_DB_PROFILE", "terminal")
+
+# Écritures de caisse concurrentes (plusieurs postes sur la même base): si le
+# verrou d'écriture n'est pas obtenu dans le busy_timeout, la transaction est
+# rejouée au plus TX_RETRY_ATTEMPTS fois, avec une attente croissante.
+TX_RETRY_ATTEMPTS = 3
+TX_RETRY_BACKOFF_MS = 20
+
+# Écrivain unique optionnel (pharmacy_pos/writer.py): les écritures de caisse
+# des threads du processus sont validées par groupes d'au plus WRITER_BATCH_MAX.
+# PHARMACY_POS_WRITER=1: démarré au lancement de l'application.
+WRITER_ENABLED = os.environ.get("PHARMACY_POS_WRITER") == "1"
+WRITER_BATCH_MAX = 64
+
+# Journal local des ventes hors ligne (base injoignable ou verrouillée): une
+# ligne JSON par vente, fsync au plus tard toutes les JOURNAL_FSYNC_EVERY
+# ventes ou JOURNAL_FSYNC_MS ms. La base est retentée toutes les
+# JOURNAL_RETRY_S secondes, journal rejoué d'abord.
+JOURNAL_PATH = Path(os.environ.get("PHARMACY_POS_JOURNAL", BASE_DIR / "ventes_hors_ligne.jsonl"))
+JOURNAL_FSYNC_EVERY = 8
+JOURNAL_FSYNC_MS = 200
+JOURNAL_RETRY_S = 30
+
+# Instrumentation SQL (désactivée si PHARMACY_POS_SQL_TRACE est absent).
+# PHARMACY_POS_SQL_TRACE: seuil en ms au-delà duquel une requête est journalisée.
+# PHARMACY_POS_SQL_TRACE_FILE: fichier JSON du résumé écrit à la fermeture.
+_sql_trace = os.environ.get("PHARMACY_POS_SQL_TRACE")
+SQL_TRACE_SLOW_MS = float(_sql_trace) if _sql_trace else None
+SQL_TRACE_FILE = os.environ.get("PHARMACY_POS_SQL_TRACE_FILE")
@@ -1,32 +1,320 @@
+import atexit
+import functools
+import logging
+import random
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Callable, Iterator
 
-from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.config import (
+    DB_PATH,
+    DB_PROFILE,
+    DB_PROFILES,
+    SQL_TRACE_FILE,
+    SQL_TRACE_SLOW_MS,
+    TX_RETRY_ATTEMPTS,
+    TX_RETRY_BACKOFF_MS,
+)
+from pharmacy_pos.instrumentation import InstrumentedCursor, QueryRecorder, calling_service
+from pharmacy_pos.migrations import migrate
 
+# Pool de connexions: une connexion longue durée par thread et par profil.
+# Les connexions sont en mode autocommit (isolation_level=None); les
+# transactions sont ouvertes explicitement par db_cursor().
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool: list[sqlite3.Connection] = []
+_generation = 0
+_default_profile = DB_PROFILE
+_recorder: QueryRecorder | None = None
+logger = logging.getLogger(__name__)
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# Contention entre postes (par processus): attente du verrou d'écriture et rejeux.
+_contention_lock = threading.Lock()
+_contention = {"write_transactions": 0, "lock_wait_ms": 0.0, "max_lock_wait_ms": 0.0, "retries": 0, "busy_failures": 0}
+
+
+def _profile_settings(profile: str) -> dict:
+    settings = DB_PROFILES.get(profile)
+    if settings is None:
+        raise ValueError(f"Profil de connexion inconnu: {profile}")
+    return settings
+
+
+def get_connection(profile: str | None = None) -> sqlite3.Connection:
+    """Ouvre une nouvelle connexion configurée selon le profil (hors pool)."""
+    settings = _profile_settings(profile or _default_profile)
+    start = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+    conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+    if _recorder is not None:
+        _recorder.record_connection((time.perf_counter() - start) * 1000)
     return conn
 
 
+def set_default_profile(profile: str) -> None:
+    """Change le profil utilisé par défaut par db_cursor()."""
+    global _default_profile
+    _profile_settings(profile)
+    _default_profile = profile
+
+
+def _pooled_connection(profile: str) -> sqlite3.Connection:
+    connections = getattr(_local, "connections", None)
+    if connections is None or getattr(_local, "generation", None) != _generation:
+        connections = {}
+        _local.connections = connections
+        _local.generation = _generation
+
+    conn = connections.get(profile)
+    if conn is None:
+        conn = get_connection(profile)
+        with _pool_lock:
+            _pool.append(conn)
+        connections[profile] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """Ferme toutes les connexions du pool (tous threads confondus)."""
+    global _generation
+    with _pool_lock:
+        _generation += 1
+        connections = list(_pool)
+        _pool.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.connections = {}
+    _local.active = None
+    _local.depth = 0
+
+
+def pool_generation() -> int:
+    """Change à chaque close_connections() (base potentiellement recréée).
+
+    Les caches mémoire s'en servent pour se savoir périmés.
+    """
+    return _generation
+
+
+def _new_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+    return conn.cursor(InstrumentedCursor) if _recorder is not None else conn.cursor()
+
+
+def enable_instrumentation(slow_ms: float = 50.0, window: int = 1000) -> QueryRecorder:
+    """Active la mesure des requêtes (durées, lignes, transactions, connexions).
+
+    Les requêtes plus lentes que `slow_ms` sont journalisées (logger
+    "pharmacy_pos.sql") avec leur EXPLAIN QUERY PLAN.
+    """
+    global _recorder
+    _recorder = QueryRecorder(slow_ms=slow_ms, window=window)
+    InstrumentedCursor.recorder = _recorder
+    return _recorder
+
+
+def disable_instrumentation() -> QueryRecorder | None:
+    global _recorder
+    recorder = _recorder
+    _recorder = None
+    InstrumentedCursor.recorder = None
+    return recorder
+
+
+def instrumentation_summary() -> dict:
+    if _recorder is None:
+        return {}
+    return _recorder.summary()
+
+
+def dump_instrumentation(path: str) -> str | None:
+    """Écrit le résumé JSON de l'instrumentation; None si elle est inactive."""
+    if _recorder is None:
+        return None
+    return _recorder.dump(path)
+
+
+class DatabaseUnavailable(ValueError):
+    """Verrou d'écriture toujours indisponible après les rejeux."""
+
+
+def _begin_immediate(conn: sqlite3.Connection) -> None:
+    start = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+    finally:
+        waited = (time.perf_counter() - start) * 1000
+        with _contention_lock:
+            _contention["write_transactions"] += 1
+            _contention["lock_wait_ms"] += waited
+            _contention["max_lock_wait_ms"] = max(_contention["max_lock_wait_ms"], waited)
+
+
+def contention_stats() -> dict:
+    """Compteurs de contention du processus: transactions d'écriture, attente
+    cumulée/maximale du verrou (ms), rejeux et échecs après rejeux."""
+    with _contention_lock:
+        return dict(_contention)
+
+
+def reset_contention_stats() -> None:
+    with _contention_lock:
+        for key in _contention:
+            _contention[key] = 0
+
+
+def _is_busy(exc: sqlite3.OperationalError) -> bool:
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+def retry_on_busy(func: Callable) -> Callable:
+    """Rejoue une unité de travail si la base reste verrouillée par un autre poste.
+
+    Seul l'appel le plus externe est rejoué (la transaction a été annulée en
+    entier); imbriqué dans la transaction d'un appelant, l'erreur remonte.
+    Après TX_RETRY_ATTEMPTS tentatives: DatabaseUnavailable (une ValueError).
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, "depth", 0) > 0:
+            return func(*args, **kwargs)
+        for attempt in range(TX_RETRY_ATTEMPTS):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as exc:
+                if not _is_busy(exc):
+                    raise
+                if attempt == TX_RETRY_ATTEMPTS - 1:
+                    with _contention_lock:
+                        _contention["busy_failures"] += 1
+                    raise DatabaseUnavailable("Base occupée par un autre poste, réessayez") from exc
+                with _contention_lock:
+                    _contention["retries"] += 1
+                # Attente exponentielle avec gigue: les postes ne se resynchronisent pas.
+                time.sleep(TX_RETRY_BACKOFF_MS * 2**attempt * random.uniform(0.5, 1.5) / 1000)
+
+    return wrapper
+
+
 @contextmanager
-def db_cursor() -> Iterator[sqlite3.Cursor]:
-    conn = get_connection()
+def db_cursor(profile: str | None = None, immediate: bool = False) -> Iterator[sqlite3.Cursor]:
+    """Curseur transactionnel sur une connexion réutilisée.
+
+    Les appels imbriqués dans un même thread partagent la connexion et la
+    transaction en cours: seul le bloc le plus externe valide ou annule.
+    `immediate=True` prend le verrou d'écriture dès l'ouverture (BEGIN IMMEDIATE).
+    """
+    depth = getattr(_local, "depth", 0)
+    if depth > 0:
+        conn = _local.active
+        _local.depth = depth + 1
+        try:
+            yield _new_cursor(conn)
+        finally:
+            _local.depth -= 1
+        return
+
+    conn = _pooled_connection(profile or _default_profile)
+    _local.active = conn
+    _local.depth = 1
+    _local.after_commit = []
+    recorder = _recorder
+    start = time.perf_counter()
     try:
-        cur = conn.cursor()
+        if immediate:
+            _begin_immediate(conn)
+        else:
+            conn.execute("BEGIN")
+        cur = _new_cursor(conn)
         yield cur
         conn.commit()
-    except Exception:
+    except BaseException:
         conn.rollback()
+        _local.after_commit = []
         raise
     finally:
-        conn.close()
+        _local.depth = 0
+        _local.active = None
+        if recorder is not None:
+            recorder.record_transaction(calling_service(outermost=True), (time.perf_counter() - start) * 1000)
+
+    callbacks, _local.after_commit = _local.after_commit, []
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            # La transaction est validée: un cache en échec ne doit pas la faire échouer.
+            logger.exception("Échec d'un traitement après validation")
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """Exécute `callback` après validation de la transaction en cours.
+
+    Abandonné si la transaction est annulée; exécuté immédiatement hors
+    transaction. Sert à tenir à jour les caches mémoire (catalogue, lots).
+    """
+    if getattr(_local, "depth", 0) > 0:
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+
+def in_transaction() -> bool:
+    """Vrai si le thread courant est dans un bloc db_cursor()/transaction()."""
+    return getattr(_local, "depth", 0) > 0
+
+
+@contextmanager
+def savepoint(cur: sqlite3.Cursor, name: str = "operation") -> Iterator[sqlite3.Cursor]:
+    """Sous-transaction dans la transaction en cours.
+
+    En cas d'exception, seules les écritures du bloc sont annulées (ROLLBACK
+    TO), ainsi que les traitements after_commit qu'il avait enregistrés; la
+    transaction englobante continue.
+    """
+    registered = len(_local.after_commit)
+    cur.execute(f"SAVEPOINT {name}")
+    try:
+        yield cur
+    except BaseException:
+        cur.execute(f"ROLLBACK TO {name}")
+        cur.execute(f"RELEASE {name}")
+        del _local.after_commit[registered:]
+        raise
+    cur.execute(f"RELEASE {name}")
+
+
+@contextmanager
+def transaction(cur: sqlite3.Cursor | None = None, profile: str | None = None) -> Iterator[sqlite3.Cursor]:
+    """Unité de travail en écriture (BEGIN IMMEDIATE ... COMMIT).
+
+    Si `cur` est fourni, l'appelant possède déjà la transaction: le curseur est
+    réutilisé tel quel et la validation reste à la charge de l'appelant.
+    """
+    if cur is not None:
+        yield cur
+        return
+    with db_cursor(profile, immediate=True) as own_cur:
+        yield own_cur
 
 
 def init_db() -> None:
+    # La base a pu être supprimée/recréée: on repart d'un pool propre.
+    close_connections()
     with db_cursor() as cur:
         cur.executescript(
             """
@@ -117,3 +405,13 @@ def init_db() -> None:
             );
             """
         )
+
+    # Évolutions du schéma (index, colonnes...) au-delà du schéma de base.
+    with transaction() as cur:
+        migrate(cur)
+
+
+if SQL_TRACE_SLOW_MS is not None:
+    enable_instrumentation(slow_ms=SQL_TRACE_SLOW_MS)
+    if SQL_TRACE_FILE:
+        atexit.register(dump_instrumentation, SQL_TRACE_FILE)
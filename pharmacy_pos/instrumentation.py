@@ -0,0 +1,203 @@
+"""Instrumentation SQL optionnelle.
+
+Activée via `pharmacy_pos.database.enable_instrumentation()` (ou la variable
+d'environnement PHARMACY_POS_SQL_TRACE), elle mesure chaque requête passant
+par `db_cursor()`, l'attribue à la fonction de `pharmacy_pos.services` qui
+l'a émise et journalise les requêtes lentes avec leur plan d'exécution.
+"""
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+logger = logging.getLogger("pharmacy_pos.sql")
+
+SERVICES_PACKAGE = "pharmacy_pos.services."
+_SPACES = re.compile(r"\s+")
+
+
+class Histogram:
+    """Compteurs cumulés + fenêtre glissante des dernières mesures (ms)."""
+
+    def __init__(self, window: int = 1000):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, value_ms: float) -> None:
+        self.samples.append(value_ms)
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+def normalize_sql(sql: str) -> str:
+    return _SPACES.sub(" ", sql).strip()
+
+
+def calling_service(outermost: bool = False) -> str:
+    """Nom `module.fonction` du service appelant (le plus interne par défaut)."""
+    found = "hors-services"
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(SERVICES_PACKAGE):
+            found = f"{module[len(SERVICES_PACKAGE):]}.{frame.f_code.co_name}"
+            if not outermost:
+                break
+        frame = frame.f_back
+    return found
+
+
+class QueryRecorder:
+    def __init__(self, slow_ms: float = 50.0, window: int = 1000):
+        self.slow_ms = slow_ms
+        self.window = window
+        self._lock = threading.Lock()
+        self.statements: dict[str, Histogram] = defaultdict(self._histogram)
+        self.statement_rows: dict[str, int] = defaultdict(int)
+        self.services: dict[str, Histogram] = defaultdict(self._histogram)
+        self.transactions: dict[str, Histogram] = defaultdict(self._histogram)
+        self.connections = Histogram(window)
+        self.slow_queries: deque[dict] = deque(maxlen=200)
+
+    def _histogram(self) -> Histogram:
+        return Histogram(self.window)
+
+    def record_statement(
+        self,
+        conn: sqlite3.Connection,
+        sql: str,
+        params,
+        elapsed_ms: float,
+        rows: int,
+        service: str,
+    ) -> None:
+        key = normalize_sql(sql)
+        with self._lock:
+            self.statements[key].add(elapsed_ms)
+            self.statement_rows[key] += max(rows, 0)
+            self.services[service].add(elapsed_ms)
+        if elapsed_ms >= self.slow_ms:
+            self._log_slow(conn, key, params, elapsed_ms, rows, service)
+
+    def record_rows(self, sql: str, rows: int) -> None:
+        with self._lock:
+            self.statement_rows[normalize_sql(sql)] += rows
+
+    def record_transaction(self, service: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.transactions[service].add(elapsed_ms)
+
+    def record_connection(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.connections.add(elapsed_ms)
+
+    def _log_slow(self, conn, sql: str, params, elapsed_ms: float, rows: int, service: str) -> None:
+        try:
+            plan_rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+            plan = [row[3] for row in plan_rows]
+        except sqlite3.Error:
+            plan = []
+        entry = {
+            "service": service,
+            "sql": sql,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rows": rows,
+            "plan": plan,
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        logger.warning("Requête lente (%.1f ms, %s): %s | plan: %s", elapsed_ms, service, sql, " ; ".join(plan))
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "slow_ms": self.slow_ms,
+                "connections": self.connections.summary(),
+                "transactions": {name: h.summary() for name, h in sorted(self.transactions.items())},
+                "services": {name: h.summary() for name, h in sorted(self.services.items())},
+                "statements": [
+                    {"sql": sql, "rows": self.statement_rows[sql], **h.summary()}
+                    for sql, h in sorted(self.statements.items(), key=lambda kv: kv[1].total_ms, reverse=True)
+                ],
+                "slow_queries": list(self.slow_queries),
+            }
+
+    def dump(self, path: str) -> str:
+        out = Path(path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(self.summary(), indent=2, ensure_ascii=False), encoding="utf-8")
+        return str(out)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Curseur qui chronomètre execute/executemany et compte les lignes lues."""
+
+    recorder: QueryRecorder | None = None
+
+    def execute(self, sql, parameters=(), /):
+        start = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._record(sql, parameters, start)
+        return result
+
+    def executemany(self, sql, seq_of_parameters, /):
+        rows = list(seq_of_parameters)
+        start = time.perf_counter()
+        result = super().executemany(sql, rows)
+        self._record(sql, rows[0] if rows else (), start)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def _record(self, sql: str, params, start: float) -> None:
+        recorder = InstrumentedCursor.recorder
+        self._last_sql = sql
+        if recorder is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        recorder.record_statement(self.connection, sql, params, elapsed_ms, self.rowcount, calling_service())
+
+    def _count_rows(self, rows: int) -> None:
+        recorder = InstrumentedCursor.recorder
+        sql = getattr(self, "_last_sql", None)
+        if recorder is not None and sql is not None and rows:
+            recorder.record_rows(sql, rows)
@@ -0,0 +1,477 @@
+"""Migrations de schéma versionnées.
+
+Chaque migration porte un numéro strictement croissant et une liste d'étapes
+(requête SQL ou fonction recevant le curseur). `migrate()` applique dans
+l'ordre les migrations absentes de `schema_version`; il est donc sans effet
+sur une base déjà à jour.
+"""
+import sqlite3
+from typing import Callable, NamedTuple
+
+from pharmacy_pos.trigrams import rebuild_vocabulary
+
+Step = str | Callable[[sqlite3.Cursor], None]
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: tuple[Step, ...]
+
+
+def _create_products_fts(cur: sqlite3.Cursor) -> None:
+    """Index plein texte du catalogue; ignoré si SQLite est compilé sans FTS5."""
+    try:
+        cur.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, barcode,
+                content='products', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        return
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_ai AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts(rowid, name, barcode) VALUES(NEW.id, NEW.name, NEW.barcode);
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_ad AFTER DELETE ON products
+        BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, barcode)
+            VALUES('delete', OLD.id, OLD.name, OLD.barcode);
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_au AFTER UPDATE OF name, barcode ON products
+        BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, barcode)
+            VALUES('delete', OLD.id, OLD.name, OLD.barcode);
+            INSERT INTO products_fts(rowid, name, barcode) VALUES(NEW.id, NEW.name, NEW.barcode);
+        END
+        """
+    )
+    cur.execute("INSERT INTO products_fts(products_fts) VALUES('rebuild')")
+
+
+def _keep_movement_ids_increasing(cur: sqlite3.Cursor) -> None:
+    # Les IDs archivés ne doivent pas être réattribués par la table reconstruite.
+    cur.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM stock_movements), 0),
+            COALESCE((SELECT MAX(id) FROM stock_movements_archive), 0)
+        ) AS last_id
+        """
+    )
+    last_id = cur.fetchone()["last_id"]
+    cur.execute("DELETE FROM sqlite_sequence WHERE name = 'stock_movements'")
+    cur.execute("INSERT INTO sqlite_sequence(name, seq) VALUES('stock_movements', ?)", (last_id,))
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        1,
+        "Index stock: lots FIFO par produit, mouvements par produit",
+        (
+            # reserve_stock_fifo: filtre produit + tri péremption, sans lecture de la table
+            "CREATE INDEX IF NOT EXISTS idx_batches_fifo ON batches(product_id, expiry_date, id, quantity)",
+            # delete_product: comptage des mouvements
+            "CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements(product_id)",
+        ),
+    ),
+    Migration(
+        2,
+        "Index ventes: lignes par ticket/produit, tickets par date/caissier, retours par ligne",
+        (
+            # get_sale_items et top_products (index couvrant)
+            "CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items("
+            "sale_id, product_id, batch_id, quantity, unit_price, line_total)",
+            # delete_product: comptage des ventes
+            "CREATE INDEX IF NOT EXISTS idx_sale_items_product ON sale_items(product_id)",
+            # rapports par période
+            "CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales(created_at)",
+            # delete_user: comptage des ventes
+            "CREATE INDEX IF NOT EXISTS idx_sales_cashier ON sales(cashier_id)",
+            # return_sale_item: quantité déjà retournée
+            "CREATE INDEX IF NOT EXISTS idx_returns_sale_item ON returns(sale_item_id, quantity)",
+        ),
+    ),
+    Migration(
+        3,
+        "Compteurs de stock dénormalisés sur products (total et non expiré)",
+        (
+            "ALTER TABLE products ADD COLUMN stock_total INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE products ADD COLUMN stock_valid INTEGER NOT NULL DEFAULT 0",
+            """
+            CREATE TABLE IF NOT EXISTS app_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_batches_stock_ai AFTER INSERT ON batches
+            BEGIN
+                UPDATE products
+                SET stock_total = stock_total + NEW.quantity,
+                    stock_valid = stock_valid
+                        + CASE WHEN DATE(NEW.expiry_date) >= DATE('now') THEN NEW.quantity ELSE 0 END
+                WHERE id = NEW.product_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_batches_stock_au
+            AFTER UPDATE OF product_id, quantity, expiry_date ON batches
+            BEGIN
+                UPDATE products
+                SET stock_total = stock_total - OLD.quantity,
+                    stock_valid = stock_valid
+                        - CASE WHEN DATE(OLD.expiry_date) >= DATE('now') THEN OLD.quantity ELSE 0 END
+                WHERE id = OLD.product_id;
+                UPDATE products
+                SET stock_total = stock_total + NEW.quantity,
+                    stock_valid = stock_valid
+                        + CASE WHEN DATE(NEW.expiry_date) >= DATE('now') THEN NEW.quantity ELSE 0 END
+                WHERE id = NEW.product_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_batches_stock_ad AFTER DELETE ON batches
+            BEGIN
+                UPDATE products
+                SET stock_total = stock_total - OLD.quantity,
+                    stock_valid = stock_valid
+                        - CASE WHEN DATE(OLD.expiry_date) >= DATE('now') THEN OLD.quantity ELSE 0 END
+                WHERE id = OLD.product_id;
+            END
+            """,
+            """
+            UPDATE products
+            SET stock_total = COALESCE((SELECT SUM(quantity) FROM batches b WHERE b.product_id = products.id), 0),
+                stock_valid = COALESCE((
+                    SELECT SUM(quantity) FROM batches b
+                    WHERE b.product_id = products.id AND DATE(b.expiry_date) >= DATE('now')
+                ), 0)
+            """,
+            "INSERT OR REPLACE INTO app_meta(key, value) VALUES('stock_valid_as_of', DATE('now'))",
+            # Grille catalogue triée par nom; alertes de stock bas (index partiel)
+            "CREATE INDEX IF NOT EXISTS idx_products_name ON products(name, id)",
+            "CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products(stock_total) WHERE stock_total <= min_stock",
+        ),
+    ),
+    Migration(
+        4,
+        "Recherche plein texte produits (FTS5, sans accents) synchronisée par triggers",
+        (_create_products_fts,),
+    ),
+    Migration(
+        5,
+        "Version du catalogue (invalidation des index mémoire entre postes)",
+        (
+            "INSERT OR IGNORE INTO app_meta(key, value) VALUES('catalog_version', 0)",
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_catalog_ai AFTER INSERT ON products
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version';
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_catalog_ad AFTER DELETE ON products
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version';
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_catalog_au
+            AFTER UPDATE OF name, barcode, sell_price, tva, requires_prescription ON products
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version';
+            END
+            """,
+        ),
+    ),
+    Migration(
+        6,
+        "Vocabulaire et trigrammes des noms de produits (recherche approchée)",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS search_vocabulary (
+                word TEXT PRIMARY KEY,
+                products INTEGER NOT NULL
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS vocabulary_trigrams (
+                trigram TEXT NOT NULL,
+                word TEXT NOT NULL,
+                PRIMARY KEY (trigram, word)
+            ) WITHOUT ROWID
+            """,
+            rebuild_vocabulary,
+        ),
+    ),
+    Migration(
+        7,
+        "Index de pagination du catalogue par catégorie",
+        ("CREATE INDEX IF NOT EXISTS idx_products_category_name ON products(category_id, name, id)",),
+    ),
+    Migration(
+        8,
+        "Version des lots par produit (cache d'allocation FEFO)",
+        (
+            "ALTER TABLE products ADD COLUMN stock_version INTEGER NOT NULL DEFAULT 0",
+            "DROP TRIGGER IF EXISTS trg_batches_stock_ai",
+            "DROP TRIGGER IF EXISTS trg_batches_stock_au",
+            "DROP TRIGGER IF EXISTS trg_batches_stock_ad",
+            """
+            CREATE TRIGGER trg_batches_stock_ai AFTER INSERT ON batches
+            BEGIN
+                UPDATE products
+                SET stock_total = stock_total + NEW.quantity,
+                    stock_valid = stock_valid
+                        + CASE WHEN DATE(NEW.expiry_date) >= DATE('now') THEN NEW.quantity ELSE 0 END,
+                    stock_version = stock_version + 1
+                WHERE id = NEW.product_id;
+            END
+            """,
+            """
+            CREATE TRIGGER trg_batches_stock_au
+            AFTER UPDATE OF product_id, quantity, expiry_date ON batches
+            BEGIN
+                UPDATE products
+                SET stock_total = stock_total - OLD.quantity,
+                    stock_valid = stock_valid
+                        - CASE WHEN DATE(OLD.expiry_date) >= DATE('now') THEN OLD.quantity ELSE 0 END,
+                    stock_version = stock_version + 1
+                WHERE id = OLD.product_id;
+                UPDATE products
+                SET stock_total = stock_total + NEW.quantity,
+                    stock_valid = stock_valid
+                        + CASE WHEN DATE(NEW.expiry_date) >= DATE('now') THEN NEW.quantity ELSE 0 END,
+                    stock_version = stock_version + 1
+                WHERE id = NEW.product_id;
+            END
+            """,
+            """
+            CREATE TRIGGER trg_batches_stock_ad AFTER DELETE ON batches
+            BEGIN
+                UPDATE products
+                SET stock_total = stock_total - OLD.quantity,
+                    stock_valid = stock_valid
+                        - CASE WHEN DATE(OLD.expiry_date) >= DATE('now') THEN OLD.quantity ELSE 0 END,
+                    stock_version = stock_version + 1
+                WHERE id = OLD.product_id;
+            END
+            """,
+        ),
+    ),
+    Migration(
+        9,
+        "Dates de péremption ISO et index par date (requêtes par plage)",
+        (
+            # Horodatages et formats de saisie historiques -> AAAA-MM-JJ.
+            """
+            UPDATE batches SET expiry_date = DATE(expiry_date)
+            WHERE DATE(expiry_date) IS NOT NULL AND expiry_date != DATE(expiry_date)
+            """,
+            """
+            UPDATE batches
+            SET expiry_date = substr(expiry_date, 7, 4) || '-' || substr(expiry_date, 4, 2) || '-' || substr(expiry_date, 1, 2)
+            WHERE expiry_date GLOB '[0-3][0-9][/-][0-1][0-9][/-][0-9][0-9][0-9][0-9]'
+            """,
+            """
+            UPDATE batches SET expiry_date = replace(expiry_date, '/', '-')
+            WHERE expiry_date GLOB '[0-9][0-9][0-9][0-9]/[0-1][0-9]/[0-3][0-9]'
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_batches_expiry ON batches(expiry_date, quantity)",
+        ),
+    ),
+    Migration(
+        10,
+        "Alertes stock bas / péremption (moteur événementiel)",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL CHECK (kind IN ('low_stock', 'expiry')),
+                state TEXT NOT NULL DEFAULT 'raised' CHECK (state IN ('raised', 'acknowledged', 'cleared')),
+                product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+                batch_id INTEGER REFERENCES batches(id) ON DELETE CASCADE,
+                value INTEGER NOT NULL,
+                threshold INTEGER,
+                raised_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                acknowledged_at TEXT,
+                cleared_at TEXT
+            )
+            """,
+            # Une seule alerte ouverte par (type, produit, lot).
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_open
+            ON alerts(kind, product_id, COALESCE(batch_id, 0)) WHERE state != 'cleared'
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_alerts_open_product ON alerts(product_id) WHERE state != 'cleared'",
+            "CREATE INDEX IF NOT EXISTS idx_alerts_state ON alerts(state) WHERE state != 'cleared'",
+        ),
+    ),
+    Migration(
+        11,
+        "Instantanés de stock et archive du registre des mouvements",
+        (
+            # Stock d'un produit au début de `taken_at` (mouvements created_at < taken_at).
+            """
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                product_id INTEGER NOT NULL,
+                taken_at TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                movements INTEGER NOT NULL,
+                PRIMARY KEY (product_id, taken_at)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS stock_movements_archive (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                reason TEXT,
+                created_at TEXT
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_stock_movements_archive_product ON stock_movements_archive(product_id, created_at)",
+            # stock_at: fin du registre d'un produit; compactage: plage par date.
+            "DROP INDEX IF EXISTS idx_stock_movements_product",
+            "CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements(product_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_stock_movements_created_at ON stock_movements(created_at)",
+        ),
+    ),
+    Migration(
+        12,
+        "Mouvements de stock: lot concerné et ajustements signés",
+        (
+            """
+            CREATE TABLE stock_movements_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                batch_id INTEGER,
+                type TEXT NOT NULL CHECK(type in ('IN', 'OUT', 'ADJUST')),
+                quantity INTEGER NOT NULL CHECK (quantity > 0 OR (type = 'ADJUST' AND quantity != 0)),
+                reason TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(product_id) REFERENCES products(id)
+            )
+            """,
+            """
+            INSERT INTO stock_movements_new(id, product_id, type, quantity, reason, created_at)
+            SELECT id, product_id, type, quantity, reason, created_at FROM stock_movements
+            """,
+            "DROP TABLE stock_movements",
+            "ALTER TABLE stock_movements_new RENAME TO stock_movements",
+            "ALTER TABLE stock_movements_archive ADD COLUMN batch_id INTEGER",
+            _keep_movement_ids_increasing,
+            # Couvrant: agrégat du registre par produit (réconciliation) et stock_at.
+            "CREATE INDEX idx_stock_movements_product ON stock_movements(product_id, created_at, type, quantity)",
+            "CREATE INDEX idx_stock_movements_created_at ON stock_movements(created_at)",
+        ),
+    ),
+    Migration(
+        13,
+        "Inventaires physiques (sessions et lignes comptées)",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS stocktakes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER REFERENCES users(id),
+                category_id INTEGER REFERENCES categories(id),
+                status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'committed', 'canceled')),
+                started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                closed_at TEXT,
+                counted_lines INTEGER NOT NULL DEFAULT 0,
+                adjusted_lines INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS stocktake_lines (
+                stocktake_id INTEGER NOT NULL REFERENCES stocktakes(id) ON DELETE CASCADE,
+                batch_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                expected INTEGER NOT NULL,
+                counted INTEGER NOT NULL,
+                PRIMARY KEY (stocktake_id, batch_id)
+            ) WITHOUT ROWID
+            """,
+        ),
+    ),
+    Migration(
+        14,
+        "Ventes hors ligne rejouées depuis le journal local",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS offline_sales (
+                idempotency_key TEXT PRIMARY KEY,
+                status TEXT NOT NULL CHECK (status IN ('applied', 'conflict')),
+                sale_id INTEGER REFERENCES sales(id) ON DELETE SET NULL,
+                cashier_id INTEGER,
+                journaled_at TEXT NOT NULL,
+                replayed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                detail TEXT,
+                payload TEXT
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_offline_sales_status ON offline_sales(status, journaled_at)",
+        ),
+    ),
+    Migration(
+        15,
+        "Clé d'idempotence des ventes (nouvelle soumission d'un même panier)",
+        (
+            "ALTER TABLE sales ADD COLUMN idempotency_key TEXT",
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_idempotency_key
+            ON sales(idempotency_key) WHERE idempotency_key IS NOT NULL
+            """,
+        ),
+    ),
+]
+
+
+def current_version(cur: sqlite3.Cursor) -> int:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM schema_version")
+    return cur.fetchone()["v"]
+
+
+def migrate(cur: sqlite3.Cursor) -> int:
+    """Applique les migrations en attente. Retourne le nombre appliqué."""
+    version = current_version(cur)
+    applied = 0
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        for step in migration.steps:
+            if callable(step):
+                step(cur)
+            else:
+                cur.execute(step)
+        cur.execute(
+            "INSERT INTO schema_version(version, description) VALUES(?, ?)",
+            (migration.version, migration.description),
+        )
+        applied += 1
+    return applied
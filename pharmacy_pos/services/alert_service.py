@@ -0,0 +1,206 @@
+"""Moteur d'alertes stock bas / péremption.
+
+Les alertes sont tenues à jour par événement: chaque transaction qui
+modifie des lots réévalue uniquement ses produits (`evaluate_alerts`), et
+un balayage quotidien (`run_expiry_sweep`) prend en compte les lots qui
+entrent dans l'horizon de péremption avec le passage des jours. Il est
+lancé au démarrage puis, au plus une fois par jour (UTC), à la première
+lecture des alertes du jour.
+
+Cycle de vie d'une alerte: raised -> (acknowledged) -> cleared. Une alerte
+levée de nouveau après avoir été close crée une nouvelle ligne.
+"""
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+
+from pharmacy_pos.database import db_cursor, transaction
+
+# Un lot en stock expirant dans ce délai (ou déjà expiré) lève une alerte.
+ALERT_EXPIRY_DAYS = 90
+
+_SWEEP_KEY = "alerts_expiry_horizon"
+
+_swept_on: date | None = None
+
+
+def _today() -> date:
+    # Même référence que DATE('now') côté SQLite (UTC).
+    return datetime.now(timezone.utc).date()
+
+
+def _horizon(today: date | None = None) -> str:
+    return ((today or _today()) + timedelta(days=ALERT_EXPIRY_DAYS)).isoformat()
+
+
+def evaluate_alerts(
+    cur: sqlite3.Cursor,
+    product_ids: list[int],
+    batch_expiries: dict[int, str | None] | None = None,
+) -> None:
+    """Réévalue les alertes des produits donnés, dans la transaction en cours.
+
+    `batch_expiries` ({batch_id: péremption ou None si inconnue}) limite
+    l'évaluation des péremptions aux lots touchés: les lots hors horizon
+    ne sont pas relus.
+    """
+    if not product_ids:
+        return
+    horizon = _horizon()
+    if batch_expiries is None:
+        near_batches = None
+    else:
+        near_batches = [bid for bid, expiry in batch_expiries.items() if expiry is None or expiry <= horizon]
+    placeholders = ",".join("?" * len(product_ids))
+    params = tuple(product_ids)
+
+    # État attendu: {(kind, product_id, batch_id): (valeur, seuil)}.
+    expected: dict[tuple[str, int, int | None], tuple[int, int | None]] = {}
+    cur.execute(
+        f"SELECT id, stock_total, min_stock FROM products WHERE id IN ({placeholders}) AND stock_total <= min_stock",
+        params,
+    )
+    for row in cur.fetchall():
+        expected[("low_stock", row["id"], None)] = (row["stock_total"], row["min_stock"])
+    batch_rows = []
+    if near_batches is None:
+        cur.execute(
+            f"""
+            SELECT product_id, id, quantity
+            FROM batches
+            WHERE product_id IN ({placeholders})
+              AND expiry_date <= ?
+              AND quantity > 0
+            """,
+            (*params, horizon),
+        )
+        batch_rows = cur.fetchall()
+    elif near_batches:
+        cur.execute(
+            f"""
+            SELECT product_id, id, quantity
+            FROM batches
+            WHERE id IN ({','.join('?' * len(near_batches))})
+              AND expiry_date <= ?
+              AND quantity > 0
+            """,
+            (*near_batches, horizon),
+        )
+        batch_rows = cur.fetchall()
+    for row in batch_rows:
+        expected[("expiry", row["product_id"], row["id"])] = (row["quantity"], None)
+
+    cur.execute(
+        f"""
+        SELECT id, kind, product_id, batch_id, value
+        FROM alerts
+        WHERE product_id IN ({placeholders}) AND state != 'cleared'
+        """,
+        params,
+    )
+    active = {
+        (row["kind"], row["product_id"], row["batch_id"]): row
+        for row in cur.fetchall()
+        if row["kind"] == "low_stock" or near_batches is None or row["batch_id"] in near_batches
+    }
+
+    cur.executemany(
+        "UPDATE alerts SET state = 'cleared', cleared_at = CURRENT_TIMESTAMP WHERE id = ?",
+        [(row["id"],) for key, row in active.items() if key not in expected],
+    )
+    cur.executemany(
+        "UPDATE alerts SET value = ? WHERE id = ?",
+        [(expected[key][0], row["id"]) for key, row in active.items() if key in expected and row["value"] != expected[key][0]],
+    )
+    cur.executemany(
+        "INSERT INTO alerts(kind, product_id, batch_id, value, threshold) VALUES(?, ?, ?, ?, ?)",
+        [(*key, value, threshold) for key, (value, threshold) in expected.items() if key not in active],
+    )
+
+
+def run_expiry_sweep(cur: sqlite3.Cursor | None = None) -> int:
+    """Balayage quotidien: lots entrés dans l'horizon depuis le dernier passage.
+
+    Au premier passage, tous les produits concernés sont évalués. Retourne
+    le nombre de produits réévalués.
+    """
+    global _swept_on
+    swept_on = _today()
+    with transaction(cur) as cur:
+        horizon = _horizon(swept_on)
+        cur.execute("SELECT value FROM app_meta WHERE key = ?", (_SWEEP_KEY,))
+        row = cur.fetchone()
+        last = row["value"] if row is not None else None
+        if last is not None and last >= horizon:
+            _swept_on = swept_on
+            return 0
+
+        if last is None:
+            cur.execute(
+                """
+                SELECT id FROM products WHERE stock_total <= min_stock
+                UNION
+                SELECT product_id FROM batches WHERE expiry_date <= ? AND quantity > 0
+                UNION
+                SELECT product_id FROM alerts WHERE state != 'cleared'
+                """,
+                (horizon,),
+            )
+        else:
+            # Plage (last, horizon] de idx_batches_expiry.
+            cur.execute(
+                "SELECT DISTINCT product_id FROM batches WHERE expiry_date > ? AND expiry_date <= ? AND quantity > 0",
+                (last, horizon),
+            )
+        product_ids = [r[0] for r in cur.fetchall()]
+        for start in range(0, len(product_ids), 500):
+            evaluate_alerts(cur, product_ids[start:start + 500])
+        cur.execute("INSERT OR REPLACE INTO app_meta(key, value) VALUES(?, ?)", (_SWEEP_KEY, horizon))
+    _swept_on = swept_on
+    return len(product_ids)
+
+
+def ensure_expiry_sweep_current() -> None:
+    if _swept_on != _today():
+        run_expiry_sweep()
+
+
+def list_active_alerts(kind: str | None = None) -> list[dict]:
+    """Alertes ouvertes (levées ou acquittées), les plus récentes d'abord."""
+    ensure_expiry_sweep_current()
+    kind_filter = "AND a.kind = ?" if kind else ""
+    with db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT a.id, a.kind, a.state, a.product_id, p.name AS product_name,
+                   a.batch_id, b.batch_number, b.expiry_date,
+                   a.value, a.threshold, a.raised_at, a.acknowledged_at
+            FROM alerts a
+            JOIN products p ON p.id = a.product_id
+            LEFT JOIN batches b ON b.id = a.batch_id
+            WHERE a.state != 'cleared' {kind_filter}
+            ORDER BY a.id DESC
+            """,
+            (kind,) if kind else (),
+        )
+        rows = cur.fetchall()
+    return [dict(row) for row in rows]
+
+
+def count_unacknowledged_alerts() -> int:
+    ensure_expiry_sweep_current()
+    with db_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM alerts WHERE state = 'raised'")
+        return cur.fetchone()["n"]
+
+
+def acknowledge_alert(alert_id: int) -> None:
+    with transaction() as cur:
+        cur.execute(
+            """
+            UPDATE alerts SET state = 'acknowledged', acknowledged_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND state = 'raised'
+            """,
+            (alert_id,),
+        )
+        if cur.rowcount == 0:
+            raise ValueError("Alerte introuvable ou déjà traitée")
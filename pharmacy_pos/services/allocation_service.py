@@ -0,0 +1,244 @@
+"""Moteur d'allocation FEFO en mémoire.
+
+Pour chaque produit, les lots vendables sont gardés triés par (péremption,
+id) avec leur quantité restante: un plan d'allocation se construit en
+parcourant seulement les premiers lots, sans requête ni tri.
+
+Cohérence: `products.stock_version` est incrémentée par trigger à chaque
+modification d'un lot. Une écriture lit la version de ses produits en début
+de transaction (dans le verrou d'écriture): si elle correspond au cache, le
+cache fait foi; sinon les lots du produit sont relus. Après validation, le
+cache reçoit les variations de la transaction et la version finale.
+"""
+import bisect
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from pharmacy_pos.database import after_commit, db_cursor, pool_generation
+from pharmacy_pos.services.alert_service import evaluate_alerts
+
+
+def _today() -> str:
+    # Même référence que DATE('now') côté SQLite (UTC).
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class ProductLots:
+    """Lots vendables d'un produit: [péremption, batch_id, quantité] triés."""
+
+    __slots__ = ("version", "lots", "by_batch")
+
+    def __init__(self, version: int, lots: list[list]) -> None:
+        self.version = version
+        self.lots = lots
+        self.by_batch = {lot[1]: lot for lot in lots}
+
+    def drop_expired(self, today: str) -> None:
+        # Les lots expirés sont en tête de liste.
+        while self.lots and self.lots[0][0] < today:
+            del self.by_batch[self.lots.pop(0)[1]]
+
+    def apply(self, batch_id: int, delta: int, expiry: str | None, today: str) -> bool:
+        """Applique une variation de quantité. False si le lot est inconnu
+        et que sa péremption n'est pas fournie (le cache doit être relu)."""
+        lot = self.by_batch.get(batch_id)
+        if lot is None:
+            if expiry is None:
+                return False
+            if expiry < today or delta <= 0:
+                return True
+            lot = [expiry, batch_id, delta]
+            bisect.insort(self.lots, lot)
+            self.by_batch[batch_id] = lot
+            return True
+        lot[2] += delta
+        if lot[2] <= 0:
+            index = bisect.bisect_left(self.lots, lot[:2])
+            while self.lots[index] is not lot:
+                index += 1
+            del self.lots[index]
+            del self.by_batch[batch_id]
+        return True
+
+
+class FefoCache:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.entries: dict[int, ProductLots] = {}
+        self.generation = -1
+
+    def check_generation(self) -> None:
+        # Base recréée (init_db): le cache repart de zéro.
+        if self.generation != pool_generation():
+            self.entries.clear()
+            self.generation = pool_generation()
+
+
+_cache = FefoCache()
+
+
+def read_stock_versions(cur: sqlite3.Cursor, product_ids: list[int]) -> dict[int, int]:
+    if not product_ids:
+        return {}
+    cur.execute(
+        f"SELECT id, stock_version FROM products WHERE id IN ({','.join('?' * len(product_ids))})",
+        tuple(product_ids),
+    )
+    return {row["id"]: row["stock_version"] for row in cur.fetchall()}
+
+
+def _load_lots(cur: sqlite3.Cursor, product_ids: list[int]) -> dict[int, list[list]]:
+    lots: dict[int, list[list]] = {pid: [] for pid in product_ids}
+    if not product_ids:
+        return lots
+    cur.execute(
+        f"""
+        SELECT product_id, id, expiry_date, quantity
+        FROM batches
+        WHERE product_id IN ({','.join('?' * len(product_ids))})
+          AND quantity > 0
+          AND expiry_date >= DATE('now')
+        ORDER BY product_id ASC, expiry_date ASC, id ASC
+        """,
+        tuple(product_ids),
+    )
+    for row in cur.fetchall():
+        lots[row["product_id"]].append([row["expiry_date"], row["id"], row["quantity"]])
+    return lots
+
+
+class LotChanges:
+    """Suivi des lots touchés par une transaction d'écriture.
+
+    À créer dans la transaction, avant toute modification des lots. Avec
+    `for_allocation=True`, les lots des produits absents du cache (ou
+    périmés) sont relus pour permettre `allocate()`.
+    """
+
+    def __init__(self, cur: sqlite3.Cursor, product_ids: list[int], for_allocation: bool = False) -> None:
+        self.today = _today()
+        self.start_versions = read_stock_versions(cur, product_ids)
+        self.base: dict[int, ProductLots] = {}
+        self.cached: set[int] = set()
+        self.deltas: list[tuple[int, int, int, str | None]] = []
+        self.consumed: dict[int, int] = {}
+
+        missing = []
+        with _cache.lock:
+            _cache.check_generation()
+            for pid, version in self.start_versions.items():
+                entry = _cache.entries.get(pid)
+                if entry is not None and entry.version == version:
+                    entry.drop_expired(self.today)
+                    self.base[pid] = entry
+                    self.cached.add(pid)
+                else:
+                    missing.append(pid)
+        if for_allocation and missing:
+            for pid, lots in _load_lots(cur, missing).items():
+                self.base[pid] = ProductLots(self.start_versions[pid], lots)
+
+    def allocate(self, product_id: int, quantity: int) -> list[tuple[int, int]]:
+        """Plan FEFO pour `quantity` unités, compte tenu des allocations déjà
+        faites dans cette transaction. Ne modifie pas le cache."""
+        entry = self.base.get(product_id)
+        remaining = quantity
+        allocations: list[tuple[int, int]] = []
+        for expiry, batch_id, available in entry.lots if entry is not None else ():
+            if remaining <= 0:
+                break
+            free = available - self.consumed.get(batch_id, 0)
+            take = min(free, remaining)
+            if take > 0:
+                allocations.append((batch_id, take))
+                self.consumed[batch_id] = self.consumed.get(batch_id, 0) + take
+                self.deltas.append((product_id, batch_id, -take, expiry))
+                remaining -= take
+
+        if remaining > 0:
+            raise ValueError("Stock insuffisant (lots valides non expirés)")
+        return allocations
+
+    def add(self, product_id: int, batch_id: int, delta: int, expiry: str | None = None) -> None:
+        """Variation de quantité d'un lot (retour, annulation, réception)."""
+        self.deltas.append((product_id, batch_id, delta, expiry))
+
+    def commit(self, cur: sqlite3.Cursor) -> None:
+        """À appeler après les écritures: le cache sera mis à jour si la
+        transaction est validée. Les alertes des produits touchés sont
+        réévaluées dans la même transaction."""
+        end_versions = read_stock_versions(cur, list(self.start_versions))
+        touched: dict[int, str | None] = {}
+        for _pid, batch_id, _delta, expiry in self.deltas:
+            touched[batch_id] = expiry or touched.get(batch_id)
+        evaluate_alerts(cur, list(self.start_versions), touched)
+        after_commit(lambda: self._apply(end_versions))
+
+    def _apply(self, end_versions: dict[int, int]) -> None:
+        by_product: dict[int, list[tuple[int, int, str | None]]] = {}
+        for pid, batch_id, delta, expiry in self.deltas:
+            by_product.setdefault(pid, []).append((batch_id, delta, expiry))
+
+        with _cache.lock:
+            if _cache.generation != pool_generation():
+                return
+            for pid, start in self.start_versions.items():
+                end = end_versions.get(pid)
+                current = _cache.entries.get(pid)
+                entry = self.base.get(pid)
+                if entry is None or end is None:
+                    # Produit non suivi: une version plus ancienne ne sert plus.
+                    if current is not None and (end is None or current.version < end):
+                        del _cache.entries[pid]
+                    continue
+                if pid in self.cached:
+                    if current is not entry or entry.version != start:
+                        continue  # déjà remplacé par une transaction plus récente
+                elif current is not None and current.version >= end:
+                    continue
+                if all(entry.apply(batch_id, delta, expiry, self.today) for batch_id, delta, expiry in by_product.get(pid, ())):
+                    entry.version = end
+                    _cache.entries[pid] = entry
+                else:
+                    _cache.entries.pop(pid, None)
+
+
+def reconcile_fefo_cache() -> int:
+    """Recharge le cache depuis la base (au démarrage).
+
+    Retourne le nombre de produits dont les lots en cache différaient.
+    """
+    with db_cursor() as cur:
+        cur.execute("SELECT id, stock_version FROM products WHERE stock_valid > 0")
+        versions = {row["id"]: row["stock_version"] for row in cur.fetchall()}
+        cur.execute(
+            """
+            SELECT b.product_id, b.id, b.expiry_date, b.quantity
+            FROM batches b
+            JOIN products p ON p.id = b.product_id
+            WHERE p.stock_valid > 0
+              AND b.quantity > 0
+              AND b.expiry_date >= DATE('now')
+            ORDER BY b.product_id ASC, b.expiry_date ASC, b.id ASC
+            """
+        )
+        lots: dict[int, list[list]] = {pid: [] for pid in versions}
+        for row in cur.fetchall():
+            lots[row["product_id"]].append([row["expiry_date"], row["id"], row["quantity"]])
+
+    today = _today()
+    drift = 0
+    with _cache.lock:
+        _cache.check_generation()
+        for pid, entry in _cache.entries.items():
+            entry.drop_expired(today)
+            if entry.lots != lots.get(pid, []):
+                drift += 1
+        _cache.entries = {pid: ProductLots(versions[pid], product_lots) for pid, product_lots in lots.items()}
+    return drift
+
+
+def clear_fefo_cache() -> None:
+    with _cache.lock:
+        _cache.entries.clear()
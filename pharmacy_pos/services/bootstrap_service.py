@@ -1,6 +1,16 @@
+import logging
+
+from pharmacy_pos.config import WRITER_ENABLED
 from pharmacy_pos.database import init_db
+from pharmacy_pos.services.alert_service import run_expiry_sweep
+from pharmacy_pos.services.allocation_service import reconcile_fefo_cache
 from pharmacy_pos.services.auth_service import ensure_default_admin
 from pharmacy_pos.services.demo_seed_service import seed_demo_products
+from pharmacy_pos.services.journal_service import replay_journal
+from pharmacy_pos.services.stock_service import roll_expired_stock
+from pharmacy_pos.writer import start_writer
+
+logger = logging.getLogger(__name__)
 
 
 def bootstrap() -> None:
@@ -8,3 +18,14 @@ def bootstrap() -> None:
     init_db()
     ensure_default_admin()
     seed_demo_products()
+    roll_expired_stock()
+    reconcile_fefo_cache()
+    run_expiry_sweep()
+    # Ventes restées au journal hors ligne (arrêt pendant une coupure). Un
+    # rejeu en échec n'empêche pas le démarrage: le journal reste sur disque.
+    try:
+        replay_journal()
+    except Exception:
+        logger.exception("Rejeu du journal hors ligne impossible au démarrage")
+    if WRITER_ENABLED:
+        start_writer()
@@ -0,0 +1,141 @@
+"""Index mémoire du catalogue pour la caisse.
+
+Chargé une fois par processus, il résout un scan (code-barres) ou un ID
+produit sans requête SQL. Les écritures faites par ce processus le mettent
+à jour après validation; celles des autres postes sont détectées via
+`app_meta.catalog_version` (incrémentée par trigger), vérifiée au plus
+toutes les CATALOG_RECHECK_SECONDS secondes.
+"""
+import sqlite3
+import threading
+import time
+
+from pharmacy_pos.database import after_commit, db_cursor, pool_generation
+
+CATALOG_RECHECK_SECONDS = 5.0
+
+_PRODUCT_COLUMNS = "id, name, barcode, sell_price, tva, requires_prescription"
+
+
+class CatalogIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.by_id: dict[int, dict] = {}
+        self.by_barcode: dict[str, dict] = {}
+        self.version: int | None = None
+        self.generation = -1
+        self.checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None and self.generation == pool_generation()
+
+    def load(self, cur: sqlite3.Cursor) -> None:
+        version = read_catalog_version(cur)
+        cur.execute(f"SELECT {_PRODUCT_COLUMNS} FROM products")
+        by_id = {}
+        by_barcode = {}
+        for row in cur.fetchall():
+            entry = _entry(row)
+            by_id[entry["id"]] = entry
+            if entry["barcode"]:
+                by_barcode[entry["barcode"]] = entry
+        with self._lock:
+            self.by_id = by_id
+            self.by_barcode = by_barcode
+            self.version = version
+            self.generation = pool_generation()
+            self.checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version = None
+
+    def apply(self, product_id: int, row: sqlite3.Row | None, new_version: int) -> None:
+        """Applique une écriture locale (row=None pour une suppression).
+
+        Si une autre écriture s'est intercalée depuis le chargement, l'index
+        est simplement invalidé et sera rechargé à la prochaine lecture.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            if self.version + 1 != new_version:
+                self.version = None
+                return
+            old = self.by_id.pop(product_id, None)
+            if old is not None and old["barcode"]:
+                self.by_barcode.pop(old["barcode"], None)
+            if row is not None:
+                entry = _entry(row)
+                self.by_id[product_id] = entry
+                if entry["barcode"]:
+                    self.by_barcode[entry["barcode"]] = entry
+            self.version = new_version
+
+
+_index = CatalogIndex()
+
+
+def _entry(row: sqlite3.Row) -> dict:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "barcode": row["barcode"],
+        "sell_price": row["sell_price"],
+        "tva": row["tva"],
+        "requires_prescription": bool(row["requires_prescription"]),
+    }
+
+
+def read_catalog_version(cur: sqlite3.Cursor) -> int:
+    cur.execute("SELECT value FROM app_meta WHERE key = 'catalog_version'")
+    row = cur.fetchone()
+    return 0 if row is None else int(row["value"])
+
+
+def _ensure_loaded() -> None:
+    if _index.loaded and time.monotonic() - _index.checked_at < CATALOG_RECHECK_SECONDS:
+        return
+    with db_cursor() as cur:
+        if _index.loaded and read_catalog_version(cur) == _index.version:
+            _index.checked_at = time.monotonic()
+            return
+        _index.load(cur)
+
+
+def lookup_by_barcode(barcode: str) -> dict | None:
+    """Produit correspondant exactement au code-barres scanné, sans requête SQL."""
+    _ensure_loaded()
+    entry = _index.by_barcode.get(barcode.strip())
+    return None if entry is None else dict(entry)
+
+
+def get_catalog_entry(product_id: int) -> dict | None:
+    _ensure_loaded()
+    entry = _index.by_id.get(product_id)
+    return None if entry is None else dict(entry)
+
+
+def catalog_entries(cur: sqlite3.Cursor, product_ids: list[int]) -> dict[int, dict] | None:
+    """Fiches produits pour une transaction en cours, depuis l'index.
+
+    Retourne None si l'index n'est pas à jour par rapport à la base vue par
+    `cur`: l'appelant lit alors les produits en SQL.
+    """
+    if not _index.loaded or read_catalog_version(cur) != _index.version:
+        _index.invalidate()
+        return None
+    return {pid: _index.by_id[pid] for pid in product_ids if pid in _index.by_id}
+
+
+def invalidate_catalog() -> None:
+    _index.invalidate()
+
+
+def note_product_change(cur: sqlite3.Cursor, product_id: int) -> None:
+    """À appeler dans la transaction qui vient de créer/modifier/supprimer un produit."""
+    version = read_catalog_version(cur)
+    cur.execute(f"SELECT {_PRODUCT_COLUMNS} FROM products WHERE id = ?", (product_id,))
+    row = cur.fetchone()
+    after_commit(lambda: _index.apply(product_id, row, version))
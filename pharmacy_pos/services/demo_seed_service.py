@@ -1,8 +1,30 @@
-from datetime import date, timedelta
+import bisect
+import random
+from datetime import date, datetime, timedelta, timezone
 
 from pharmacy_pos.database import db_cursor
+from pharmacy_pos.services.auth_service import hash_password
 from pharmacy_pos.services.product_service import create_product
 from pharmacy_pos.services.stock_service import add_stock
+from pharmacy_pos.trigrams import index_products
+
+MOLECULES = [
+    "Paracétamol", "Ibuprofène", "Amoxicilline", "Oméprazole", "Metformine", "Amlodipine",
+    "Losartan", "Azithromycine", "Cétirizine", "Loratadine", "Diclofénac", "Salbutamol",
+    "Prednisolone", "Doxycycline", "Ciprofloxacine", "Vitamine C", "Vitamine D3", "Zinc",
+    "Fer", "Magnésium", "Métronidazole", "Clotrimazole", "Dompéridone", "Lopéramide",
+    "Artéméther", "Quinine", "Ésoméprazole", "Atorvastatine", "Bisoprolol", "Furosémide",
+]
+FORMS = [
+    "comprimé 500mg", "comprimé 1g", "gélule 250mg", "sirop 125ml", "gel 50g", "crème 30g",
+    "comprimé 10mg", "comprimé 20mg", "sachet 1g", "suppositoire", "collyre 10ml", "injectable 1ml",
+]
+BRANDS = ["Générique", "Biogaran", "Sandoz", "Mylan", "Teva", "Zentiva", "Cooper", "Sanofi"]
+CATEGORIES = [
+    "Antalgiques", "Antibiotiques", "Compléments", "Hygiène", "Protection", "Cardiologie",
+    "Gastro-entérologie", "Dermatologie", "Ophtalmologie", "Pneumologie", "Antipaludéens",
+    "Diabétologie", "Allergologie", "Pédiatrie", "Orthopédie",
+]
 
 
 def _find_product_id_by_barcode(barcode: str) -> int | None:
@@ -99,3 +121,249 @@ def seed_demo_products() -> int:
                 add_stock(product_id, lot_num, expiry, qty, reason="Seed démo")
 
     return created
+
+
+def _stamp(day: date, seconds: int) -> str:
+    return f"{day.isoformat()} {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def generate_demo_dataset(
+    products: int = 1_000,
+    categories: int = 15,
+    months: int = 6,
+    sales_per_day: int = 150,
+    seed: int = 42,
+    cancel_rate: float = 0.01,
+    return_rate: float = 0.005,
+    chunk_sales: int = 50_000,
+) -> dict:
+    """Génère un catalogue et un historique d'activité synthétiques.
+
+    Mode volumétrie du seed démo: `products` produits répartis sur
+    `categories` catégories, lots avec dates de péremption, puis `months`
+    mois de ventes (allocation FEFO, réassorts, annulations, retours)
+    simulés en mémoire. Tout est écrit par executemany, en une transaction
+    par tranche de `chunk_sales` ventes. Le registre stock_movements reste
+    cohérent avec batches. Même `seed` => même jeu de données.
+    """
+    rng = random.Random(seed)
+    # UTC, comme CURRENT_TIMESTAMP: l'historique généré s'aligne sur celui de l'application.
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    start = today - timedelta(days=months * 30)
+
+    with db_cursor("bulk_import") as cur:
+        cur.execute(
+            """
+            SELECT (SELECT COALESCE(MAX(id), 0) FROM products) AS products,
+                   (SELECT COALESCE(MAX(id), 0) FROM batches) AS batches,
+                   (SELECT COALESCE(MAX(id), 0) FROM sales) AS sales,
+                   (SELECT COALESCE(MAX(id), 0) FROM sale_items) AS sale_items
+            """
+        )
+        offsets = dict(cur.fetchone())
+
+        category_names = [
+            CATEGORIES[i % len(CATEGORIES)] + ("" if i < len(CATEGORIES) else f" {i // len(CATEGORIES) + 1}")
+            for i in range(max(1, categories))
+        ]
+        cur.executemany("INSERT OR IGNORE INTO categories(name) VALUES(?)", [(n,) for n in category_names])
+        cur.execute(
+            f"SELECT id FROM categories WHERE name IN ({','.join('?' * len(category_names))})",
+            category_names,
+        )
+        category_ids = [row["id"] for row in cur.fetchall()]
+
+        cur.executemany(
+            "INSERT OR IGNORE INTO users(username, password_hash, role) VALUES(?, ?, 'caissier')",
+            [(f"caisse{i}", hash_password("caisse123")) for i in range(1, 4)],
+        )
+        cur.execute("SELECT id FROM users WHERE role IN ('caissier', 'admin')")
+        cashier_ids = [row["id"] for row in cur.fetchall()]
+
+        catalog = []  # (id, sell_price, tva)
+        product_rows = []
+        for n in range(products):
+            pid = offsets["products"] + n + 1
+            buy = rng.randint(2, 400) * 50
+            sell = round(buy * rng.uniform(1.2, 1.6) / 50) * 50
+            tva = rng.choice((0, 0, 0, 0, 18))
+            catalog.append((pid, sell, tva))
+            product_rows.append(
+                (
+                    pid,
+                    f"{rng.choice(MOLECULES)} {rng.choice(FORMS)} {rng.choice(BRANDS)}",
+                    f"GEN{seed:03d}{pid:09d}",
+                    rng.choice(category_ids),
+                    buy,
+                    sell,
+                    tva,
+                    int(rng.random() < 0.2),
+                    rng.choice((0, 5, 10, 20, 40)),
+                )
+            )
+        cur.executemany(
+            """
+            INSERT INTO products(id, name, barcode, category_id, buy_price, sell_price,
+                                 tva, requires_prescription, min_stock)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            product_rows,
+        )
+        index_products(cur, [row[1] for row in product_rows])
+
+    # Popularité type Zipf: quelques produits font l'essentiel des ventes.
+    cum_weights = []
+    acc = 0.0
+    for rank in range(products):
+        acc += 1.0 / (rank + 1) ** 0.9
+        cum_weights.append(acc)
+    expected_daily = [0.0] * products
+    for idx in range(products):
+        share = (cum_weights[idx] - (cum_weights[idx - 1] if idx else 0.0)) / acc
+        expected_daily[idx] = share * sales_per_day * 3 * 1.7
+
+    counters = {"batches": offsets["batches"], "sales": offsets["sales"], "sale_items": offsets["sale_items"]}
+    lots: list[list[list]] = [[] for _ in range(products)]  # [expiry_ordinal, batch_id, restant]
+    final_qty: dict[int, int] = {}
+    buf: dict[str, list] = {k: [] for k in ("batches", "sales", "items", "moves", "cancels", "returns")}
+    totals = {"batches": 0, "sales": 0, "sale_items": 0, "cancellations": 0, "returns": 0}
+
+    def receive(idx: int, day: date, seconds: int) -> None:
+        counters["batches"] += 1
+        batch_id = counters["batches"]
+        qty = max(5, int(expected_daily[idx] * rng.uniform(20, 60)))
+        expiry = day + timedelta(days=rng.randint(60, 900))
+        bisect.insort(lots[idx], [expiry.toordinal(), batch_id, qty])
+        final_qty[batch_id] = qty
+        pid = catalog[idx][0]
+        buf["batches"].append((batch_id, pid, f"L{pid}-{batch_id}", expiry.isoformat(), qty))
+        buf["moves"].append((pid, batch_id, "IN", qty, "Approvisionnement", _stamp(day, seconds)))
+        totals["batches"] += 1
+
+    def flush() -> None:
+        with db_cursor("bulk_import") as cur:
+            cur.executemany(
+                "INSERT INTO batches(id, product_id, batch_number, expiry_date, quantity) VALUES(?, ?, ?, ?, ?)",
+                buf["batches"],
+            )
+            cur.executemany(
+                """
+                INSERT INTO sales(id, cashier_id, total_ht, total_tva, total_ttc, payment_method, created_at)
+                VALUES(?, ?, ?, ?, ?, ?, ?)
+                """,
+                buf["sales"],
+            )
+            cur.executemany(
+                """
+                INSERT INTO sale_items(id, sale_id, product_id, batch_id, quantity, unit_price, line_total)
+                VALUES(?, ?, ?, ?, ?, ?, ?)
+                """,
+                buf["items"],
+            )
+            cur.executemany(
+                "INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason, created_at) VALUES(?, ?, ?, ?, ?, ?)",
+                buf["moves"],
+            )
+            cur.executemany(
+                "INSERT INTO sale_cancellations(sale_id, reason, created_at) VALUES(?, ?, ?)",
+                buf["cancels"],
+            )
+            cur.executemany(
+                "INSERT INTO returns(sale_item_id, quantity, reason, created_at) VALUES(?, ?, ?, ?)",
+                buf["returns"],
+            )
+        for rows in buf.values():
+            rows.clear()
+
+    for idx in range(products):
+        for _ in range(rng.randint(1, 3)):
+            receive(idx, start, 7 * 3600)
+
+    indices = range(products)
+    day = start
+    while day <= today:
+        day_ord = day.toordinal()
+        volume = sales_per_day * rng.uniform(0.6, 1.4) * (0.5 if day.weekday() == 6 else 1.0)
+        # Aujourd'hui: pas de vente après l'heure courante.
+        closing = 20 * 3600 if day < today else min(20 * 3600, now.hour * 3600 + now.minute * 60)
+        count = int(volume) if closing >= 8 * 3600 else 0
+        for seconds in sorted(rng.randint(8 * 3600, closing) for _ in range(count)):
+            stamp = _stamp(day, seconds)
+            counters["sales"] += 1
+            sale_id = counters["sales"]
+            lines = []
+            for idx in rng.choices(indices, cum_weights=cum_weights, k=rng.randint(1, 5)):
+                wanted = rng.choice((1, 1, 1, 2, 2, 3))
+                product_lots = lots[idx]
+                while product_lots and (product_lots[0][0] < day_ord or product_lots[0][2] == 0):
+                    product_lots.pop(0)  # lot expiré (reste en base) ou épuisé
+                available = sum(lot[2] for lot in product_lots)
+                if available < wanted:
+                    receive(idx, day, seconds)
+                    continue  # vente manquée, réassort reçu
+                for lot in product_lots:
+                    if wanted == 0:
+                        break
+                    take = min(lot[2], wanted)
+                    if take:
+                        lot[2] -= take
+                        wanted -= take
+                        lines.append((idx, lot, take))
+                if available - sum(take for i, _l, take in lines if i == idx) < expected_daily[idx] * 7:
+                    receive(idx, day, seconds)
+            if not lines:
+                counters["sales"] -= 1
+                continue
+
+            total_ht = total_tva = 0.0
+            canceled = rng.random() < cancel_rate
+            for idx, lot, take in lines:
+                pid, price, tva = catalog[idx]
+                counters["sale_items"] += 1
+                item_id = counters["sale_items"]
+                total_ht += price * take
+                total_tva += price * take * tva / 100.0
+                buf["items"].append((item_id, sale_id, pid, lot[1], take, price, price * take))
+                buf["moves"].append((pid, lot[1], "OUT", take, f"Vente #{sale_id}", stamp))
+                final_qty[lot[1]] -= take
+                if canceled:
+                    lot[2] += take
+                    final_qty[lot[1]] += take
+                    buf["moves"].append((pid, lot[1], "IN", take, f"Annulation vente #{sale_id}", stamp))
+                elif rng.random() < return_rate:
+                    back = rng.randint(1, take)
+                    lot[2] += back
+                    final_qty[lot[1]] += back
+                    buf["returns"].append((item_id, back, "Retour client", stamp))
+                    buf["moves"].append((pid, lot[1], "IN", back, f"Retour ligne #{item_id}", stamp))
+                    totals["returns"] += 1
+            buf["sales"].append(
+                (
+                    sale_id,
+                    rng.choice(cashier_ids),
+                    total_ht,
+                    total_tva,
+                    total_ht + total_tva,
+                    rng.choice(("cash", "cash", "carte", "mobile")),
+                    stamp,
+                )
+            )
+            if canceled:
+                buf["cancels"].append((sale_id, "Erreur caisse", stamp))
+                totals["cancellations"] += 1
+            totals["sales"] += 1
+            totals["sale_items"] += len(lines)
+            if len(buf["sales"]) >= chunk_sales:
+                flush()
+        day += timedelta(days=1)
+    flush()
+
+    with db_cursor("bulk_import") as cur:
+        cur.executemany(
+            "UPDATE batches SET quantity = ? WHERE id = ?",
+            [(qty, batch_id) for batch_id, qty in final_qty.items()],
+        )
+        cur.execute("ANALYZE")
+
+    return {"products": products, "categories": len(category_ids), **totals}
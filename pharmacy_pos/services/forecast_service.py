@@ -0,0 +1,187 @@
+"""Prévision de la demande et suggestions de réassort.
+
+Les lignes de vente (tickets non annulés) sont agrégées en un passage en
+séries journalières par produit: (produit, jour, quantité), jours sans
+vente absents. Les indicateurs sont des sommes pondérées par jour sur ces
+entrées, calculées pour tous les produits à la fois:
+
+- moyennes mobiles sur 7 et 28 jours, écart-type journalier sur 28 jours;
+- lissage exponentiel (EWMA), sous forme close:
+  ewma = somme de alpha * (1 - alpha)^(T-1-jour) * quantité.
+
+Avec NumPy, le calcul est vectorisé (np.bincount); sans NumPy, les mêmes
+sommes sont accumulées dans des tableaux `array`.
+
+Stock minimum suggéré = point de commande = demande * délai + stock de
+sécurité (z * écart-type * racine du délai). Quantité à commander: de quoi
+couvrir délai + période de revue, moins le stock vendable.
+"""
+import math
+import sqlite3
+from array import array
+from datetime import date, datetime, timedelta, timezone
+
+from pharmacy_pos.database import db_cursor, transaction
+from pharmacy_pos.services.alert_service import evaluate_alerts
+from pharmacy_pos.services.stock_service import ensure_stock_counters_current
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+FORECAST_HISTORY_DAYS = 730
+FORECAST_ALPHA = 0.1
+LEAD_TIME_DAYS = 7
+REVIEW_DAYS = 7
+SERVICE_Z = 1.65  # ~95 % de cycles sans rupture
+
+_SHORT_WINDOW = 7
+_LONG_WINDOW = 28
+
+
+def daily_demand(cur: sqlite3.Cursor, start: date, end: date) -> tuple[list[int], list[int], list[int]]:
+    """Séries journalières (colonnes produit, jour depuis `start`, quantité) sur [start, end[.
+
+    Une seule requête sur la plage de idx_sales_created_at, regroupée par
+    produit et par jour; l'indice du jour est calculé ici.
+    """
+    cur.execute(
+        """
+        SELECT si.product_id, DATE(s.created_at) AS day, SUM(si.quantity) AS quantity
+        FROM sales s
+        JOIN sale_items si ON si.sale_id = s.id
+        WHERE s.created_at >= ? AND s.created_at < ?
+          AND NOT EXISTS (SELECT 1 FROM sale_cancellations sc WHERE sc.sale_id = s.id)
+        GROUP BY DATE(s.created_at), si.product_id
+        """,
+        (start.isoformat(), end.isoformat()),
+    )
+    product_ids, days, quantities = [], [], []
+    for product_id, day, quantity in cur.fetchall():
+        product_ids.append(product_id)
+        days.append((date.fromisoformat(day) - start).days)
+        quantities.append(quantity)
+    return product_ids, days, quantities
+
+
+def _indicators_numpy(product_ids, days, quantities, horizon: int, alpha: float) -> tuple[list[int], dict]:
+    ids, inverse = np.unique(np.asarray(product_ids, dtype=np.int64), return_inverse=True)
+    day = np.asarray(days, dtype=np.int64)
+    qty = np.asarray(quantities, dtype=np.float64)
+    n = len(ids)
+
+    def window_sum(values, window):
+        mask = day >= horizon - window
+        return np.bincount(inverse[mask], weights=values[mask], minlength=n)
+
+    long_sum = window_sum(qty, _LONG_WINDOW)
+    long_sq = window_sum(qty * qty, _LONG_WINDOW)
+    indicators = {
+        "sma_7": window_sum(qty, _SHORT_WINDOW) / _SHORT_WINDOW,
+        "sma_28": long_sum / _LONG_WINDOW,
+        "std_28": np.sqrt(np.maximum(long_sq / _LONG_WINDOW - (long_sum / _LONG_WINDOW) ** 2, 0.0)),
+        "ewma": np.bincount(inverse, weights=qty * alpha * (1 - alpha) ** (horizon - 1 - day), minlength=n),
+    }
+    return ids.tolist(), {key: values.tolist() for key, values in indicators.items()}
+
+
+def _indicators_python(product_ids, days, quantities, horizon: int, alpha: float) -> tuple[list[int], dict]:
+    index: dict[int, int] = {}
+    for product_id in product_ids:
+        if product_id not in index:
+            index[product_id] = len(index)
+    n = len(index)
+    short_sum, long_sum, long_sq, ewma = (array("d", bytes(8 * n)) for _ in range(4))
+    decay = [alpha * (1 - alpha) ** (horizon - 1 - d) for d in range(horizon)]
+
+    for product_id, d, qty in zip(product_ids, days, quantities):
+        i = index[product_id]
+        ewma[i] += decay[d] * qty
+        if d >= horizon - _LONG_WINDOW:
+            long_sum[i] += qty
+            long_sq[i] += qty * qty
+            if d >= horizon - _SHORT_WINDOW:
+                short_sum[i] += qty
+
+    indicators = {
+        "sma_7": [v / _SHORT_WINDOW for v in short_sum],
+        "sma_28": [v / _LONG_WINDOW for v in long_sum],
+        "std_28": [
+            math.sqrt(max(sq / _LONG_WINDOW - (s / _LONG_WINDOW) ** 2, 0.0)) for s, sq in zip(long_sum, long_sq)
+        ],
+        "ewma": list(ewma),
+    }
+    return list(index), indicators
+
+
+def forecast_demand(
+    history_days: int = FORECAST_HISTORY_DAYS,
+    alpha: float = FORECAST_ALPHA,
+    lead_time_days: int = LEAD_TIME_DAYS,
+    review_days: int = REVIEW_DAYS,
+    service_z: float = SERVICE_Z,
+    use_numpy: bool | None = None,
+) -> list[dict]:
+    """Prévision et suggestions pour chaque produit vendu sur l'historique.
+
+    L'historique couvre les `history_days` jours complets avant aujourd'hui
+    (UTC). Résultat trié par quantité à commander décroissante: product_id,
+    name, sma_7, sma_28, std_28, ewma, daily_demand, stock, min_stock,
+    suggested_min_stock, reorder_qty.
+    """
+    if history_days < _LONG_WINDOW:
+        raise ValueError(f"Historique trop court (minimum {_LONG_WINDOW} jours)")
+    if not 0 < alpha <= 1:
+        raise ValueError("alpha doit être dans ]0, 1]")
+    if use_numpy is None:
+        use_numpy = np is not None
+    elif use_numpy and np is None:
+        raise ValueError("NumPy n'est pas installé")
+
+    today = datetime.now(timezone.utc).date()
+    start = today - timedelta(days=history_days)
+    ensure_stock_counters_current()
+    with db_cursor("reporting") as cur:
+        columns = daily_demand(cur, start, today)
+        cur.execute("SELECT id, name, stock_valid, min_stock FROM products")
+        products = {row["id"]: row for row in cur.fetchall()}
+
+    compute = _indicators_numpy if use_numpy else _indicators_python
+    ids, indicators = compute(*columns, history_days, alpha)
+
+    results = []
+    for i, product_id in enumerate(ids):
+        product = products.get(product_id)
+        if product is None:
+            continue
+        daily = indicators["ewma"][i]
+        safety = service_z * indicators["std_28"][i] * math.sqrt(lead_time_days)
+        reorder_point = math.ceil(daily * lead_time_days + safety)
+        order_up_to = math.ceil(daily * (lead_time_days + review_days) + safety)
+        results.append(
+            {
+                "product_id": product_id,
+                "name": product["name"],
+                **{key: round(values[i], 3) for key, values in indicators.items()},
+                "daily_demand": round(daily, 3),
+                "stock": product["stock_valid"],
+                "min_stock": product["min_stock"],
+                "suggested_min_stock": reorder_point,
+                "reorder_qty": max(0, order_up_to - product["stock_valid"]),
+            }
+        )
+    results.sort(key=lambda r: (-r["reorder_qty"], r["product_id"]))
+    return results
+
+
+def apply_suggested_min_stock(suggestions: list[dict]) -> int:
+    """Enregistre `suggested_min_stock` comme stock minimum. Retourne le
+    nombre de produits modifiés; leurs alertes de stock bas sont réévaluées."""
+    changes = [(s["suggested_min_stock"], s["product_id"]) for s in suggestions if s["suggested_min_stock"] != s["min_stock"]]
+    with transaction() as cur:
+        cur.executemany("UPDATE products SET min_stock = ? WHERE id = ?", changes)
+        product_ids = [product_id for _min, product_id in changes]
+        for start in range(0, len(product_ids), 500):
+            evaluate_alerts(cur, product_ids[start:start + 500], {})
+    return len(changes)
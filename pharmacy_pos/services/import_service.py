@@ -0,0 +1,283 @@
+"""Import en masse du catalogue depuis un fichier CSV fournisseur.
+
+Le fichier est lu en flux, ligne à ligne: seules les lignes du lot en cours
+sont en mémoire. Chaque lot est écrit dans une transaction (profil
+`bulk_import`) par `executemany`; un produit dont le code-barres existe déjà
+voit seulement ses prix mis à jour.
+"""
+import csv
+import math
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pharmacy_pos.database import after_commit, db_cursor, transaction
+from pharmacy_pos.services.alert_service import evaluate_alerts
+from pharmacy_pos.services.catalog_service import invalidate_catalog
+from pharmacy_pos.trigrams import index_products
+
+IMPORT_BATCH_SIZE = 5_000
+
+# Colonnes attendues et alias acceptés dans l'en-tête.
+COLUMN_ALIASES = {
+    "name": ("name", "nom", "designation", "désignation", "libelle", "libellé"),
+    "barcode": ("barcode", "code_barre", "code-barres", "codebarre", "ean", "cip"),
+    "category": ("category", "categorie", "catégorie", "famille"),
+    "buy_price": ("buy_price", "prix_achat"),
+    "sell_price": ("sell_price", "prix_vente"),
+    "tva": ("tva", "vat"),
+    "min_stock": ("min_stock", "stock_min"),
+    "requires_prescription": ("requires_prescription", "ordonnance", "rx"),
+}
+REQUIRED_COLUMNS = ("name", "barcode", "category", "buy_price", "sell_price")
+_TRUE = {"1", "oui", "o", "yes", "y", "true", "vrai", "x"}
+_FALSE = {"", "0", "non", "n", "no", "false", "faux"}
+
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: list[tuple[int, str]] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged + len(self.rejected)
+
+
+def _detect_delimiter(f) -> str:
+    first_line = f.readline()
+    f.seek(0)
+    return ";" if first_line.count(";") > first_line.count(",") else ","
+
+
+def _map_header(header: list[str]) -> dict[str, int]:
+    normalized = [h.strip().lower() for h in header]
+    mapping = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[column] = normalized.index(alias)
+                break
+    missing = [c for c in REQUIRED_COLUMNS if c not in mapping]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans l'en-tête: {', '.join(missing)}")
+    return mapping
+
+
+def _number(raw: str, label: str) -> float:
+    try:
+        value = float(raw.strip().replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{label} invalide: {raw!r}") from None
+    # float() accepte "nan", "inf" et les dépassements ("1e309").
+    if not math.isfinite(value):
+        raise ValueError(f"{label} invalide: {raw!r}")
+    if value < 0:
+        raise ValueError(f"{label} négatif")
+    return value
+
+
+def parse_row(row: list[str], mapping: dict[str, int]) -> tuple:
+    """Valide une ligne et retourne (name, barcode, category, buy, sell, tva, min_stock, rx)."""
+
+    def cell(column: str) -> str:
+        index = mapping.get(column)
+        return row[index].strip() if index is not None and index < len(row) else ""
+
+    name = cell("name")
+    barcode = cell("barcode")
+    category = cell("category")
+    if not name:
+        raise ValueError("Nom manquant")
+    if not barcode:
+        raise ValueError("Code-barres manquant")
+    if not category:
+        raise ValueError("Catégorie manquante")
+
+    buy_price = _number(cell("buy_price"), "Prix d'achat")
+    sell_price = _number(cell("sell_price"), "Prix de vente")
+    tva = _number(cell("tva") or "0", "TVA")
+    min_stock = _number(cell("min_stock") or "0", "Stock minimum")
+    if min_stock != int(min_stock):
+        raise ValueError("Stock minimum non entier")
+
+    rx = cell("requires_prescription").lower()
+    if rx in _TRUE:
+        requires_prescription = 1
+    elif rx in _FALSE:
+        requires_prescription = 0
+    else:
+        raise ValueError(f"Ordonnance invalide: {rx!r}")
+
+    return name, barcode, category, buy_price, sell_price, tva, int(min_stock), requires_prescription
+
+
+def _category_ids(cur: sqlite3.Cursor, names: set[str], cache: dict[str, int]) -> None:
+    missing = [n for n in names if n not in cache]
+    if not missing:
+        return
+    cur.executemany("INSERT OR IGNORE INTO categories(name) VALUES(?)", ((n,) for n in missing))
+    cur.execute(f"SELECT id, name FROM categories WHERE name IN ({','.join('?' * len(missing))})", missing)
+    cache.update((row["name"], row["id"]) for row in cur.fetchall())
+
+
+def _write_batch(batch: list[tuple], categories: dict[str, int], report: ImportReport) -> None:
+    """Écrit un lot de lignes valides (codes-barres distincts)."""
+    barcodes = [row[1] for row in batch]
+
+    with transaction(profile="bulk_import") as cur:
+        _category_ids(cur, {row[2] for row in batch}, categories)
+
+        existing = set()
+        for start in range(0, len(barcodes), 500):
+            chunk = barcodes[start:start + 500]
+            cur.execute(f"SELECT barcode FROM products WHERE barcode IN ({','.join('?' * len(chunk))})", chunk)
+            existing.update(row["barcode"] for row in cur.fetchall())
+
+        new_rows = [row for row in batch if row[1] not in existing]
+        cur.executemany(
+            """
+            INSERT INTO products(
+                name, barcode, category_id, buy_price, sell_price,
+                tva, requires_prescription, min_stock
+            ) VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (name, barcode, categories[category], buy, sell, tva, rx, min_stock)
+                for name, barcode, category, buy, sell, tva, min_stock, rx in new_rows
+            ),
+        )
+        cur.executemany(
+            """
+            UPDATE products
+            SET buy_price = ?, sell_price = ?, tva = ?
+            WHERE barcode = ? AND (buy_price != ? OR sell_price != ? OR tva != ?)
+            """,
+            (
+                (buy, sell, tva, barcode, buy, sell, tva)
+                for _name, barcode, _category, buy, sell, tva, _min, _rx in batch
+                if barcode in existing
+            ),
+        )
+        # Seules les fiches dont un prix a changé sont comptées.
+        updated = cur.rowcount
+        index_products(cur, [row[0] for row in new_rows])
+
+        # Alertes des nouveaux produits (stock nul), comme pour create_product.
+        new_barcodes = [row[1] for row in new_rows]
+        for start in range(0, len(new_barcodes), 500):
+            chunk = new_barcodes[start:start + 500]
+            cur.execute(f"SELECT id FROM products WHERE barcode IN ({','.join('?' * len(chunk))})", chunk)
+            evaluate_alerts(cur, [row["id"] for row in cur.fetchall()], {})
+        after_commit(invalidate_catalog)
+
+    report.inserted += len(new_rows)
+    report.updated += updated
+    report.unchanged += len(existing) - updated
+
+
+def import_products_csv(
+    path: str | Path,
+    delimiter: str | None = None,
+    encoding: str = "utf-8-sig",
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportReport:
+    """Importe (ou met à jour par code-barres) le catalogue d'un CSV fournisseur.
+
+    - séparateur `;` ou `,` détecté sur l'en-tête si non précisé;
+    - lignes invalides ignorées et rapportées avec leur numéro et la raison;
+    - produit existant (même code-barres): prix d'achat, de vente et TVA
+      mis à jour, le reste de la fiche est conservé; `updated` ne compte
+      que les fiches réellement modifiées, les autres vont dans `unchanged`;
+    - un code-barres déjà vu plus haut dans le fichier est rejeté (la
+      première ligne fait foi).
+    """
+    report = ImportReport()
+    categories: dict[str, int] = {}
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.reader(f, delimiter=delimiter or _detect_delimiter(f))
+        header = next(reader, None)
+        if header is None:
+            raise ValueError("Fichier CSV vide")
+        mapping = _map_header(header)
+
+        batch: list[tuple] = []
+        seen: set[str] = set()
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            try:
+                parsed = parse_row(row, mapping)
+                if parsed[1] in seen:
+                    raise ValueError(f"Code-barres en double dans le fichier: {parsed[1]}")
+            except ValueError as exc:
+                report.rejected.append((reader.line_num, str(exc)))
+                continue
+            seen.add(parsed[1])
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                _write_batch(batch, categories, report)
+                batch = []
+        if batch:
+            _write_batch(batch, categories, report)
+    return report
+
+
+def read_delivery_csv(path: str | Path, encoding: str = "utf-8-sig") -> list[dict]:
+    """Lit un bon de livraison CSV (code_barre;lot;peremption;quantite).
+
+    Retourne les lignes au format de `stock_service.receive_delivery`. Un
+    code-barres inconnu ou une quantité invalide lève ValueError avec le
+    numéro de ligne.
+    """
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.reader(f, delimiter=_detect_delimiter(f))
+        next(reader, None)
+        raw = [(reader.line_num, row) for row in reader if any(cell.strip() for cell in row)]
+
+    if not raw:
+        raise ValueError("Bon de livraison vide")
+    barcodes = sorted({row[0].strip() for _line, row in raw})
+    with db_cursor() as cur:
+        cur.execute(f"SELECT id, barcode FROM products WHERE barcode IN ({','.join('?' * len(barcodes))})", barcodes)
+        ids = {row["barcode"]: row["id"] for row in cur.fetchall()}
+
+    lines = []
+    for line_num, row in raw:
+        if len(row) < 4:
+            raise ValueError(f"Ligne {line_num}: 4 colonnes attendues")
+        barcode, batch_number, expiry_date, quantity = (cell.strip() for cell in row[:4])
+        if barcode not in ids:
+            raise ValueError(f"Ligne {line_num}: code-barres inconnu {barcode}")
+        try:
+            qty = int(quantity)
+        except ValueError:
+            raise ValueError(f"Ligne {line_num}: quantité invalide {quantity!r}") from None
+        lines.append({"product_id": ids[barcode], "batch_number": batch_number, "expiry_date": expiry_date, "quantity": qty})
+    return lines
+
+
+def read_stocktake_csv(path: str | Path, encoding: str = "utf-8-sig") -> list[dict]:
+    """Lit un fichier de comptage d'inventaire CSV (code_barre;lot;quantite).
+
+    Retourne les lignes au format de `StocktakeSession.scan` avec leur
+    numéro (`line`). Une quantité invalide lève ValueError.
+    """
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.reader(f, delimiter=_detect_delimiter(f))
+        next(reader, None)
+        raw = [(reader.line_num, row) for row in reader if any(cell.strip() for cell in row)]
+
+    lines = []
+    for line_num, row in raw:
+        if len(row) < 3:
+            raise ValueError(f"Ligne {line_num}: 3 colonnes attendues")
+        barcode, batch_number, quantity = (cell.strip() for cell in row[:3])
+        try:
+            qty = int(quantity)
+        except ValueError:
+            raise ValueError(f"Ligne {line_num}: quantité invalide {quantity!r}") from None
+        lines.append({"line": line_num, "barcode": barcode, "batch_number": batch_number, "quantity": qty})
+    return lines
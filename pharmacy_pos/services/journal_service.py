@@ -0,0 +1,303 @@
+"""Journal local des ventes hors ligne et rejeu.
+
+Si la base partagée est injoignable ou reste verrouillée, `submit_sale`
+écrit la vente dans un fichier local en ajout seul (une ligne JSON par
+vente, avec une clé d'idempotence) et la caisse continue. Les écritures
+sont vidées vers le système à chaque vente et synchronisées sur disque
+(fsync) par groupes: au plus JOURNAL_FSYNC_EVERY ventes ou JOURNAL_FSYNC_MS
+ms non synchronisées.
+
+Tant que la base est indisponible, les ventes vont directement au journal
+(pas d'attente du busy_timeout à chaque ticket); elle est retentée toutes
+les JOURNAL_RETRY_S secondes. Au retour, le journal est rejoué d'abord, dans
+l'ordre: chaque vente est créée (date d'origine conservée) ou, si elle ne
+passe plus (stock insuffisant, produit ou caissier supprimé, entrée
+incomplète...), notée en conflit dans `offline_sales`: une entrée en échec
+ne bloque jamais les suivantes. La clé rend le rejeu sûr s'il est
+interrompu puis relancé.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pharmacy_pos.config import JOURNAL_FSYNC_EVERY, JOURNAL_FSYNC_MS, JOURNAL_PATH, JOURNAL_RETRY_S
+from pharmacy_pos.database import DatabaseUnavailable, db_cursor, retry_on_busy, savepoint, transaction
+from pharmacy_pos.services.sales_service import create_sale
+
+logger = logging.getLogger(__name__)
+
+# Ventes rejouées par transaction.
+_REPLAY_CHUNK = 100
+
+
+class SalesJournal:
+    """Fichier journal en ajout seul, synchronisé sur disque par groupes."""
+
+    def __init__(self, path: Path, fsync_every: int = JOURNAL_FSYNC_EVERY, fsync_ms: int = JOURNAL_FSYNC_MS) -> None:
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.fsync_ms = fsync_ms
+        self.lock = threading.Lock()
+        self.replay_lock = threading.Lock()
+        self.file = None
+        self.unsynced = 0
+        self.timer: threading.Timer | None = None
+        # Mode hors ligne: instant (monotonic) de la dernière tentative sur la base.
+        self.offline_since: float | None = None
+        self.last_attempt = 0.0
+
+    def append(self, cashier_id: int, items: list[dict], payment_method: str, key: str | None = None) -> str:
+        """Ajoute une vente au journal. Retourne sa clé d'idempotence."""
+        entry = {
+            "key": key or uuid.uuid4().hex,
+            "journaled_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            "cashier_id": cashier_id,
+            "payment_method": payment_method,
+            "items": [
+                {
+                    "product_id": int(item["product_id"]),
+                    "quantity": int(item["quantity"]),
+                    "prescription_ok": bool(item.get("prescription_ok", False)),
+                }
+                for item in items
+            ],
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.write(line)
+            self.file.flush()
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self._sync()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.fsync_ms / 1000, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+        return entry["key"]
+
+    def _sync(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def sync(self) -> None:
+        with self.lock:
+            self._sync()
+
+    def close(self) -> None:
+        with self.lock:
+            self._sync()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def rotate(self) -> None:
+        """Met de côté le journal courant pour le rejeu; les ventes suivantes
+        repartent dans un fichier neuf."""
+        with self.lock:
+            self._sync()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if self.path.exists() and self.path.stat().st_size > 0:
+                os.replace(self.path, self.path.with_name(f"{self.path.name}.{time.time_ns()}.replay"))
+
+    def replay_files(self) -> list[Path]:
+        return sorted(self.path.parent.glob(f"{self.path.name}.*.replay"))
+
+    def pending_count(self) -> int:
+        """Ventes du journal pas encore rejouées (fichier courant compris)."""
+        self.sync()
+        files = self.replay_files() + ([self.path] if self.path.exists() else [])
+        return sum(len(read_journal(path)) for path in files)
+
+
+def read_journal(path: Path) -> list[dict]:
+    """Entrées d'un fichier journal, dans l'ordre. Une ligne incomplète
+    (coupure pendant l'écriture) est ignorée."""
+    entries = []
+    with open(path, encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+            if not isinstance(entry, dict):
+                logger.warning("Journal %s: ligne %s illisible ignorée", path, number)
+                continue
+            entries.append(entry)
+    return entries
+
+
+_journal: SalesJournal | None = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> SalesJournal:
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = SalesJournal(JOURNAL_PATH)
+        return _journal
+
+
+def _entry_key(entry: dict) -> str:
+    # Entrée sans clé (fichier modifié à la main...): clé dérivée du contenu,
+    # stable d'un rejeu à l'autre.
+    if entry.get("key"):
+        return str(entry["key"])
+    return "sans-cle-" + hashlib.sha1(json.dumps(entry, sort_keys=True).encode()).hexdigest()
+
+
+def _conflict_detail(exc: Exception) -> str:
+    if isinstance(exc, KeyError):
+        return f"Entrée de journal incomplète: champ {exc} manquant"
+    if isinstance(exc, TypeError):
+        return f"Entrée de journal invalide: {exc}"
+    if isinstance(exc, sqlite3.IntegrityError):
+        return f"Vente refusée par la base: {exc}"
+    return str(exc)
+
+
+@retry_on_busy
+def _replay_entries(entries: list[dict]) -> tuple[int, int, list[dict]]:
+    applied = skipped = 0
+    conflicts = []
+    with transaction() as cur:
+        for entry in entries:
+            key = _entry_key(entry)
+            cur.execute("SELECT 1 FROM offline_sales WHERE idempotency_key = ?", (key,))
+            if cur.fetchone() is not None:
+                skipped += 1
+                continue
+            try:
+                with savepoint(cur):
+                    cur.execute("SELECT id FROM sales WHERE idempotency_key = ?", (key,))
+                    existing = cur.fetchone()
+                    sale_id = create_sale(
+                        entry["cashier_id"], entry["items"], entry["payment_method"], cur=cur, idempotency_key=key
+                    )
+                    if existing is None:
+                        cur.execute("UPDATE sales SET created_at = ? WHERE id = ?", (entry["journaled_at"], sale_id))
+            except (ValueError, KeyError, TypeError, sqlite3.IntegrityError) as exc:
+                # Erreur propre à l'entrée: notée en conflit, les suivantes sont rejouées.
+                detail = _conflict_detail(exc)
+                conflicts.append({**entry, "error": detail})
+                cur.execute(
+                    """
+                    INSERT INTO offline_sales(idempotency_key, status, cashier_id, journaled_at, detail, payload)
+                    VALUES(?, 'conflict', ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+                    """,
+                    (key, entry.get("cashier_id"), entry.get("journaled_at"), detail, json.dumps(entry, ensure_ascii=False)),
+                )
+                continue
+            cur.execute(
+                """
+                INSERT INTO offline_sales(idempotency_key, status, sale_id, cashier_id, journaled_at)
+                VALUES(?, 'applied', ?, ?, ?)
+                """,
+                (key, sale_id, entry["cashier_id"], entry["journaled_at"]),
+            )
+            applied += 1
+    return applied, skipped, conflicts
+
+
+def replay_journal(journal: SalesJournal | None = None) -> dict:
+    """Rejoue les ventes journalisées, dans l'ordre.
+
+    Retourne {"applied", "skipped" (déjà rejouées), "conflicts"}; chaque
+    conflit reprend l'entrée du journal avec le motif (`error`). Un fichier
+    entièrement rejoué est renommé en `.done` (conservé pour audit). Si la
+    base redevient indisponible, l'erreur remonte et le rejeu reprendra là
+    où il s'est arrêté.
+    """
+    journal = journal or get_journal()
+    result = {"applied": 0, "skipped": 0, "conflicts": []}
+    with journal.replay_lock:
+        journal.rotate()
+        for path in journal.replay_files():
+            entries = read_journal(path)
+            for start in range(0, len(entries), _REPLAY_CHUNK):
+                applied, skipped, conflicts = _replay_entries(entries[start:start + _REPLAY_CHUNK])
+                result["applied"] += applied
+                result["skipped"] += skipped
+                result["conflicts"].extend(conflicts)
+            os.replace(path, path.with_suffix(".done"))
+    return result
+
+
+def submit_sale(
+    cashier_id: int,
+    items: list[dict],
+    payment_method: str,
+    journal: SalesJournal | None = None,
+    idempotency_key: str | None = None,
+) -> dict:
+    """Enregistre une vente en base, ou dans le journal si la base est indisponible.
+
+    Retourne {"sale_id", "key", "offline", "replay"}: `sale_id` pour une
+    vente en base (None si journalisée), `key` la clé d'idempotence;
+    `replay` est le résultat du rejeu si le journal vient d'être rejoué. Les
+    erreurs métier (stock insuffisant, ordonnance...) sont levées comme par
+    create_sale. La même clé sert en base et au journal: un panier soumis
+    deux fois n'est enregistré qu'une fois.
+    """
+    if not items:
+        raise ValueError("Le panier est vide")
+    if any(int(item["quantity"]) <= 0 for item in items):
+        raise ValueError("Quantité invalide")
+
+    journal = journal or get_journal()
+    key = idempotency_key or uuid.uuid4().hex
+    replay = None
+    if journal.offline_since is not None:
+        if time.monotonic() - journal.last_attempt < JOURNAL_RETRY_S:
+            return {"sale_id": None, "key": journal.append(cashier_id, items, payment_method, key), "offline": True, "replay": None}
+        try:
+            replay = replay_journal(journal)
+        except Exception as exc:
+            # Base toujours indisponible ou rejeu en échec: la vente est journalisée
+            # et le rejeu ne sera retenté qu'après JOURNAL_RETRY_S.
+            if not isinstance(exc, (DatabaseUnavailable, sqlite3.OperationalError)):
+                logger.exception("Rejeu du journal hors ligne en échec")
+            journal.last_attempt = time.monotonic()
+            return {"sale_id": None, "key": journal.append(cashier_id, items, payment_method, key), "offline": True, "replay": None}
+        logger.info("Base de nouveau disponible: %s ventes hors ligne rejouées", replay["applied"])
+        journal.offline_since = None
+
+    try:
+        sale_id = create_sale(cashier_id, items, payment_method, idempotency_key=key)
+    except (DatabaseUnavailable, sqlite3.OperationalError) as exc:
+        logger.warning("Base indisponible, vente journalisée hors ligne: %s", exc)
+        journal.offline_since = journal.last_attempt = time.monotonic()
+        return {"sale_id": None, "key": journal.append(cashier_id, items, payment_method, key), "offline": True, "replay": replay}
+    return {"sale_id": sale_id, "key": key, "offline": False, "replay": replay}
+
+
+def list_offline_conflicts() -> list[dict]:
+    """Ventes hors ligne qui n'ont pas pu être rejouées, des plus anciennes aux plus récentes."""
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT idempotency_key, cashier_id, journaled_at, replayed_at, detail, payload
+            FROM offline_sales
+            WHERE status = 'conflict'
+            ORDER BY journaled_at ASC
+            """
+        )
+        rows = cur.fetchall()
+    return [{**dict(row), "items": json.loads(row["payload"]).get("items", [])} for row in rows]
@@ -0,0 +1,232 @@
+"""Registre des mouvements de stock: instantanés, compactage et archive.
+
+`stock_movements` ne fait que grossir (une ligne par lot alloué). Le
+compactage replie, mois par mois, les mouvements anciens dans des
+instantanés par produit (`stock_snapshots`: stock au début du mois) et
+déplace les lignes repliées vers `stock_movements_archive`.
+
+`stock_at` lit le dernier instantané antérieur puis seulement la fin du
+registre (au plus un mois d'archive, ou les mouvements récents): la
+question « quel stock à telle date ? » ne rejoue jamais tout l'historique.
+`reconcile_stock_ledger` compare le registre aux lots.
+
+Les horodatages sont ceux de `created_at` (CURRENT_TIMESTAMP, UTC).
+"""
+import sqlite3
+from datetime import date, datetime, timezone
+
+from pharmacy_pos.database import db_cursor, transaction
+
+# Mouvements conservés dans la table principale par défaut.
+LEDGER_KEEP_MONTHS = 3
+
+# Quantité signée d'un mouvement (ADJUST porte son signe).
+SIGNED_QUANTITY_SQL = "CASE type WHEN 'OUT' THEN -quantity ELSE quantity END"
+
+_COMPACTED_KEY = "stock_ledger_compacted_until"
+
+
+def _timestamp(value: str | date | datetime) -> str:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _month_start(day: date, months_back: int = 0) -> date:
+    month = day.year * 12 + day.month - 1 - months_back
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _boundaries(first_movement: str, cutoff: date) -> list[str]:
+    """Débuts de mois après le premier mouvement, puis la date limite."""
+    boundaries = []
+    day = _month_start(date.fromisoformat(first_movement[:10]), -1)
+    while day < cutoff:
+        boundaries.append(day.isoformat())
+        day = _month_start(day, -1)
+    boundaries.append(cutoff.isoformat())
+    return boundaries
+
+
+def ledger_compacted_until() -> str | None:
+    with db_cursor() as cur:
+        cur.execute("SELECT value FROM app_meta WHERE key = ?", (_COMPACTED_KEY,))
+        row = cur.fetchone()
+    return row["value"] if row is not None else None
+
+
+def compact_stock_ledger(before: str | date | None = None) -> dict:
+    """Replie les mouvements antérieurs à `before` (date, exclue) en instantanés.
+
+    Par défaut, les LEDGER_KEEP_MONTHS derniers mois sont conservés. Un
+    instantané par produit et par mois est créé, puis les mouvements repliés
+    sont archivés. Chaque mois est traité dans sa propre transaction: le job
+    peut être interrompu et relancé. Retourne
+    {"months", "snapshots", "archived"}.
+    """
+    today = datetime.now(timezone.utc).date()
+    if before is None:
+        cutoff = _month_start(today, LEDGER_KEEP_MONTHS)
+    else:
+        cutoff = before if isinstance(before, date) else date.fromisoformat(before)
+    if cutoff > today:
+        raise ValueError("Date de compactage dans le futur")
+
+    result = {"months": 0, "snapshots": 0, "archived": 0}
+    done = ledger_compacted_until()
+    if done is not None and cutoff.isoformat() <= done:
+        return result
+    with db_cursor() as cur:
+        cur.execute("SELECT MIN(created_at) AS first FROM stock_movements WHERE created_at < ?", (cutoff.isoformat(),))
+        first = cur.fetchone()["first"]
+
+    boundaries = _boundaries(first, cutoff) if first is not None else [cutoff.isoformat()]
+    for boundary in boundaries:
+        if done is not None and boundary <= done:
+            continue
+        with transaction(profile="bulk_import") as cur:
+            # Tout ce qui reste avant `boundary` appartient au dernier mois.
+            cur.execute(
+                f"""
+                INSERT INTO stock_snapshots(product_id, taken_at, quantity, movements)
+                SELECT m.product_id, ?,
+                       COALESCE((
+                           SELECT s.quantity FROM stock_snapshots s
+                           WHERE s.product_id = m.product_id
+                           ORDER BY s.taken_at DESC
+                           LIMIT 1
+                       ), 0) + SUM({SIGNED_QUANTITY_SQL}),
+                       COUNT(*)
+                FROM stock_movements m
+                WHERE m.created_at < ?
+                GROUP BY m.product_id
+                """,
+                (boundary, boundary),
+            )
+            result["snapshots"] += cur.rowcount
+            cur.execute(
+                """
+                INSERT INTO stock_movements_archive(id, product_id, batch_id, type, quantity, reason, created_at)
+                SELECT id, product_id, batch_id, type, quantity, reason, created_at
+                FROM stock_movements
+                WHERE created_at < ?
+                """,
+                (boundary,),
+            )
+            result["archived"] += cur.rowcount
+            cur.execute("DELETE FROM stock_movements WHERE created_at < ?", (boundary,))
+            cur.execute("INSERT OR REPLACE INTO app_meta(key, value) VALUES(?, ?)", (_COMPACTED_KEY, boundary))
+        result["months"] += 1
+    return result
+
+
+def stock_at(product_id: int, timestamp: str | date | datetime) -> int:
+    """Stock d'un produit à `timestamp` (mouvements created_at <= timestamp).
+
+    Une date seule (AAAA-MM-JJ) désigne le début de la journée.
+    """
+    moment = _timestamp(timestamp)
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT taken_at, quantity FROM stock_snapshots
+            WHERE product_id = ? AND taken_at <= ?
+            ORDER BY taken_at DESC
+            LIMIT 1
+            """,
+            (product_id, moment),
+        )
+        snapshot = cur.fetchone()
+        since, quantity = (snapshot["taken_at"], snapshot["quantity"]) if snapshot is not None else ("", 0)
+        cur.execute(
+            f"""
+            SELECT COALESCE(SUM({SIGNED_QUANTITY_SQL}), 0) AS delta FROM (
+                SELECT type, quantity FROM stock_movements
+                WHERE product_id = ? AND created_at >= ? AND created_at <= ?
+                UNION ALL
+                SELECT type, quantity FROM stock_movements_archive
+                WHERE product_id = ? AND created_at >= ? AND created_at <= ?
+            )
+            """,
+            (product_id, since, moment, product_id, since, moment),
+        )
+        return quantity + cur.fetchone()["delta"]
+
+
+def _ledger_totals(cur: sqlite3.Cursor, product_ids: list[int] | None = None) -> dict[int, int]:
+    """Stock attendu par produit: dernier instantané + mouvements non compactés."""
+    where = f"WHERE product_id IN ({','.join('?' * len(product_ids))})" if product_ids else ""
+    params = tuple(product_ids or ())
+    totals: dict[int, int] = {}
+    # MAX() avec colonne nue: `quantity` est celle de l'instantané le plus récent.
+    cur.execute(f"SELECT product_id, quantity, MAX(taken_at) FROM stock_snapshots {where} GROUP BY product_id", params)
+    for row in cur.fetchall():
+        totals[row["product_id"]] = row["quantity"]
+    cur.execute(
+        f"SELECT product_id, SUM({SIGNED_QUANTITY_SQL}) AS total FROM stock_movements {where} GROUP BY product_id",
+        params,
+    )
+    for row in cur.fetchall():
+        totals[row["product_id"]] = totals.get(row["product_id"], 0) + row["total"]
+    return totals
+
+
+def _batch_totals(cur: sqlite3.Cursor, product_ids: list[int] | None = None) -> dict[int, int]:
+    where = f"WHERE product_id IN ({','.join('?' * len(product_ids))})" if product_ids else ""
+    cur.execute(f"SELECT product_id, SUM(quantity) AS total FROM batches {where} GROUP BY product_id", tuple(product_ids or ()))
+    return {row["product_id"]: row["total"] for row in cur.fetchall()}
+
+
+def _discrepancies(ledger: dict[int, int], batches: dict[int, int]) -> dict[int, tuple[int, int]]:
+    return {
+        pid: (ledger.get(pid, 0), batches.get(pid, 0))
+        for pid in ledger.keys() | batches.keys()
+        if ledger.get(pid, 0) != batches.get(pid, 0)
+    }
+
+
+def reconcile_stock_ledger(correct: bool = False, reason: str = "Réconciliation registre/lots") -> list[dict]:
+    """Compare, par produit, le stock attendu du registre et la somme des lots.
+
+    Un seul passage agrégé sur chaque table (index couvrants), dans une
+    transaction de lecture: les ventes continuent pendant le calcul. Avec
+    `correct=True`, les écarts sont revérifiés sous verrou d'écriture puis
+    soldés par un mouvement ADJUST signé (lots = référence physique).
+    Retourne les écarts: product_id, name, ledger, batches, difference.
+    """
+    with db_cursor("reporting") as cur:
+        found = _discrepancies(_ledger_totals(cur), _batch_totals(cur))
+
+    product_ids = sorted(found)
+    if correct and product_ids:
+        with transaction() as cur:
+            found = {}
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                found.update(_discrepancies(_ledger_totals(cur, chunk), _batch_totals(cur, chunk)))
+            cur.executemany(
+                "INSERT INTO stock_movements(product_id, type, quantity, reason) VALUES(?, 'ADJUST', ?, ?)",
+                [(pid, batches - ledger, reason) for pid, (ledger, batches) in found.items()],
+            )
+        product_ids = sorted(found)
+
+    names: dict[int, str] = {}
+    with db_cursor() as cur:
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            cur.execute(f"SELECT id, name FROM products WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            names.update((row["id"], row["name"]) for row in cur.fetchall())
+    return [
+        {
+            "product_id": pid,
+            "name": names.get(pid),
+            "ledger": found[pid][0],
+            "batches": found[pid][1],
+            "difference": found[pid][1] - found[pid][0],
+        }
+        for pid in product_ids
+    ]
@@ -1,11 +1,29 @@
+import re
+import sqlite3
 import time
 from random import randint
 
-from pharmacy_pos.database import db_cursor
+from pharmacy_pos.database import db_cursor, transaction
+from pharmacy_pos.services.alert_service import evaluate_alerts
+from pharmacy_pos.services.catalog_service import note_product_change
+from pharmacy_pos.services.stock_service import ensure_stock_counters_current
+from pharmacy_pos.trigrams import index_products, similar_words, unindex_products, words
+from pharmacy_pos.writer import serialized_write
 
+# Recherche approchée: similarité minimale (Jaccard sur les trigrammes)
+# entre un mot saisi et un mot du catalogue.
+FUZZY_MIN_SIMILARITY = 0.4
+# Mots plus courts: pas de correction, simple préfixe.
+FUZZY_MIN_WORD_LENGTH = 3
+# Corrections retenues pour un mot: la meilleure et celles à moins de cet écart.
+FUZZY_ALTERNATIVE_SPREAD = 0.15
+# En dessous de ce nombre de résultats exacts, search_products complète
+# avec la recherche approchée.
+FUZZY_FALLBACK_BELOW = 3
 
-def create_category(name: str) -> int:
-    with db_cursor() as cur:
+
+def create_category(name: str, cur: sqlite3.Cursor | None = None) -> int:
+    with transaction(cur) as cur:
         cur.execute("INSERT OR IGNORE INTO categories(name) VALUES(?)", (name,))
         cur.execute("SELECT id FROM categories WHERE name = ?", (name,))
         return cur.fetchone()["id"]
@@ -17,6 +35,7 @@ def generate_barcode() -> str:
     return f"AUTO{stamp}{suffix}"
 
 
+@serialized_write
 def create_product(
     name: str,
     barcode: str | None,
@@ -41,8 +60,8 @@ def create_product(
     if not clean_barcode:
         clean_barcode = generate_barcode()
 
-    category_id = create_category(category_name)
-    with db_cursor() as cur:
+    with transaction() as cur:
+        category_id = create_category(category_name, cur)
         cur.execute(
             """
             INSERT INTO products(
@@ -61,38 +80,70 @@ def create_product(
                 min_stock,
             ),
         )
-        return cur.lastrowid
+        product_id = cur.lastrowid
+        index_products(cur, [name])
+        note_product_change(cur, product_id)
+        evaluate_alerts(cur, [product_id], {})
+        return product_id
+
+
+def update_product_prices(
+    product_id: int,
+    buy_price: float,
+    sell_price: float,
+    tva: float,
+    cur: sqlite3.Cursor | None = None,
+) -> None:
+    if buy_price < 0 or sell_price < 0 or tva < 0:
+        raise ValueError("Les valeurs numériques doivent être positives")
+
+    with transaction(cur) as cur:
+        cur.execute(
+            "UPDATE products SET buy_price = ?, sell_price = ?, tva = ? WHERE id = ?",
+            (buy_price, sell_price, tva, product_id),
+        )
+        if cur.rowcount == 0:
+            raise ValueError("Produit introuvable")
+        note_product_change(cur, product_id)
 
 
 def delete_product(product_id: int) -> None:
-    with db_cursor() as cur:
-        cur.execute("SELECT id FROM products WHERE id = ?", (product_id,))
-        if cur.fetchone() is None:
+    with transaction() as cur:
+        cur.execute("SELECT name FROM products WHERE id = ?", (product_id,))
+        product = cur.fetchone()
+        if product is None:
             raise ValueError("Produit introuvable")
 
         cur.execute("SELECT COUNT(*) AS n FROM sale_items WHERE product_id = ?", (product_id,))
         if cur.fetchone()["n"] > 0:
             raise ValueError("Suppression impossible: produit déjà lié à des ventes")
 
-        cur.execute("SELECT COUNT(*) AS n FROM stock_movements WHERE product_id = ?", (product_id,))
+        cur.execute(
+            """
+            SELECT EXISTS(SELECT 1 FROM stock_movements WHERE product_id = ?)
+                OR EXISTS(SELECT 1 FROM stock_movements_archive WHERE product_id = ?) AS n
+            """,
+            (product_id, product_id),
+        )
         if cur.fetchone()["n"] > 0:
             raise ValueError("Suppression impossible: produit déjà lié à des mouvements de stock")
 
         cur.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        unindex_products(cur, [product["name"]])
+        note_product_change(cur, product_id)
 
 
 def list_products() -> list[dict]:
+    ensure_stock_counters_current()
     with db_cursor() as cur:
         cur.execute(
             """
             SELECT p.id, p.name, p.barcode, c.name AS category,
                    p.buy_price, p.sell_price, p.tva, p.min_stock,
                    p.requires_prescription,
-                   COALESCE(SUM(b.quantity), 0) AS stock
+                   p.stock_total AS stock, p.stock_valid
             FROM products p
             LEFT JOIN categories c ON c.id = p.category_id
-            LEFT JOIN batches b ON b.product_id = p.id
-            GROUP BY p.id
             ORDER BY p.name ASC
             """
         )
@@ -100,7 +151,88 @@ def list_products() -> list[dict]:
     return [dict(row) for row in rows]
 
 
+def list_products_page(
+    after: tuple[str, int] | None = None,
+    limit: int = 200,
+    category: str | None = None,
+    low_stock: bool = False,
+    prescription_only: bool = False,
+) -> list[dict]:
+    """Page du catalogue triée par (nom, id).
+
+    Pagination par clé: `after` est le couple (nom, id) du dernier produit
+    de la page précédente. Le coût d'une page ne dépend pas de sa position
+    dans le catalogue (lecture par idx_products_name, sans OFFSET).
+    """
+    clauses = []
+    params: list = []
+    if after is not None:
+        clauses.append("(p.name, p.id) > (?, ?)")
+        params.extend(after)
+    if category:
+        clauses.append("p.category_id = (SELECT id FROM categories WHERE name = ?)")
+        params.append(category)
+    if low_stock:
+        ensure_stock_counters_current()
+        clauses.append("p.stock_total <= p.min_stock")
+    if prescription_only:
+        clauses.append("p.requires_prescription = 1")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    with db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT p.id, p.name, p.barcode, c.name AS category,
+                   p.buy_price, p.sell_price, p.tva, p.min_stock,
+                   p.requires_prescription,
+                   p.stock_total AS stock, p.stock_valid
+            FROM products p
+            LEFT JOIN categories c ON c.id = p.category_id
+            {where}
+            ORDER BY p.name ASC, p.id ASC
+            LIMIT ?
+            """,
+            (*params, limit),
+        )
+        rows = cur.fetchall()
+    return [dict(row) for row in rows]
+
+
+def list_categories() -> list[str]:
+    with db_cursor() as cur:
+        cur.execute("SELECT name FROM categories ORDER BY name ASC")
+        return [row["name"] for row in cur.fetchall()]
+
+
+_fts_available: bool | None = None
+_WORD = re.compile(r"\w+")
+
+
+def _has_fts(cur) -> bool:
+    global _fts_available
+    if _fts_available is None:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        _fts_available = cur.fetchone() is not None
+    return _fts_available
+
+
+def fts_query(term: str) -> str | None:
+    """Transforme la saisie en requête FTS5: chaque mot devient un préfixe."""
+    words = _WORD.findall(term)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
 def search_products(term: str, limit: int = 30) -> list[dict]:
+    """Recherche catalogue pour la caisse.
+
+    - code-barres exact: lecture directe par index unique;
+    - sinon recherche plein texte (préfixes, insensible aux accents),
+      classée par pertinence puis par nom;
+    - si elle trouve moins de FUZZY_FALLBACK_BELOW produits, complétée par
+      la recherche approchée (fautes de frappe).
+    """
     clean = term.strip()
     with db_cursor() as cur:
         if not clean:
@@ -113,6 +245,31 @@ def search_products(term: str, limit: int = 30) -> list[dict]:
                 """,
                 (limit,),
             )
+            return [dict(row) for row in cur.fetchall()]
+
+        cur.execute(
+            "SELECT id, name, barcode, sell_price, requires_prescription FROM products WHERE barcode = ?",
+            (clean,),
+        )
+        rows = cur.fetchall()
+        if rows:
+            return [dict(row) for row in rows]
+
+        if _has_fts(cur):
+            query = fts_query(clean)
+            if query is None:
+                return []
+            cur.execute(
+                """
+                SELECT p.id, p.name, p.barcode, p.sell_price, p.requires_prescription
+                FROM products_fts f
+                JOIN products p ON p.id = f.rowid
+                WHERE products_fts MATCH ?
+                ORDER BY f.rank, p.name ASC
+                LIMIT ?
+                """,
+                (query, limit),
+            )
         else:
             like = f"%{clean}%"
             cur.execute(
@@ -125,5 +282,81 @@ def search_products(term: str, limit: int = 30) -> list[dict]:
                 """,
                 (like, like, limit),
             )
-        rows = cur.fetchall()
-    return [dict(row) for row in rows]
+        results = [dict(row) for row in cur.fetchall()]
+
+        if len(results) < min(FUZZY_FALLBACK_BELOW, limit):
+            seen = {row["id"] for row in results}
+            for row in _fuzzy_search(cur, clean, limit):
+                if len(results) >= limit:
+                    break
+                if row["id"] not in seen:
+                    results.append(row)
+    return results
+
+
+def fuzzy_search_products(term: str, limit: int = 30) -> list[dict]:
+    """Recherche tolérante aux fautes ("amoxiciline", "paracetemol").
+
+    Chaque mot saisi est rapproché des mots du catalogue via l'index
+    trigrammes du vocabulaire, puis les produits sont lus par l'index plein
+    texte (ou LIKE) sur les mots corrigés et classés par similarité.
+    """
+    with db_cursor() as cur:
+        return _fuzzy_search(cur, term, limit)
+
+
+def _fuzzy_search(cur: sqlite3.Cursor, term: str, limit: int) -> list[dict]:
+    # Pour chaque mot: {mot du vocabulaire: similarité}. Les mots courts ou
+    # numériques ("c", "1g", "500") sont gardés tels quels, en préfixe; un
+    # mot sans équivalent proche est ignoré.
+    alternatives: list[dict[str, float]] = []
+    prefixes: list[str] = []
+    for word in words(term):
+        if len(word) < FUZZY_MIN_WORD_LENGTH or word.isdigit():
+            prefixes.append(word)
+            continue
+        similar = similar_words(cur, word, FUZZY_MIN_SIMILARITY)
+        if similar:
+            best = similar[0][1]
+            alternatives.append({w: sim for w, sim in similar if sim >= best - FUZZY_ALTERNATIVE_SPREAD})
+    if not alternatives:
+        return []
+
+    if _has_fts(cur):
+        query = " AND ".join(
+            ["(" + " OR ".join(f'"{w}"' for w in alt) + ")" for alt in alternatives]
+            + [f'"{w}"*' for w in prefixes]
+        )
+        cur.execute(
+            """
+            SELECT p.id, p.name, p.barcode, p.sell_price, p.requires_prescription
+            FROM products_fts f
+            JOIN products p ON p.id = f.rowid
+            WHERE products_fts MATCH ?
+            LIMIT ?
+            """,
+            (query, limit * 10),
+        )
+    else:
+        clauses = []
+        params: list = []
+        for alt in [*alternatives, *({w: 1.0} for w in prefixes)]:
+            clauses.append("(" + " OR ".join("name LIKE ?" for _ in alt) + ")")
+            params.extend(f"%{w}%" for w in alt)
+        cur.execute(
+            f"""
+            SELECT id, name, barcode, sell_price, requires_prescription
+            FROM products
+            WHERE {" AND ".join(clauses)}
+            LIMIT ?
+            """,
+            (*params, limit * 10),
+        )
+
+    scored = []
+    for row in cur.fetchall():
+        name_words = words(row["name"])
+        score = sum(max((sim for w, sim in alt.items() if w in name_words), default=0.0) for alt in alternatives)
+        scored.append((-score, row["name"], dict(row)))
+    scored.sort(key=lambda item: item[:2])
+    return [item[2] for item in scored[:limit]]
@@ -1,10 +1,11 @@
 from pharmacy_pos.database import db_cursor
 
+# Bornes en plage sur created_at (texte ISO) pour utiliser idx_sales_created_at.
 PERIOD_SQL = {
-    "jour": "DATE(created_at) = DATE('now')",
-    "semaine": "DATE(created_at) >= DATE('now', '-6 day')",
-    "mois": "STRFTIME('%Y-%m', created_at) = STRFTIME('%Y-%m', 'now')",
-    "annee": "STRFTIME('%Y', created_at) = STRFTIME('%Y', 'now')",
+    "jour": "created_at >= DATE('now') AND created_at < DATE('now', '+1 day')",
+    "semaine": "created_at >= DATE('now', '-6 day') AND created_at < DATE('now', '+1 day')",
+    "mois": "created_at >= DATE('now', 'start of month') AND created_at < DATE('now', 'start of month', '+1 month')",
+    "annee": "created_at >= DATE('now', 'start of year') AND created_at < DATE('now', 'start of year', '+1 year')",
 }
 
 
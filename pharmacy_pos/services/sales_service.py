@@ -1,25 +1,63 @@
-from pharmacy_pos.database import db_cursor
-from pharmacy_pos.services.stock_service import reserve_stock_fifo
+import sqlite3
 
+from pharmacy_pos.database import db_cursor, retry_on_busy, transaction
+from pharmacy_pos.services.allocation_service import LotChanges
+from pharmacy_pos.services.catalog_service import catalog_entries
+from pharmacy_pos.services.stock_service import apply_allocations
+from pharmacy_pos.writer import serialized_write
 
-def create_sale(cashier_id: int, items: list[dict], payment_method: str) -> int:
+
+@serialized_write
+@retry_on_busy
+def create_sale(
+    cashier_id: int,
+    items: list[dict],
+    payment_method: str,
+    cur: sqlite3.Cursor | None = None,
+    idempotency_key: str | None = None,
+) -> int:
     """
     items: [{product_id:int, quantity:int, prescription_ok?:bool}]
+
+    La vente (réservation FIFO comprise) est une seule transaction: un échec
+    sur une ligne n'altère aucun lot. Les produits viennent de l'index
+    catalogue et les plans FEFO du cache d'allocation (ou de requêtes si
+    ces caches sont périmés), les lignes sont écrites par lots (executemany).
+
+    `idempotency_key`: clé générée par la caisse pour un panier. Si une vente
+    porte déjà cette clé (nouvelle soumission après un délai dépassé, rejeu),
+    son id est retourné sans nouvelle allocation.
     """
     if not items:
         raise ValueError("Le panier est vide")
 
-    with db_cursor() as cur:
+    product_ids = sorted({int(item["product_id"]) for item in items})
+    placeholders = ",".join("?" * len(product_ids))
+
+    with transaction(cur) as cur:
+        if idempotency_key is not None:
+            # Lu sous le verrou d'écriture: deux soumissions ne peuvent pas passer toutes les deux.
+            cur.execute("SELECT id FROM sales WHERE idempotency_key = ?", (idempotency_key,))
+            existing = cur.fetchone()
+            if existing is not None:
+                return existing["id"]
+
+        # Index catalogue en mémoire s'il est à jour, sinon une seule lecture SQL.
+        products = catalog_entries(cur, product_ids)
+        if products is None:
+            cur.execute(
+                f"SELECT id, sell_price, tva, requires_prescription FROM products WHERE id IN ({placeholders})",
+                tuple(product_ids),
+            )
+            products = {row["id"]: row for row in cur.fetchall()}
+        lots = LotChanges(cur, [pid for pid in product_ids if pid in products], for_allocation=True)
+
         total_ht = 0.0
         total_tva = 0.0
 
         prepared_lines: list[dict] = []
         for item in items:
-            cur.execute(
-                "SELECT id, sell_price, tva, requires_prescription FROM products WHERE id = ?",
-                (item["product_id"],),
-            )
-            product = cur.fetchone()
+            product = products.get(int(item["product_id"]))
             if product is None:
                 raise ValueError(f"Produit introuvable: {item['product_id']}")
 
@@ -27,7 +65,7 @@ def create_sale(cashier_id: int, items: list[dict], payment_method: str) -> int:
                 raise ValueError(f"Ordonnance requise pour le produit #{product['id']}")
 
             qty = int(item["quantity"])
-            allocations = reserve_stock_fifo(product["id"], qty)
+            allocations = lots.allocate(product["id"], qty)
             line_total = product["sell_price"] * qty
             line_tva = line_total * (product["tva"] / 100.0)
             total_ht += line_total
@@ -41,24 +79,24 @@ def create_sale(cashier_id: int, items: list[dict], payment_method: str) -> int:
                 }
             )
 
+        apply_allocations(cur, [alloc for line in prepared_lines for alloc in line["allocations"]])
+
         total_ttc = total_ht + total_tva
 
         cur.execute(
             """
-            INSERT INTO sales(cashier_id, total_ht, total_tva, total_ttc, payment_method)
-            VALUES(?, ?, ?, ?, ?)
+            INSERT INTO sales(cashier_id, total_ht, total_tva, total_ttc, payment_method, idempotency_key)
+            VALUES(?, ?, ?, ?, ?, ?)
             """,
-            (cashier_id, total_ht, total_tva, total_ttc, payment_method),
+            (cashier_id, total_ht, total_tva, total_ttc, payment_method, idempotency_key),
         )
         sale_id = cur.lastrowid
 
+        item_rows = []
+        movement_rows = []
         for line in prepared_lines:
             for batch_id, qty_taken in line["allocations"]:
-                cur.execute(
-                    """
-                    INSERT INTO sale_items(sale_id, product_id, batch_id, quantity, unit_price, line_total)
-                    VALUES(?, ?, ?, ?, ?, ?)
-                    """,
+                item_rows.append(
                     (
                         sale_id,
                         line["product_id"],
@@ -66,16 +104,25 @@ def create_sale(cashier_id: int, items: list[dict], payment_method: str) -> int:
                         qty_taken,
                         line["unit_price"],
                         line["unit_price"] * qty_taken,
-                    ),
+                    )
                 )
+                movement_rows.append((line["product_id"], batch_id, qty_taken, f"Vente #{sale_id}"))
 
-                cur.execute(
-                    """
-                    INSERT INTO stock_movements(product_id, type, quantity, reason)
-                    VALUES(?, 'OUT', ?, ?)
-                    """,
-                    (line["product_id"], qty_taken, f"Vente #{sale_id}"),
-                )
+        cur.executemany(
+            """
+            INSERT INTO sale_items(sale_id, product_id, batch_id, quantity, unit_price, line_total)
+            VALUES(?, ?, ?, ?, ?, ?)
+            """,
+            item_rows,
+        )
+        cur.executemany(
+            """
+            INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason)
+            VALUES(?, ?, 'OUT', ?, ?)
+            """,
+            movement_rows,
+        )
+        lots.commit(cur)
 
         return sale_id
 
@@ -134,8 +181,10 @@ def get_sale_summary(sale_id: int) -> dict | None:
     return None if row is None else dict(row)
 
 
-def cancel_sale(sale_id: int, reason: str = "Annulation ticket") -> None:
-    with db_cursor() as cur:
+@serialized_write
+@retry_on_busy
+def cancel_sale(sale_id: int, reason: str = "Annulation ticket", cur: sqlite3.Cursor | None = None) -> None:
+    with transaction(cur) as cur:
         cur.execute("SELECT id FROM sales WHERE id = ?", (sale_id,))
         if cur.fetchone() is None:
             raise ValueError("Vente introuvable")
@@ -144,37 +193,60 @@ def cancel_sale(sale_id: int, reason: str = "Annulation ticket") -> None:
         if cur.fetchone() is not None:
             raise ValueError("Cette vente est déjà annulée")
 
+        # Les quantités déjà retournées ont été remises en stock par le retour.
         cur.execute(
-            "SELECT product_id, batch_id, quantity FROM sale_items WHERE sale_id = ?",
+            """
+            SELECT si.product_id, si.batch_id, b.expiry_date,
+                   si.quantity - COALESCE((SELECT SUM(r.quantity) FROM returns r WHERE r.sale_item_id = si.id), 0) AS quantity
+            FROM sale_items si
+            LEFT JOIN batches b ON b.id = si.batch_id
+            WHERE si.sale_id = ?
+            """,
             (sale_id,),
         )
         rows = cur.fetchall()
         if not rows:
             raise ValueError("Aucune ligne de vente à annuler")
+        rows = [row for row in rows if row["quantity"] > 0]
 
+        lots = LotChanges(cur, sorted({row["product_id"] for row in rows}))
         for row in rows:
             cur.execute(
                 "UPDATE batches SET quantity = quantity + ? WHERE id = ?",
                 (row["quantity"], row["batch_id"]),
             )
+            lots.add(row["product_id"], row["batch_id"], row["quantity"], row["expiry_date"])
             cur.execute(
-                "INSERT INTO stock_movements(product_id, type, quantity, reason) VALUES(?, 'IN', ?, ?)",
-                (row["product_id"], row["quantity"], f"Annulation vente #{sale_id}"),
+                "INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason) VALUES(?, ?, 'IN', ?, ?)",
+                (row["product_id"], row["batch_id"], row["quantity"], f"Annulation vente #{sale_id}"),
             )
 
         cur.execute(
             "INSERT INTO sale_cancellations(sale_id, reason) VALUES(?, ?)",
             (sale_id, reason),
         )
+        lots.commit(cur)
 
 
-def return_sale_item(sale_item_id: int, quantity: int, reason: str = "Retour client") -> None:
+@serialized_write
+@retry_on_busy
+def return_sale_item(
+    sale_item_id: int,
+    quantity: int,
+    reason: str = "Retour client",
+    cur: sqlite3.Cursor | None = None,
+) -> None:
     if quantity <= 0:
         raise ValueError("Quantité de retour invalide")
 
-    with db_cursor() as cur:
+    with transaction(cur) as cur:
         cur.execute(
-            "SELECT id, sale_id, product_id, batch_id, quantity FROM sale_items WHERE id = ?",
+            """
+            SELECT si.id, si.sale_id, si.product_id, si.batch_id, si.quantity, b.expiry_date
+            FROM sale_items si
+            LEFT JOIN batches b ON b.id = si.batch_id
+            WHERE si.id = ?
+            """,
             (sale_item_id,),
         )
         row = cur.fetchone()
@@ -198,11 +270,14 @@ def return_sale_item(sale_item_id: int, quantity: int, reason: str = "Retour cli
             "INSERT INTO returns(sale_item_id, quantity, reason) VALUES(?, ?, ?)",
             (sale_item_id, quantity, reason),
         )
+        lots = LotChanges(cur, [row["product_id"]])
         cur.execute(
             "UPDATE batches SET quantity = quantity + ? WHERE id = ?",
             (quantity, row["batch_id"]),
         )
+        lots.add(row["product_id"], row["batch_id"], quantity, row["expiry_date"])
         cur.execute(
-            "INSERT INTO stock_movements(product_id, type, quantity, reason) VALUES(?, 'IN', ?, ?)",
-            (row["product_id"], quantity, f"Retour ligne #{sale_item_id}"),
+            "INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason) VALUES(?, ?, 'IN', ?, ?)",
+            (row["product_id"], row["batch_id"], quantity, f"Retour ligne #{sale_item_id}"),
         )
+        lots.commit(cur)
@@ -1,52 +1,259 @@
-from pharmacy_pos.database import db_cursor
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
 
+from pharmacy_pos.database import db_cursor, transaction
+from pharmacy_pos.services.allocation_service import LotChanges
+from pharmacy_pos.writer import serialized_write
 
-def add_stock(product_id: int, batch_number: str, expiry_date: str, quantity: int, reason: str = "Approvisionnement") -> int:
-    with db_cursor() as cur:
+# products.stock_total / stock_valid sont tenus à jour par les triggers sur
+# batches. stock_valid dépend de la date du jour: les lots qui expirent sont
+# retirés une fois par jour par roll_expired_stock().
+_counters_rolled_on: date | None = None
+
+_EXPECTED_COUNTERS_SQL = """
+    SELECT p.id, p.name, p.stock_total, p.stock_valid,
+           COALESCE(SUM(b.quantity), 0) AS expected_total,
+           COALESCE(SUM(CASE WHEN b.expiry_date >= DATE('now') THEN b.quantity ELSE 0 END), 0)
+               AS expected_valid
+    FROM products p
+    LEFT JOIN batches b ON b.product_id = p.id
+    {where}
+    GROUP BY p.id
+"""
+
+
+# Formats de saisie acceptés; la base ne contient que des dates ISO (AAAA-MM-JJ),
+# ce qui permet des comparaisons de chaînes et des parcours d'index par plage.
+_EXPIRY_INPUT_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+
+def normalize_expiry_date(value: str | date) -> str:
+    """Date de péremption au format ISO AAAA-MM-JJ (ValueError si invalide)."""
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()[:10]
+    for fmt in _EXPIRY_INPUT_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Date de péremption invalide: {value!r} (attendu AAAA-MM-JJ)")
+
+
+@serialized_write
+def add_stock(
+    product_id: int,
+    batch_number: str,
+    expiry_date: str,
+    quantity: int,
+    reason: str = "Approvisionnement",
+    cur: sqlite3.Cursor | None = None,
+) -> int:
+    expiry_date = normalize_expiry_date(expiry_date)
+    if quantity <= 0:
+        raise ValueError("Quantité invalide")
+
+    with transaction(cur) as cur:
+        lots = LotChanges(cur, [product_id])
         cur.execute(
             "INSERT INTO batches(product_id, batch_number, expiry_date, quantity) VALUES(?, ?, ?, ?)",
             (product_id, batch_number, expiry_date, quantity),
         )
         batch_id = cur.lastrowid
         cur.execute(
-            "INSERT INTO stock_movements(product_id, type, quantity, reason) VALUES(?, 'IN', ?, ?)",
-            (product_id, quantity, reason),
+            "INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason) VALUES(?, ?, 'IN', ?, ?)",
+            (product_id, batch_id, quantity, reason),
         )
+        lots.add(product_id, batch_id, quantity, expiry_date)
+        lots.commit(cur)
         return batch_id
 
 
+def receive_delivery(
+    lines: list[dict],
+    reason: str = "Réception livraison",
+    cur: sqlite3.Cursor | None = None,
+) -> list[int]:
+    """Réceptionne un bon de livraison en une seule transaction.
+
+    `lines`: [{"product_id", "batch_number", "expiry_date", "quantity"}, ...].
+    Les lignes d'un même produit/lot/péremption sont fusionnées. Retourne les
+    IDs des lots créés, dans l'ordre de première apparition des lignes.
+    """
+    if not lines:
+        raise ValueError("Bon de livraison vide")
+
+    merged: dict[tuple[int, str, str], int] = {}
+    for line in lines:
+        product_id = int(line["product_id"])
+        batch_number = str(line["batch_number"]).strip()
+        expiry_date = normalize_expiry_date(line["expiry_date"])
+        quantity = int(line["quantity"])
+        if not batch_number:
+            raise ValueError(f"Numéro de lot manquant (produit {product_id})")
+        if quantity <= 0:
+            raise ValueError(f"Quantité invalide (produit {product_id}, lot {batch_number})")
+        key = (product_id, batch_number, expiry_date)
+        merged[key] = merged.get(key, 0) + quantity
+
+    product_ids = sorted({key[0] for key in merged})
+    with transaction(cur) as cur:
+        cur.execute(
+            f"SELECT id FROM products WHERE id IN ({','.join('?' * len(product_ids))})",
+            product_ids,
+        )
+        unknown = set(product_ids) - {row["id"] for row in cur.fetchall()}
+        if unknown:
+            raise ValueError(f"Produit introuvable: {', '.join(map(str, sorted(unknown)))}")
+        lots = LotChanges(cur, product_ids)
+
+        cur.executemany(
+            "INSERT INTO batches(product_id, batch_number, expiry_date, quantity) VALUES(?, ?, ?, ?)",
+            [(*key, quantity) for key, quantity in merged.items()],
+        )
+        # Écriture exclusive (BEGIN IMMEDIATE): les IDs des lots sont consécutifs.
+        cur.execute("SELECT last_insert_rowid() AS last_id")
+        last_id = cur.fetchone()["last_id"]
+        batch_ids = list(range(last_id - len(merged) + 1, last_id + 1))
+
+        cur.executemany(
+            "INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason) VALUES(?, ?, 'IN', ?, ?)",
+            [
+                (product_id, batch_id, quantity, reason)
+                for batch_id, ((product_id, _lot, _exp), quantity) in zip(batch_ids, merged.items())
+            ],
+        )
+        for batch_id, ((product_id, _lot, expiry_date), quantity) in zip(batch_ids, merged.items()):
+            lots.add(product_id, batch_id, quantity, expiry_date)
+        lots.commit(cur)
+    return batch_ids
+
+
 def get_total_stock(product_id: int) -> int:
     with db_cursor() as cur:
-        cur.execute("SELECT COALESCE(SUM(quantity), 0) AS total FROM batches WHERE product_id = ?", (product_id,))
+        cur.execute(
+            "SELECT COALESCE((SELECT stock_total FROM products WHERE id = ?), 0) AS total",
+            (product_id,),
+        )
         return cur.fetchone()["total"]
 
 
 def get_low_stock_products() -> list[dict]:
+    ensure_stock_counters_current()
     with db_cursor() as cur:
+        # Le filtre reprend la condition de l'index partiel idx_products_low_stock.
         cur.execute(
             """
-            SELECT p.id, p.name, p.min_stock, COALESCE(SUM(b.quantity), 0) AS stock
-            FROM products p
-            LEFT JOIN batches b ON b.product_id = p.id
-            GROUP BY p.id
-            HAVING stock <= p.min_stock
-            ORDER BY stock ASC
+            SELECT id, name, min_stock, stock_total AS stock
+            FROM products
+            WHERE stock_total <= min_stock
+            ORDER BY stock_total ASC
             """
         )
         rows = cur.fetchall()
     return [dict(row) for row in rows]
 
 
+def _today() -> date:
+    # Même référence que DATE('now') côté SQLite (UTC).
+    return datetime.now(timezone.utc).date()
+
+
+def roll_expired_stock(cur: sqlite3.Cursor | None = None) -> int:
+    """Retire de stock_valid les lots expirés depuis le dernier passage.
+
+    Retourne le nombre de produits recalculés.
+    """
+    global _counters_rolled_on
+    rolled_on = _today()
+    today = rolled_on.isoformat()
+    with transaction(cur) as cur:
+        cur.execute("SELECT value FROM app_meta WHERE key = 'stock_valid_as_of'")
+        row = cur.fetchone()
+        as_of = row["value"] if row is not None else ""
+        refreshed = 0
+        if as_of < today:
+            cur.execute(
+                """
+                UPDATE products
+                SET stock_valid = COALESCE((
+                    SELECT SUM(quantity) FROM batches b
+                    WHERE b.product_id = products.id AND b.expiry_date >= DATE('now')
+                ), 0)
+                WHERE id IN (
+                    SELECT product_id FROM batches
+                    WHERE quantity > 0 AND expiry_date >= ? AND expiry_date < ?
+                )
+                """,
+                (as_of, today),
+            )
+            refreshed = cur.rowcount
+            cur.execute(
+                "INSERT OR REPLACE INTO app_meta(key, value) VALUES('stock_valid_as_of', ?)",
+                (today,),
+            )
+    _counters_rolled_on = rolled_on
+    return refreshed
+
+
+def ensure_stock_counters_current() -> None:
+    if _counters_rolled_on != _today():
+        roll_expired_stock()
+
+
+def verify_stock_counters(product_ids: list[int] | None = None) -> list[dict]:
+    """Compare les compteurs de products au stock réel des lots (lecture seule)."""
+    where = ""
+    params: tuple = ()
+    if product_ids:
+        where = f"WHERE p.id IN ({','.join('?' * len(product_ids))})"
+        params = tuple(product_ids)
+    with db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT * FROM ({_EXPECTED_COUNTERS_SQL.format(where=where)})
+            WHERE stock_total != expected_total OR stock_valid != expected_valid
+            ORDER BY id ASC
+            """,
+            params,
+        )
+        rows = cur.fetchall()
+    return [dict(row) for row in rows]
+
+
+def rebuild_stock_counters(cur: sqlite3.Cursor | None = None) -> list[dict]:
+    """Recalcule les compteurs depuis batches et retourne les écarts corrigés."""
+    with transaction(cur) as cur:
+        cur.execute(
+            f"""
+            SELECT * FROM ({_EXPECTED_COUNTERS_SQL.format(where="")})
+            WHERE stock_total != expected_total OR stock_valid != expected_valid
+            ORDER BY id ASC
+            """
+        )
+        drift = [dict(row) for row in cur.fetchall()]
+        cur.executemany(
+            "UPDATE products SET stock_total = ?, stock_valid = ? WHERE id = ?",
+            [(row["expected_total"], row["expected_valid"], row["id"]) for row in drift],
+        )
+    return drift
+
+
 def get_expiring_batches(days: int = 90) -> list[dict]:
+    """Lots en stock expirant d'ici `days` jours (déjà expirés compris).
+
+    Comparaison directe sur expiry_date (ISO): parcours par plage de
+    idx_batches_expiry, déjà trié.
+    """
     with db_cursor() as cur:
         cur.execute(
             """
             SELECT b.id, p.name AS product_name, b.batch_number, b.expiry_date, b.quantity
             FROM batches b
             JOIN products p ON p.id = b.product_id
-            WHERE b.quantity > 0
-              AND DATE(b.expiry_date) <= DATE('now', '+' || ? || ' day')
-            ORDER BY DATE(b.expiry_date) ASC
+            WHERE b.expiry_date <= DATE('now', '+' || ? || ' day')
+              AND b.quantity > 0
+            ORDER BY b.expiry_date ASC
             """,
             (days,),
         )
@@ -54,40 +261,97 @@ def get_expiring_batches(days: int = 90) -> list[dict]:
     return [dict(row) for row in rows]
 
 
-def reserve_stock_fifo(product_id: int, quantity: int) -> list[tuple[int, int]]:
-    """Retourne liste de (batch_id, qty_pris) en FIFO par date de péremption.
-    Les lots expirés sont exclus.
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def get_expiry_calendar(days: int = 180, bucket: str = "month") -> list[dict]:
+    """Calendrier des péremptions à venir, par semaine (lundi) ou par mois.
+
+    Pour chaque période de [aujourd'hui, aujourd'hui + days[: nombre de lots,
+    quantités et valeur du stock concerné (prix d'achat et prix de vente).
+    Les périodes sans péremption sont présentes avec des zéros.
     """
-    remaining = quantity
-    allocations: list[tuple[int, int]] = []
+    if bucket not in ("week", "month"):
+        raise ValueError("Période invalide (week ou month)")
+    if days <= 0:
+        raise ValueError("Horizon invalide")
 
-    with db_cursor() as cur:
+    with db_cursor("reporting") as cur:
+        cur.execute("SELECT DATE('now') AS today, DATE('now', '+' || ? || ' day') AS horizon", (days,))
+        bounds = cur.fetchone()
+        # Agrégat par date sur la plage de idx_batches_expiry, puis regroupement en Python.
         cur.execute(
             """
-            SELECT id, quantity
-            FROM batches
-            WHERE product_id = ?
-              AND quantity > 0
-              AND DATE(expiry_date) >= DATE('now')
-            ORDER BY expiry_date ASC, id ASC
+            SELECT b.expiry_date,
+                   COUNT(*) AS batches,
+                   SUM(b.quantity) AS quantity,
+                   SUM(b.quantity * p.buy_price) AS stock_value,
+                   SUM(b.quantity * p.sell_price) AS sale_value
+            FROM batches b
+            JOIN products p ON p.id = b.product_id
+            WHERE b.expiry_date >= ? AND b.expiry_date < ?
+              AND b.quantity > 0
+            GROUP BY b.expiry_date
             """,
-            (product_id,),
+            (bounds["today"], bounds["horizon"]),
         )
-        batches = cur.fetchall()
-
-        for batch in batches:
-            if remaining <= 0:
-                break
-            available = batch["quantity"]
-            take = min(available, remaining)
-            if take > 0:
-                allocations.append((batch["id"], take))
-                remaining -= take
-
-        if remaining > 0:
-            raise ValueError("Stock insuffisant (lots valides non expirés)")
-
-        for batch_id, take in allocations:
-            cur.execute("UPDATE batches SET quantity = quantity - ? WHERE id = ?", (take, batch_id))
+        per_day = cur.fetchall()
+
+    today = date.fromisoformat(bounds["today"])
+    horizon = date.fromisoformat(bounds["horizon"])
+    calendar: dict[date, dict] = {}
+    start = _bucket_start(today, bucket)
+    while start < horizon:
+        end = _next_bucket(start, bucket)
+        calendar[start] = {
+            "start": start.isoformat(),
+            "end": (end - timedelta(days=1)).isoformat(),
+            "batches": 0,
+            "quantity": 0,
+            "stock_value": 0.0,
+            "sale_value": 0.0,
+        }
+        start = end
+
+    for row in per_day:
+        entry = calendar[_bucket_start(date.fromisoformat(row["expiry_date"]), bucket)]
+        entry["batches"] += row["batches"]
+        entry["quantity"] += row["quantity"]
+        entry["stock_value"] += row["stock_value"]
+        entry["sale_value"] += row["sale_value"]
+    return list(calendar.values())
+
+
+def apply_allocations(cur: sqlite3.Cursor, allocations: list[tuple[int, int]]) -> None:
+    if not allocations:
+        return
+    # Décrément conditionnel: un autre poste a pu vider le lot entre-temps.
+    cur.executemany(
+        "UPDATE batches SET quantity = quantity - ? WHERE id = ? AND quantity >= ?",
+        [(take, batch_id, take) for batch_id, take in allocations],
+    )
+    if cur.rowcount != len(allocations):
+        raise ValueError("Stock insuffisant (lot modifié par un autre poste)")
+
+
+def reserve_stock_fifo(product_id: int, quantity: int, cur: sqlite3.Cursor | None = None) -> list[tuple[int, int]]:
+    """Retourne liste de (batch_id, qty_pris) en FIFO par date de péremption.
+    Les lots expirés sont exclus.
+    Avec `cur`, la réservation fait partie de la transaction de l'appelant.
+    """
+    with transaction(cur) as cur:
+        lots = LotChanges(cur, [product_id], for_allocation=True)
+        allocations = lots.allocate(product_id, quantity)
+        apply_allocations(cur, allocations)
+        lots.commit(cur)
 
     return allocations
@@ -0,0 +1,194 @@
+"""Inventaire physique: sessions de comptage et ajustement en masse.
+
+Les comptages sont tenus en mémoire dans la session (aucune écriture ni
+lecture de stock par scan: les lots du périmètre sont chargés une fois à
+l'ouverture). À la validation, ils sont chargés dans une table temporaire,
+comparés aux lots par une seule requête, puis les écarts sont appliqués
+(lots + mouvements ADJUST) dans une seule transaction.
+"""
+import sqlite3
+
+from pharmacy_pos.database import db_cursor, transaction
+from pharmacy_pos.services.allocation_service import LotChanges
+
+_COUNTS_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS stocktake_counts (
+    batch_id INTEGER PRIMARY KEY,
+    counted INTEGER NOT NULL
+)
+"""
+
+
+class StocktakeSession:
+    """Session d'inventaire ouverte par `start_stocktake`."""
+
+    def __init__(
+        self,
+        stocktake_id: int,
+        category_id: int | None,
+        lots: dict[tuple[str, str], list[int]],
+        expected: dict[int, int],
+    ) -> None:
+        self.id = stocktake_id
+        self.category_id = category_id
+        # (code-barres, numéro de lot) -> ids des lots, dans l'ordre FEFO: un
+        # même numéro réceptionné plusieurs fois donne plusieurs lots.
+        self.lots = lots
+        self.expected = expected
+        self.batch_ids = set(expected)
+        self.scanned: dict[tuple[str, str], int] = {}
+        self.counts: dict[int, int] = {}
+
+    def scan(self, barcode: str, batch_number: str, quantity: int = 1) -> int:
+        """Ajoute `quantity` unités comptées au lot scanné. Retourne le total compté.
+
+        Si le numéro de lot correspond à plusieurs lots, le total scanné est
+        réparti dans l'ordre FEFO: chaque lot reçoit au plus sa quantité
+        attendue, le surplus va au dernier.
+        """
+        key = (barcode.strip(), batch_number.strip())
+        batch_ids = self.lots.get(key)
+        if batch_ids is None:
+            raise ValueError(f"Lot inconnu dans le périmètre: {barcode} / {batch_number}")
+        total = self.scanned.get(key, 0) + quantity
+        if total < 0:
+            raise ValueError("Quantité comptée négative")
+        remaining = total
+        for batch_id in batch_ids[:-1]:
+            counted = min(remaining, self.expected[batch_id])
+            self.set_count(batch_id, counted)
+            remaining -= counted
+        self.set_count(batch_ids[-1], remaining)
+        self.scanned[key] = total
+        return total
+
+    def set_count(self, batch_id: int, quantity: int) -> int:
+        """Fixe le comptage d'un lot (saisie manuelle ou recomptage)."""
+        if batch_id not in self.batch_ids:
+            raise ValueError(f"Lot hors périmètre: {batch_id}")
+        if quantity < 0:
+            raise ValueError("Quantité comptée négative")
+        self.counts[batch_id] = quantity
+        return quantity
+
+    def _load_counts(self, cur: sqlite3.Cursor, zero_uncounted: bool) -> None:
+        cur.execute(_COUNTS_TABLE)
+        cur.execute("DELETE FROM temp.stocktake_counts")
+        cur.executemany("INSERT INTO temp.stocktake_counts(batch_id, counted) VALUES(?, ?)", self.counts.items())
+        if zero_uncounted:
+            # Inventaire complet: un lot du périmètre non compté est à zéro.
+            cur.executemany(
+                "INSERT OR IGNORE INTO temp.stocktake_counts(batch_id, counted) VALUES(?, 0)",
+                ((batch_id,) for batch_id in self.batch_ids),
+            )
+
+    def _differences(self, cur: sqlite3.Cursor) -> list[sqlite3.Row]:
+        cur.execute(
+            """
+            SELECT b.id AS batch_id, b.product_id, b.batch_number, b.expiry_date,
+                   b.quantity AS expected, c.counted
+            FROM temp.stocktake_counts c
+            JOIN batches b ON b.id = c.batch_id
+            WHERE b.quantity != c.counted
+            ORDER BY b.product_id, b.id
+            """
+        )
+        return cur.fetchall()
+
+    def preview(self, zero_uncounted: bool = False) -> list[dict]:
+        """Écarts entre comptages et lots, sans rien écrire."""
+        with db_cursor() as cur:
+            self._load_counts(cur, zero_uncounted)
+            rows = [dict(row) for row in self._differences(cur)]
+            cur.execute("DROP TABLE temp.stocktake_counts")
+        return rows
+
+    def commit(self, zero_uncounted: bool = False) -> dict:
+        """Applique les écarts en une transaction. Retourne
+        {"counted", "adjusted", "delta"}."""
+        reason = f"Inventaire #{self.id}"
+        with transaction() as cur:
+            cur.execute("SELECT status FROM stocktakes WHERE id = ?", (self.id,))
+            row = cur.fetchone()
+            if row is None or row["status"] != "open":
+                raise ValueError("Inventaire déjà clôturé")
+
+            self._load_counts(cur, zero_uncounted)
+            cur.execute(
+                """
+                INSERT INTO stocktake_lines(stocktake_id, batch_id, product_id, expected, counted)
+                SELECT ?, b.id, b.product_id, b.quantity, c.counted
+                FROM temp.stocktake_counts c
+                JOIN batches b ON b.id = c.batch_id
+                """,
+                (self.id,),
+            )
+            counted = cur.rowcount
+            differences = self._differences(cur)
+            lots = LotChanges(cur, sorted({row["product_id"] for row in differences}))
+            cur.executemany(
+                "UPDATE batches SET quantity = ? WHERE id = ?",
+                [(row["counted"], row["batch_id"]) for row in differences],
+            )
+            cur.executemany(
+                "INSERT INTO stock_movements(product_id, batch_id, type, quantity, reason) VALUES(?, ?, 'ADJUST', ?, ?)",
+                [(row["product_id"], row["batch_id"], row["counted"] - row["expected"], reason) for row in differences],
+            )
+            for row in differences:
+                lots.add(row["product_id"], row["batch_id"], row["counted"] - row["expected"], row["expiry_date"])
+            lots.commit(cur)
+            cur.execute(
+                """
+                UPDATE stocktakes
+                SET status = 'committed', closed_at = CURRENT_TIMESTAMP, counted_lines = ?, adjusted_lines = ?
+                WHERE id = ?
+                """,
+                (counted, len(differences), self.id),
+            )
+            cur.execute("DROP TABLE temp.stocktake_counts")
+        return {
+            "counted": counted,
+            "adjusted": len(differences),
+            "delta": sum(row["counted"] - row["expected"] for row in differences),
+        }
+
+    def cancel(self) -> None:
+        with transaction() as cur:
+            cur.execute(
+                "UPDATE stocktakes SET status = 'canceled', closed_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'open'",
+                (self.id,),
+            )
+        self.scanned.clear()
+        self.counts.clear()
+
+
+def start_stocktake(user_id: int | None = None, category: str | None = None) -> StocktakeSession:
+    """Ouvre une session d'inventaire (tout le stock ou une catégorie)."""
+    with transaction() as cur:
+        category_id = None
+        if category:
+            cur.execute("SELECT id FROM categories WHERE name = ?", (category,))
+            row = cur.fetchone()
+            if row is None:
+                raise ValueError("Catégorie introuvable")
+            category_id = row["id"]
+
+        cur.execute("INSERT INTO stocktakes(user_id, category_id) VALUES(?, ?)", (user_id, category_id))
+        stocktake_id = cur.lastrowid
+        cur.execute(
+            f"""
+            SELECT b.id, p.barcode, b.batch_number, b.quantity
+            FROM batches b
+            JOIN products p ON p.id = b.product_id
+            {"WHERE p.category_id = ?" if category_id is not None else ""}
+            ORDER BY b.expiry_date, b.id
+            """,
+            (category_id,) if category_id is not None else (),
+        )
+        lots: dict[tuple[str, str], list[int]] = {}
+        expected: dict[int, int] = {}
+        for row in cur.fetchall():
+            lots.setdefault((row["barcode"], row["batch_number"]), []).append(row["id"])
+            expected[row["id"]] = row["quantity"]
+    return StocktakeSession(stocktake_id, category_id, lots, expected)
+
@@ -0,0 +1,104 @@
+"""Index trigrammes du vocabulaire des noms de produits.
+
+Les noms sont découpés en mots normalisés (minuscules, sans accents).
+Chaque mot distinct est rangé une seule fois dans `search_vocabulary`
+(avec le nombre de produits qui l'emploient) et découpé en trigrammes dans
+`vocabulary_trigrams`: "amoxicilline" -> " am", "amo", ..., "ne ".
+Une faute de frappe se corrige donc sur quelques milliers de mots, pas sur
+tout le catalogue.
+"""
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from collections.abc import Iterable
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def words(text: str) -> list[str]:
+    return _WORD.findall(normalize_text(text))
+
+
+def trigrams(word: str) -> set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def index_products(cur: sqlite3.Cursor, names: Iterable[str]) -> None:
+    """Ajoute au vocabulaire les mots des noms de produits créés."""
+    counts = Counter(word for name in names for word in set(words(name)))
+    if not counts:
+        return
+    cur.executemany(
+        """
+        INSERT INTO search_vocabulary(word, products) VALUES(?, ?)
+        ON CONFLICT(word) DO UPDATE SET products = products + excluded.products
+        """,
+        counts.items(),
+    )
+    cur.executemany(
+        "INSERT OR IGNORE INTO vocabulary_trigrams(trigram, word) VALUES(?, ?)",
+        ((gram, word) for word in counts for gram in trigrams(word)),
+    )
+
+
+def unindex_products(cur: sqlite3.Cursor, names: Iterable[str]) -> None:
+    """Retire du vocabulaire les mots des produits supprimés."""
+    counts = Counter(word for name in names for word in set(words(name)))
+    if not counts:
+        return
+    cur.executemany(
+        "UPDATE search_vocabulary SET products = products - ? WHERE word = ?",
+        ((n, word) for word, n in counts.items()),
+    )
+    placeholders = ",".join("?" for _ in counts)
+    cur.execute(
+        f"SELECT word FROM search_vocabulary WHERE products <= 0 AND word IN ({placeholders})",
+        tuple(counts),
+    )
+    unused = [row["word"] for row in cur.fetchall()]
+    if unused:
+        cur.executemany("DELETE FROM search_vocabulary WHERE word = ?", ((word,) for word in unused))
+        cur.executemany(
+            "DELETE FROM vocabulary_trigrams WHERE trigram = ? AND word = ?",
+            ((gram, word) for word in unused for gram in trigrams(word)),
+        )
+
+
+def rebuild_vocabulary(cur: sqlite3.Cursor) -> None:
+    cur.execute("DELETE FROM search_vocabulary")
+    cur.execute("DELETE FROM vocabulary_trigrams")
+    cur.execute("SELECT name FROM products")
+    index_products(cur, [row["name"] for row in cur.fetchall()])
+
+
+def similar_words(cur: sqlite3.Cursor, word: str, min_similarity: float, limit: int = 5) -> list[tuple[str, float]]:
+    """Mots du vocabulaire proches de `word` (similarité de Jaccard sur les
+    trigrammes), du plus proche au moins proche."""
+    grams = trigrams(word)
+    placeholders = ",".join("?" for _ in grams)
+    # Deux ensembles de similarité >= s partagent au moins s * |grams| trigrammes.
+    cur.execute(
+        f"""
+        SELECT word, COUNT(*) AS shared
+        FROM vocabulary_trigrams
+        WHERE trigram IN ({placeholders})
+        GROUP BY word
+        HAVING COUNT(*) >= ?
+        """,
+        (*grams, max(1, int(min_similarity * len(grams)))),
+    )
+    scored = []
+    for row in cur.fetchall():
+        candidate = row["word"]
+        similarity = row["shared"] / (len(grams) + len(trigrams(candidate)) - row["shared"])
+        if similarity >= min_similarity:
+            scored.append((candidate, similarity))
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return scored[:limit]
@@ -1,21 +1,42 @@
 import tkinter as tk
+import uuid
 from tkinter import filedialog, messagebox, simpledialog, ttk
 
+from pharmacy_pos.services.alert_service import acknowledge_alert, count_unacknowledged_alerts, list_active_alerts
 from pharmacy_pos.services.auth_service import User, authenticate, create_user, delete_user, list_users
 from pharmacy_pos.services.bootstrap_service import bootstrap
-from pharmacy_pos.services.product_service import create_product, delete_product, list_products, search_products
+from pharmacy_pos.services.forecast_service import apply_suggested_min_stock, forecast_demand
+from pharmacy_pos.services.import_service import read_delivery_csv, read_stocktake_csv
+from pharmacy_pos.services.journal_service import submit_sale
+from pharmacy_pos.services.catalog_service import get_catalog_entry, lookup_by_barcode
+from pharmacy_pos.services.product_service import (
+    create_product,
+    delete_product,
+    list_categories,
+    list_products_page,
+    search_products,
+)
 from pharmacy_pos.services.report_service import sales_summary, top_products
 from pharmacy_pos.services.sales_service import (
     cancel_sale,
-    create_sale,
     get_sale_items,
     list_sales,
     return_sale_item,
 )
-from pharmacy_pos.services.stock_service import add_stock, get_expiring_batches, get_low_stock_products
+from pharmacy_pos.services.stock_service import (
+    add_stock,
+    get_expiring_batches,
+    get_expiry_calendar,
+    receive_delivery,
+)
+from pharmacy_pos.services.stocktake_service import start_stocktake
 from pharmacy_pos.utils.report_export import export_reports_csv
 from pharmacy_pos.utils.ticket_export import export_ticket_text
 
+ALL_CATEGORIES = "Toutes"
+STOCK_PAGE_SIZE = 200
+ALERT_BADGE_REFRESH_MS = 5_000
+
 
 class Palette:
     BG = "#f4f6fb"
@@ -127,13 +148,16 @@ class DashboardFrame(ttk.Frame):
             text=f"Connecté: {self.user.username} ({self.user.role})",
             style="Subtitle.TLabel",
         ).pack(side="right", pady=(8, 0))
+        self.alert_badge = ttk.Label(header, text="", style="Subtitle.TLabel")
+        self.alert_badge.pack(side="right", padx=(0, 16), pady=(8, 0))
+        self.refresh_alert_badge()
 
         notebook = ttk.Notebook(self)
         notebook.pack(fill="both", expand=True, pady=(12, 0))
 
         notebook.add(PosTab(notebook, user.id), text="Caisse")
         notebook.add(StockTab(notebook, user.role), text="Stock")
-        notebook.add(ReportTab(notebook), text="Rapports")
+        notebook.add(ReportTab(notebook, user.role), text="Rapports")
         notebook.add(SalesHistoryTab(notebook), text="Historique")
 
         if user.role == "admin":
@@ -145,6 +169,16 @@ class DashboardFrame(ttk.Frame):
             style="Status.TLabel",
         ).pack(side="bottom", anchor="w", pady=(8, 0))
 
+    def refresh_alert_badge(self) -> None:
+        try:
+            count = count_unacknowledged_alerts()
+            self.alert_badge.configure(text=f"⚠ {count} alerte(s)" if count else "")
+        except Exception:
+            # Base verrouillée ou injoignable: on le signale et on réessaie au prochain tour.
+            self.alert_badge.configure(text="⚠ alertes indisponibles")
+        finally:
+            self.after(ALERT_BADGE_REFRESH_MS, self.refresh_alert_badge)
+
 
 class PosTab(ttk.Frame):
     def __init__(self, master, cashier_id: int):
@@ -191,6 +225,12 @@ class PosTab(ttk.Frame):
         ttk.Checkbutton(card, variable=self.prescription_ok, text="Vérifiée").grid(row=2, column=3, sticky="w")
         ttk.Button(card, text="Ajouter ligne", style="Secondary.TButton", command=self.add_line).grid(row=2, column=4, sticky="w")
 
+        self.scan_var = tk.StringVar()
+        ttk.Label(card, text="Scan code-barres", style="Field.TLabel").grid(row=3, column=0, sticky="w")
+        scan_entry = ttk.Entry(card, textvariable=self.scan_var, width=38)
+        scan_entry.grid(row=3, column=1, columnspan=2, sticky="w", padx=(0, 8))
+        scan_entry.bind("<Return>", self.on_scan)
+
         ttk.Entry(card, textvariable=self.search_var, width=30).grid(row=1, column=4, sticky="ew", padx=(8, 0))
         self.search_results.grid(row=2, column=5, rowspan=2, sticky="nsew", padx=(8, 0))
 
@@ -210,6 +250,9 @@ class PosTab(ttk.Frame):
         ttk.Button(actions, text="Valider vente", style="Primary.TButton", command=self.checkout).pack(side="right")
 
         self.items: list[dict] = []
+        # Clé d'idempotence du panier en cours: un second clic sur « Valider
+        # vente » (ou une nouvelle tentative) ne crée pas une deuxième vente.
+        self.sale_key: str | None = None
         card.columnconfigure(4, weight=1)
         card.columnconfigure(5, weight=1)
         card.rowconfigure(4, weight=1)
@@ -225,13 +268,30 @@ class PosTab(ttk.Frame):
             messagebox.showerror("Erreur", "ID produit et quantité invalides")
             return
 
+        self.append_item(product_id, quantity)
+
+    def append_item(self, product_id: int, quantity: int) -> None:
         rx_ok = bool(self.prescription_ok.get())
+        entry = get_catalog_entry(product_id)
+        label = entry["name"] if entry else f"Produit #{product_id}"
         self.items.append({"product_id": product_id, "quantity": quantity, "prescription_ok": rx_ok})
-        append_tree_row(self.lines, (f"Produit #{product_id}", quantity, "Oui" if rx_ok else "Non"))
+        self.sale_key = None
+        append_tree_row(self.lines, (label, quantity, "Oui" if rx_ok else "Non"))
         self.product_id_var.set("")
         self.quantity_var.set("1")
         self.prescription_ok.set(False)
 
+    def on_scan(self, _event=None) -> None:
+        barcode = self.scan_var.get().strip()
+        if not barcode:
+            return
+        entry = lookup_by_barcode(barcode)
+        self.scan_var.set("")
+        if entry is None:
+            messagebox.showerror("Erreur", f"Code-barres inconnu: {barcode}")
+            return
+        self.append_item(entry["id"], 1)
+
     def on_search_change(self, *_args) -> None:
         self.refresh_search_results()
 
@@ -261,17 +321,36 @@ class PosTab(ttk.Frame):
 
     def clear_lines(self) -> None:
         self.items.clear()
+        self.sale_key = None
         for iid in self.lines.get_children():
             self.lines.delete(iid)
 
     def checkout(self) -> None:
         try:
-            sale_id = create_sale(self.cashier_id, self.items, self.payment_var.get().strip())
+            if self.sale_key is None:
+                self.sale_key = uuid.uuid4().hex
+            result = submit_sale(
+                self.cashier_id, self.items, self.payment_var.get().strip(), idempotency_key=self.sale_key
+            )
         except Exception as exc:
             messagebox.showerror("Vente impossible", str(exc))
             return
 
-        messagebox.showinfo("Succès", f"Vente enregistrée ID={sale_id}")
+        replay = result["replay"]
+        if replay is not None and replay["conflicts"]:
+            messagebox.showwarning(
+                "Ventes hors ligne",
+                f"{replay['applied']} vente(s) hors ligne rejouée(s), {len(replay['conflicts'])} en conflit "
+                "(stock insuffisant ou produit modifié): à régulariser.",
+            )
+        if result["offline"]:
+            messagebox.showwarning(
+                "Hors ligne",
+                f"Base indisponible: vente enregistrée dans le journal local ({result['key'][:8]}), "
+                "elle sera transmise au retour de la base.",
+            )
+        else:
+            messagebox.showinfo("Succès", f"Vente enregistrée ID={result['sale_id']}")
         self.clear_lines()
 
 
@@ -302,8 +381,21 @@ class StockTab(ttk.Frame):
 
         alerts_controls = ttk.Frame(left, style="Card.TFrame")
         alerts_controls.pack(fill="x", pady=(0, 8))
-        ttk.Button(alerts_controls, text="Alertes stock bas", style="Primary.TButton", command=self.show_alerts).pack(side="left", padx=(0, 6))
-        ttk.Button(alerts_controls, text="Péremptions <= 90j", style="Secondary.TButton", command=self.show_expiry_alerts).pack(side="left")
+        ttk.Button(alerts_controls, text="Alertes", style="Primary.TButton", command=self.show_alerts).pack(side="left", padx=(0, 6))
+        ttk.Button(alerts_controls, text="Péremptions <= 90j", style="Secondary.TButton", command=self.show_expiry_alerts).pack(side="left", padx=(0, 6))
+        ttk.Button(alerts_controls, text="Calendrier péremptions", style="Secondary.TButton", command=self.show_expiry_calendar).pack(side="left")
+
+        filters = ttk.Frame(left, style="Card.TFrame")
+        filters.pack(fill="x", pady=(0, 8))
+        self.f_category = tk.StringVar(value=ALL_CATEGORIES)
+        self.f_low_stock = tk.BooleanVar(value=False)
+        self.f_rx = tk.BooleanVar(value=False)
+        ttk.Label(filters, text="Catégorie", style="Field.TLabel").pack(side="left", padx=(0, 6))
+        self.category_filter = ttk.Combobox(filters, textvariable=self.f_category, width=18, state="readonly")
+        self.category_filter.pack(side="left", padx=(0, 8))
+        self.category_filter.bind("<<ComboboxSelected>>", lambda _e: self.refresh_products())
+        ttk.Checkbutton(filters, text="Stock bas", variable=self.f_low_stock, command=self.refresh_products).pack(side="left", padx=(0, 6))
+        ttk.Checkbutton(filters, text="Ordonnance", variable=self.f_rx, command=self.refresh_products).pack(side="left")
 
         products_wrap = ttk.Frame(left, style="Card.TFrame")
         products_wrap.pack(fill="both", expand=True)
@@ -319,11 +411,12 @@ class StockTab(ttk.Frame):
             self.products.heading(col, text=txt)
             self.products.column(col, width=w, anchor="center" if col != "name" else "w")
 
-        products_scroll_y = ttk.Scrollbar(products_wrap, orient="vertical", command=self.products.yview)
-        self.products.configure(yscrollcommand=products_scroll_y.set)
+        self.products_scroll_y = ttk.Scrollbar(products_wrap, orient="vertical", command=self.products.yview)
+        self.products.configure(yscrollcommand=self.on_products_scroll)
+        self.page_pending = False
 
         self.products.pack(side="left", fill="both", expand=True)
-        products_scroll_y.pack(side="right", fill="y")
+        self.products_scroll_y.pack(side="right", fill="y")
         configure_tree_rows(self.products)
 
         ttk.Label(right, text="Nouveau produit", style="CardTitle.TLabel").grid(row=0, column=0, columnspan=2, sticky="w")
@@ -386,29 +479,64 @@ class StockTab(ttk.Frame):
 
         add_btn = ttk.Button(right, text="Ajouter stock", style="Secondary.TButton", command=self.add_stock_ui)
         add_btn.grid(row=16, column=0, columnspan=2, sticky="ew", pady=(8, 0))
+        delivery_btn = ttk.Button(right, text="Réception livraison (CSV)", style="Secondary.TButton", command=self.receive_delivery_ui)
+        delivery_btn.grid(row=17, column=0, columnspan=2, sticky="ew", pady=(6, 0))
+        stocktake_btn = ttk.Button(right, text="Inventaire (CSV)", style="Secondary.TButton", command=self.stocktake_ui)
+        stocktake_btn.grid(row=18, column=0, columnspan=2, sticky="ew", pady=(6, 0))
 
         if not self.can_manage:
             create_btn.state(["disabled"])
             add_btn.state(["disabled"])
+            delivery_btn.state(["disabled"])
+            stocktake_btn.state(["disabled"])
             rx_chk.state(["disabled"])
             ttk.Label(
                 right,
                 text="Mode lecture seule pour ce rôle (admin requis).",
                 style="Subtitle.TLabel",
-            ).grid(row=17, column=0, columnspan=2, sticky="w", pady=(8, 0))
+            ).grid(row=19, column=0, columnspan=2, sticky="w", pady=(8, 0))
 
         right.columnconfigure(1, weight=1)
         self.refresh_products()
 
     def refresh_products(self) -> None:
-        for iid in self.products.get_children():
-            self.products.delete(iid)
-
-        for p in list_products():
-            append_tree_row(
-                self.products,
-                (p["id"], p["name"], p["stock"], f"{p['sell_price']:.2f}", p["min_stock"]),
+        """Recharge la grille depuis la première page (coût constant)."""
+        self.category_filter.configure(values=[ALL_CATEGORIES, *list_categories()])
+        self.products.delete(*self.products.get_children())
+        self.products_cursor = None
+        self.products_loaded = 0
+        self.products_exhausted = False
+        self.load_products_page()
+
+    def load_products_page(self) -> None:
+        self.page_pending = False
+        if self.products_exhausted:
+            return
+        category = self.f_category.get()
+        page = list_products_page(
+            after=self.products_cursor,
+            limit=STOCK_PAGE_SIZE,
+            category=None if category == ALL_CATEGORIES else category,
+            low_stock=bool(self.f_low_stock.get()),
+            prescription_only=bool(self.f_rx.get()),
+        )
+        for p in page:
+            tag = "even" if self.products_loaded % 2 == 0 else "odd"
+            self.products.insert(
+                "", "end", values=(p["id"], p["name"], p["stock"], f"{p['sell_price']:.2f}", p["min_stock"]), tags=(tag,)
             )
+            self.products_loaded += 1
+        if len(page) < STOCK_PAGE_SIZE:
+            self.products_exhausted = True
+        else:
+            self.products_cursor = (page[-1]["name"], page[-1]["id"])
+
+    def on_products_scroll(self, first: str, last: str) -> None:
+        self.products_scroll_y.set(first, last)
+        # Page suivante quand le bas de la grille approche.
+        if float(last) >= 0.9 and not self.products_exhausted and not self.page_pending:
+            self.page_pending = True
+            self.after_idle(self.load_products_page)
 
     def create_product_ui(self) -> None:
         if not self.can_manage:
@@ -432,6 +560,84 @@ class StockTab(ttk.Frame):
         messagebox.showinfo("Succès", f"Produit créé ID={pid}")
         self.refresh_products()
 
+    def receive_delivery_ui(self) -> None:
+        if not self.can_manage:
+            messagebox.showwarning("Accès refusé", "Seul un admin peut réceptionner une livraison")
+            return
+        path = filedialog.askopenfilename(
+            title="Bon de livraison (code_barre;lot;peremption;quantite)",
+            filetypes=[("CSV", "*.csv"), ("Tous", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            batch_ids = receive_delivery(read_delivery_csv(path))
+        except Exception as exc:
+            messagebox.showerror("Erreur réception", str(exc))
+            return
+
+        messagebox.showinfo("Succès", f"{len(batch_ids)} lot(s) réceptionné(s)")
+        self.refresh_products()
+
+    def stocktake_ui(self) -> None:
+        if not self.can_manage:
+            messagebox.showwarning("Accès refusé", "Seul un admin peut valider un inventaire")
+            return
+        path = filedialog.askopenfilename(
+            title="Comptage d'inventaire (code_barre;lot;quantite)",
+            filetypes=[("CSV", "*.csv"), ("Tous", "*.*")],
+        )
+        if not path:
+            return
+        category = self.f_category.get()
+        try:
+            counts = read_stocktake_csv(path)
+            session = start_stocktake(category=None if category == ALL_CATEGORIES else category)
+        except Exception as exc:
+            messagebox.showerror("Erreur inventaire", str(exc))
+            return
+        try:
+            for line in counts:
+                try:
+                    session.scan(line["barcode"], line["batch_number"], line["quantity"])
+                except ValueError as exc:
+                    raise ValueError(f"Ligne {line['line']}: {exc}") from None
+        except Exception as exc:
+            session.cancel()
+            messagebox.showerror("Erreur inventaire", str(exc))
+            return
+
+        scope = "toutes catégories" if category == ALL_CATEGORIES else category
+        # Le même choix sert à l'aperçu et à la validation: les écarts affichés sont ceux appliqués.
+        zero_uncounted = messagebox.askyesno(
+            "Inventaire",
+            f"{len(session.counts)} lot(s) compté(s) ({scope}).\n\n"
+            "Inventaire complet (lots non comptés mis à zéro) ?",
+        )
+        try:
+            differences = session.preview(zero_uncounted=zero_uncounted)
+        except Exception as exc:
+            session.cancel()
+            messagebox.showerror("Erreur inventaire", str(exc))
+            return
+
+        lines = [f"- {d['batch_number']}: {d['expected']} -> {d['counted']}" for d in differences[:20]]
+        if len(differences) > 20:
+            lines.append(f"... et {len(differences)-20} autre(s)")
+        if not messagebox.askyesno(
+            "Inventaire",
+            f"{len(differences)} écart(s):\n" + "\n".join(lines) + "\n\nValider les ajustements ?",
+        ):
+            session.cancel()
+            return
+        try:
+            result = session.commit(zero_uncounted=zero_uncounted)
+        except Exception as exc:
+            messagebox.showerror("Erreur inventaire", str(exc))
+            return
+        messagebox.showinfo("Succès", f"{result['adjusted']} lot(s) ajusté(s), écart total {result['delta']:+d}")
+        self.refresh_products()
+
     def add_stock_ui(self) -> None:
         if not self.can_manage:
             messagebox.showwarning("Accès refusé", "Seul un admin peut ajouter du stock")
@@ -496,14 +702,40 @@ class StockTab(ttk.Frame):
             lines.append(f"... et {len(rows)-20} autre(s)")
         messagebox.showwarning("Lots à péremption proche", "\n".join(lines))
 
+    def show_expiry_calendar(self) -> None:
+        months = get_expiry_calendar(180, "month")
+        lines = [
+            f"- {m['start'][:7]} | lots={m['batches']} | qte={m['quantity']} | valeur achat={m['stock_value']:.2f}"
+            for m in months
+        ]
+        messagebox.showinfo("Péremptions à 6 mois", "\n".join(lines))
+
     def show_alerts(self) -> None:
-        alerts = get_low_stock_products()
+        alerts = list_active_alerts()
         if not alerts:
-            messagebox.showinfo("Alertes", "Aucune alerte de stock bas")
+            messagebox.showinfo("Alertes", "Aucune alerte en cours")
             return
 
-        message = "\n".join([f"- {a['name']}: {a['stock']} (min={a['min_stock']})" for a in alerts])
-        messagebox.showwarning("Stock bas", message)
+        lines = []
+        for a in alerts[:30]:
+            mark = "" if a["state"] == "raised" else " (vu)"
+            if a["kind"] == "low_stock":
+                lines.append(f"- Stock bas: {a['product_name']}: {a['value']} (min={a['threshold']}){mark}")
+            else:
+                lines.append(f"- Péremption: {a['product_name']} | lot={a['batch_number']} | exp={a['expiry_date']} | qte={a['value']}{mark}")
+        if len(alerts) > 30:
+            lines.append(f"... et {len(alerts)-30} autre(s)")
+
+        raised = [a["id"] for a in alerts if a["state"] == "raised"]
+        if not raised:
+            messagebox.showinfo("Alertes", "\n".join(lines))
+            return
+        if messagebox.askyesno("Alertes", "\n".join(lines) + "\n\nMarquer les nouvelles alertes comme vues ?"):
+            for alert_id in raised:
+                try:
+                    acknowledge_alert(alert_id)
+                except ValueError:
+                    pass  # déjà acquittée depuis un autre poste
 
 
 class SalesHistoryTab(ttk.Frame):
@@ -787,8 +1019,9 @@ class UserAdminTab(ttk.Frame):
 
 
 class ReportTab(ttk.Frame):
-    def __init__(self, master):
+    def __init__(self, master, role: str):
         super().__init__(master, padding=12, style="App.TFrame")
+        self.can_manage = role == "admin"
 
         card = ttk.Frame(self, style="Card.TFrame", padding=12)
         card.pack(fill="both", expand=True)
@@ -809,6 +1042,7 @@ class ReportTab(ttk.Frame):
         self.period_select.pack(side="left")
         self.period_select.bind("<<ComboboxSelected>>", lambda _e: self.refresh())
 
+        ttk.Button(top_bar, text="Suggestions réassort", style="Secondary.TButton", command=self.show_reorder_suggestions).pack(side="right", padx=(0, 6))
         ttk.Button(top_bar, text="Exporter CSV", style="Secondary.TButton", command=self.export_csv_reports).pack(side="right", padx=(0, 6))
         ttk.Button(top_bar, text="Rafraîchir", style="Primary.TButton", command=self.refresh).pack(side="right")
 
@@ -847,6 +1081,27 @@ class ReportTab(ttk.Frame):
 
         self.refresh()
 
+    def show_reorder_suggestions(self) -> None:
+        try:
+            suggestions = forecast_demand()
+        except Exception as exc:
+            messagebox.showerror("Réassort", str(exc))
+            return
+        to_order = [s for s in suggestions if s["reorder_qty"] > 0]
+        lines = [
+            f"- {s['name']}: commander {s['reorder_qty']} (stock={s['stock']}, ~{s['daily_demand']:.1f}/j, min suggéré={s['suggested_min_stock']})"
+            for s in to_order[:20]
+        ]
+        if len(to_order) > 20:
+            lines.append(f"... et {len(to_order)-20} autre(s)")
+        message = "\n".join(lines) or "Aucun réassort nécessaire"
+        if not self.can_manage:
+            messagebox.showinfo("Suggestions réassort", message)
+            return
+        if messagebox.askyesno("Suggestions réassort", message + "\n\nMettre à jour les stocks minimum suggérés ?"):
+            changed = apply_suggested_min_stock(suggestions)
+            messagebox.showinfo("Réassort", f"{changed} stock(s) minimum mis à jour")
+
     def export_csv_reports(self) -> None:
         directory = filedialog.askdirectory(title="Choisir dossier d'export CSV")
         if not directory:
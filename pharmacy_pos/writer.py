@@ -0,0 +1,137 @@
+"""Écrivain unique optionnel avec validation groupée (group commit).
+
+Une fois `start_writer()` appelé, les écritures de caisse décorées par
+`serialized_write` (vente, annulation, retour, entrée de stock, création
+produit) ne prennent plus le verrou d'écriture depuis le thread appelant:
+elles sont déposées dans une file, et un thread dédié les exécute. Ce thread
+vide la file à chaque tour et exécute les opérations en attente dans une
+seule transaction, chacune dans son propre SAVEPOINT: une opération en
+échec (stock insuffisant...) est annulée seule, les autres sont validées
+ensemble. Les résultats sont rendus par des `Future`, après validation.
+
+Pour l'appelant, rien ne change: l'appel reste bloquant, retourne la même
+valeur et lève la même exception. Les lectures continuent sur les
+connexions de chaque thread. L'écrivain sérialise les threads d'un même
+processus (serveur de caisses, API...); plusieurs processus restent
+arbitrés par le verrou SQLite.
+"""
+import functools
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from pharmacy_pos.config import WRITER_BATCH_MAX
+from pharmacy_pos.database import in_transaction, retry_on_busy, savepoint, transaction
+
+_STOP = object()
+
+
+class Writer:
+    """Thread écrivain: file d'opérations, transactions groupées."""
+
+    def __init__(self, batch_max: int = WRITER_BATCH_MAX) -> None:
+        self.batch_max = batch_max
+        self.queue: queue.Queue = queue.Queue()
+        self.stats = {"batches": 0, "operations": 0, "failed": 0, "max_batch": 0}
+        self.thread = threading.Thread(target=self._run, name="pharmacy-pos-writer", daemon=True)
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        future: Future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [op for op in batch if op is not _STOP]
+            operations = [op for op in batch if op[0].set_running_or_notify_cancel()]
+            if operations:
+                self._commit(operations)
+
+    def _commit(self, operations: list) -> None:
+        try:
+            outcomes = self._execute(operations)
+        except BaseException as exc:
+            # Transaction entière en échec (base occupée, disque...): toutes les opérations le voient.
+            for future, *_ in operations:
+                future.set_exception(exc)
+            return
+        self.stats["batches"] += 1
+        self.stats["operations"] += len(operations)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(operations))
+        for (future, *_), (ok, value) in zip(operations, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                self.stats["failed"] += 1
+                future.set_exception(value)
+
+    @retry_on_busy
+    def _execute(self, operations: list) -> list[tuple[bool, object]]:
+        outcomes = []
+        with transaction() as cur:
+            for _future, func, args, kwargs in operations:
+                try:
+                    with savepoint(cur):
+                        outcomes.append((True, func(*args, **kwargs)))
+                except Exception as exc:
+                    outcomes.append((False, exc))
+        return outcomes
+
+
+_writer: Writer | None = None
+_writer_lock = threading.Lock()
+
+
+def start_writer(batch_max: int = WRITER_BATCH_MAX) -> Writer:
+    """Démarre l'écrivain du processus (sans effet s'il tourne déjà)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = Writer(batch_max)
+            _writer.thread.start()
+        return _writer
+
+
+def stop_writer() -> None:
+    """Exécute les opérations en attente puis arrête l'écrivain."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.queue.put(_STOP)
+        writer.thread.join()
+
+
+def writer_stats() -> dict:
+    """Transactions groupées, opérations, échecs et plus grand lot de l'écrivain actif."""
+    writer = _writer
+    return dict(writer.stats) if writer is not None else {}
+
+
+def serialized_write(func: Callable) -> Callable:
+    """Confie l'appel à l'écrivain s'il est démarré.
+
+    Appel direct si l'écrivain est arrêté, si l'appelant est déjà dans une
+    transaction (il la possède) ou s'il fournit son propre curseur.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        writer = _writer
+        own_cursor = kwargs.get("cur") is not None or any(isinstance(arg, sqlite3.Cursor) for arg in args)
+        if writer is None or own_cursor or in_transaction():
+            return func(*args, **kwargs)
+        return writer.submit(func, *args, **kwargs).result()
+
+    return wrapper
@@ -0,0 +1,123 @@
+import os
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+from pharmacy_pos.services import alert_service
+from pharmacy_pos.services.alert_service import (
+    acknowledge_alert,
+    count_unacknowledged_alerts,
+    list_active_alerts,
+    run_expiry_sweep,
+)
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.sales_service import create_sale
+from pharmacy_pos.services.stock_service import add_stock
+
+FAR = (date.today() + timedelta(days=400)).isoformat()
+
+
+class AlertEngineTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+
+    def _alerts(self, kind: str) -> list[dict]:
+        return list_active_alerts(kind)
+
+    def test_sale_crossing_min_stock_raises_and_receipt_clears(self) -> None:
+        product_id = create_product("Vitamine D", "A-1", "Supplements", 5, 8, 0, 5, False)
+        add_stock(product_id, "VD-1", FAR, 8)
+        self.assertEqual(self._alerts("low_stock"), [])
+
+        create_sale(1, [{"product_id": product_id, "quantity": 4}], "cash")
+        alerts = self._alerts("low_stock")
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual((alerts[0]["product_id"], alerts[0]["value"], alerts[0]["threshold"]), (product_id, 4, 5))
+        self.assertEqual(count_unacknowledged_alerts(), 1)
+
+        # Nouvelle vente sous le seuil: même alerte, valeur mise à jour.
+        create_sale(1, [{"product_id": product_id, "quantity": 1}], "cash")
+        alerts = self._alerts("low_stock")
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]["value"], 3)
+
+        add_stock(product_id, "VD-2", FAR, 10)
+        self.assertEqual(self._alerts("low_stock"), [])
+        with db_cursor() as cur:
+            cur.execute("SELECT state, cleared_at FROM alerts WHERE product_id = ?", (product_id,))
+            row = cur.fetchone()
+        self.assertEqual(row["state"], "cleared")
+        self.assertIsNotNone(row["cleared_at"])
+
+    def test_acknowledge_and_reraise(self) -> None:
+        product_id = create_product("Sirop", "A-2", "Divers", 2, 4, 0, 2, False)
+        add_stock(product_id, "S-1", FAR, 5)
+        create_sale(1, [{"product_id": product_id, "quantity": 3}], "cash")
+        alert_id = self._alerts("low_stock")[0]["id"]
+
+        acknowledge_alert(alert_id)
+        self.assertEqual(count_unacknowledged_alerts(), 0)
+        self.assertEqual(self._alerts("low_stock")[0]["state"], "acknowledged")
+        with self.assertRaises(ValueError):
+            acknowledge_alert(alert_id)
+
+        add_stock(product_id, "S-2", FAR, 5)
+        create_sale(1, [{"product_id": product_id, "quantity": 6}], "cash")
+        alerts = self._alerts("low_stock")
+        self.assertEqual(len(alerts), 1)
+        self.assertNotEqual(alerts[0]["id"], alert_id)
+        self.assertEqual(alerts[0]["state"], "raised")
+
+    def test_expiry_alert_per_batch(self) -> None:
+        product_id = create_product("Gel", "A-3", "Divers", 1, 2, 0, 0, False)
+        soon = (date.today() + timedelta(days=20)).isoformat()
+        add_stock(product_id, "GEL-SOON", soon, 2)
+        add_stock(product_id, "GEL-FAR", FAR, 2)
+
+        alerts = self._alerts("expiry")
+        self.assertEqual([a["batch_number"] for a in alerts], ["GEL-SOON"])
+
+        # Le lot proche est vendu en premier (FEFO): l'alerte se ferme.
+        create_sale(1, [{"product_id": product_id, "quantity": 2}], "cash")
+        self.assertEqual(self._alerts("expiry"), [])
+
+    def test_sweep_picks_up_batches_entering_horizon(self) -> None:
+        product_id = create_product("Crème", "A-4", "Divers", 1, 2, 0, 0, False)
+        add_stock(product_id, "CR-1", FAR, 3)
+        self.assertEqual(run_expiry_sweep(), 0)
+        self.assertEqual(self._alerts("expiry"), [])
+
+        # Simule le passage du temps: le lot entre dans l'horizon sans mouvement.
+        with db_cursor() as cur:
+            cur.execute("UPDATE app_meta SET value = DATE('now', '-1 day') WHERE key = 'alerts_expiry_horizon'")
+            cur.execute("UPDATE batches SET expiry_date = DATE('now', '+89 day') WHERE product_id = ?", (product_id,))
+            cur.execute("DELETE FROM alerts")
+
+        self.assertEqual(run_expiry_sweep(), 1)
+        self.assertEqual(len(self._alerts("expiry")), 1)
+        self.assertEqual(run_expiry_sweep(), 0)
+
+    def test_alert_reads_run_the_sweep_once_per_day(self) -> None:
+        product_id = create_product("Sirop", "A-5", "Divers", 1, 2, 0, 0, False)
+        add_stock(product_id, "SI-1", (date.today() + timedelta(days=120)).isoformat(), 3)
+        self.assertEqual(self._alerts("expiry"), [])
+
+        # Quarante jours plus tard, le lot est dans l'horizon sans aucun mouvement.
+        later = alert_service._today() + timedelta(days=40)
+        with mock.patch.object(alert_service, "_today", return_value=later):
+            self.assertEqual(count_unacknowledged_alerts(), 1)
+            self.assertEqual([a["batch_number"] for a in self._alerts("expiry")], ["SI-1"])
+            with mock.patch.object(alert_service, "run_expiry_sweep") as sweep:
+                self._alerts("expiry")
+                count_unacknowledged_alerts()
+            sweep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
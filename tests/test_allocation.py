@@ -0,0 +1,91 @@
+import os
+import unittest
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import (
+    db_cursor,
+    disable_instrumentation,
+    enable_instrumentation,
+    init_db,
+    instrumentation_summary,
+)
+from pharmacy_pos.services.allocation_service import reconcile_fefo_cache
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.sales_service import cancel_sale, create_sale, return_sale_item
+from pharmacy_pos.services.stock_service import add_stock, receive_delivery
+
+
+class FefoCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.product_id = create_product("Amoxicilline", "FEFO1", "Antibiotiques", 1, 2, 0, 0, False)
+        self.late = add_stock(self.product_id, "L-LATE", "2099-06-01", 5)
+        self.early = add_stock(self.product_id, "L-EARLY", "2098-01-01", 3)
+        add_stock(self.product_id, "L-OLD", "2001-01-01", 50)  # expiré
+
+    def tearDown(self) -> None:
+        disable_instrumentation()
+
+    def _allocations(self, sale_id: int) -> list[tuple[int, int]]:
+        with db_cursor() as cur:
+            cur.execute("SELECT batch_id, quantity FROM sale_items WHERE sale_id = ? ORDER BY id", (sale_id,))
+            return [tuple(row) for row in cur.fetchall()]
+
+    def _sell(self, quantity: int) -> list[tuple[int, int]]:
+        return self._allocations(create_sale(1, [{"product_id": self.product_id, "quantity": quantity}], "cash"))
+
+    def test_warm_cache_allocates_without_reading_lots(self) -> None:
+        self.assertEqual(reconcile_fefo_cache(), 0)
+
+        enable_instrumentation(slow_ms=1000)
+        self.assertEqual(self._sell(4), [(self.early, 3), (self.late, 1)])
+        statements = instrumentation_summary()["statements"]
+        self.assertFalse([s for s in statements if "FROM batches" in s["sql"] and s["sql"].startswith("SELECT")])
+
+    def test_cache_follows_receipts_cancellations_and_returns(self) -> None:
+        reconcile_fefo_cache()
+        sale_id = create_sale(1, [{"product_id": self.product_id, "quantity": 3}], "cash")
+        self.assertEqual(self._sell(1), [(self.late, 1)])
+
+        # Réception d'un lot plus proche de la péremption: il passe en tête.
+        earliest = receive_delivery(
+            [{"product_id": self.product_id, "batch_number": "L-NEW", "expiry_date": "2097-01-01", "quantity": 2}]
+        )[0]
+        self.assertEqual(self._sell(1), [(earliest, 1)])
+
+        # L'annulation remet le lot vidé dans le cache.
+        cancel_sale(sale_id)
+        self.assertEqual(self._sell(2), [(earliest, 1), (self.early, 1)])
+        self.assertEqual(self._allocations(sale_id), [(self.early, 3)])
+
+    def test_external_writes_and_rollbacks_keep_cache_consistent(self) -> None:
+        reconcile_fefo_cache()
+        # Écriture d'un autre poste: la version du produit change.
+        with db_cursor() as cur:
+            cur.execute("UPDATE batches SET quantity = 0 WHERE id = ?", (self.early,))
+        self.assertEqual(self._sell(1), [(self.late, 1)])
+
+        # Une vente refusée ne touche ni la base ni le cache.
+        with self.assertRaises(ValueError):
+            create_sale(
+                1,
+                [{"product_id": self.product_id, "quantity": 2}, {"product_id": self.product_id, "quantity": 10}],
+                "cash",
+            )
+        self.assertEqual(self._sell(4), [(self.late, 4)])
+
+        with db_cursor() as cur:
+            cur.execute("SELECT id FROM sale_items WHERE batch_id = ? ORDER BY id DESC LIMIT 1", (self.late,))
+            last_item_id = cur.fetchone()["id"]
+        return_sale_item(last_item_id, 2)
+        self.assertEqual(self._sell(2), [(self.late, 2)])
+        with self.assertRaises(ValueError):
+            self._sell(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
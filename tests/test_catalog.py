@@ -0,0 +1,51 @@
+import os
+import unittest
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.catalog_service import get_catalog_entry, invalidate_catalog, lookup_by_barcode
+from pharmacy_pos.services.product_service import create_product, delete_product, update_product_prices
+from pharmacy_pos.services.sales_service import create_sale
+from pharmacy_pos.services.stock_service import add_stock
+
+
+class CatalogIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        invalidate_catalog()
+
+    def test_index_follows_local_writes(self) -> None:
+        first = create_product("Doliprane", "CAT1", "Antalgique", 1, 2, 0, 1, False)
+        self.assertEqual(lookup_by_barcode("CAT1")["id"], first)
+
+        second = create_product("Efferalgan", "CAT2", "Antalgique", 1, 3, 0, 1, True)
+        self.assertTrue(lookup_by_barcode(" CAT2 ")["requires_prescription"])
+
+        update_product_prices(first, 1, 2.5, 0)
+        self.assertEqual(get_catalog_entry(first)["sell_price"], 2.5)
+
+        delete_product(second)
+        self.assertIsNone(lookup_by_barcode("CAT2"))
+        self.assertIsNone(get_catalog_entry(second))
+
+    def test_external_write_is_detected_by_version(self) -> None:
+        product_id = create_product("Smecta", "CAT3", "Digestif", 1, 4, 0, 1, False)
+        add_stock(product_id, "L1", "2099-01-01", 10)
+        self.assertEqual(lookup_by_barcode("CAT3")["sell_price"], 4)
+
+        # Écriture d'un autre poste: seul le trigger de version est au courant.
+        with db_cursor() as cur:
+            cur.execute("UPDATE products SET sell_price = 5 WHERE id = ?", (product_id,))
+
+        sale_id = create_sale(1, [{"product_id": product_id, "quantity": 2}], "cash")
+        with db_cursor() as cur:
+            cur.execute("SELECT total_ttc FROM sales WHERE id = ?", (sale_id,))
+            self.assertEqual(cur.fetchone()["total_ttc"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from pharmacy_pos import database
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import contention_stats, db_cursor, init_db, reset_contention_stats, retry_on_busy
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.ledger_service import reconcile_stock_ledger
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.sales_service import cancel_sale, create_sale, get_sale_items, return_sale_item
+from pharmacy_pos.services.stock_service import add_stock, get_total_stock
+
+FAR = (date.today() + timedelta(days=400)).isoformat()
+
+
+class ConcurrencyTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        reset_contention_stats()
+        self.pid = create_product("Doliprane", "3400001", "Antalgiques", 1, 2, 0, 0, False)
+        add_stock(self.pid, "D-1", FAR, 10)
+
+    def test_busy_transaction_is_retried_then_reported(self) -> None:
+        calls = []
+
+        @retry_on_busy
+        def flaky(failures: int) -> str:
+            calls.append(1)
+            if len(calls) <= failures:
+                raise sqlite3.OperationalError("database is locked")
+            return "ok"
+
+        with mock.patch.object(database, "TX_RETRY_BACKOFF_MS", 0):
+            self.assertEqual(flaky(2), "ok")
+            self.assertEqual(len(calls), 3)
+            self.assertEqual(contention_stats()["retries"], 2)
+
+            calls.clear()
+            with self.assertRaisesRegex(ValueError, "Base occupée"):
+                flaky(10)
+        self.assertEqual(len(calls), database.TX_RETRY_ATTEMPTS)
+        self.assertEqual(contention_stats()["busy_failures"], 1)
+
+    def test_nested_call_is_not_retried(self) -> None:
+        calls = []
+
+        @retry_on_busy
+        def locked() -> None:
+            calls.append(1)
+            raise sqlite3.OperationalError("database is locked")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            with db_cursor():
+                locked()
+        self.assertEqual(len(calls), 1)
+
+    def test_sale_waits_for_other_till_and_records_lock_wait(self) -> None:
+        other = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+        other.execute("BEGIN IMMEDIATE")
+        timer = threading.Timer(0.2, other.rollback)
+        timer.start()
+        try:
+            create_sale(1, [{"product_id": self.pid, "quantity": 1}], "cash")
+        finally:
+            timer.join()
+            other.close()
+
+        stats = contention_stats()
+        self.assertGreaterEqual(stats["max_lock_wait_ms"], 100)
+        self.assertEqual(stats["busy_failures"], 0)
+        self.assertEqual(get_total_stock(self.pid), 9)
+
+    def test_parallel_tills_never_oversell(self) -> None:
+        sold = []
+        errors = []
+
+        def till() -> None:
+            for _ in range(5):
+                try:
+                    sold.append(create_sale(1, [{"product_id": self.pid, "quantity": 1}], "cash"))
+                except ValueError as exc:
+                    errors.append(str(exc))
+
+        threads = [threading.Thread(target=till) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(sold), 10)
+        self.assertEqual(len(errors), 10)
+        self.assertTrue(all(message.startswith("Stock insuffisant") for message in errors))
+        self.assertEqual(get_total_stock(self.pid), 0)
+        self.assertEqual(reconcile_stock_ledger(), [])
+
+    def test_cancel_after_partial_return_restores_only_the_rest(self) -> None:
+        sale_id = create_sale(1, [{"product_id": self.pid, "quantity": 4}], "cash")
+        item = get_sale_items(sale_id)[0]
+        return_sale_item(item["sale_item_id"], 1)
+        self.assertEqual(get_total_stock(self.pid), 7)
+
+        cancel_sale(sale_id)
+        self.assertEqual(get_total_stock(self.pid), 10)
+        self.assertEqual(reconcile_stock_ledger(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
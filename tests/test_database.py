@@ -0,0 +1,36 @@
+import os
+import unittest
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+
+
+class DatabasePoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+
+    def test_connection_is_reused_with_wal(self) -> None:
+        with db_cursor() as cur:
+            first = cur.connection
+            cur.execute("PRAGMA journal_mode")
+            self.assertEqual(cur.fetchone()[0].lower(), "wal")
+        with db_cursor() as cur:
+            self.assertIs(cur.connection, first)
+
+    def test_nested_cursor_rolls_back_with_outer_block(self) -> None:
+        with self.assertRaises(RuntimeError):
+            with db_cursor() as outer:
+                outer.execute("INSERT INTO categories(name) VALUES('Externe')")
+                with db_cursor() as inner:
+                    inner.execute("INSERT INTO categories(name) VALUES('Interne')")
+                raise RuntimeError("échec")
+
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) AS n FROM categories")
+            self.assertEqual(cur.fetchone()["n"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import math
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+from pharmacy_pos.services import forecast_service
+from pharmacy_pos.services.alert_service import list_active_alerts
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.forecast_service import apply_suggested_min_stock, forecast_demand
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.stock_service import add_stock
+
+FAR = (datetime.now(timezone.utc).date() + timedelta(days=400)).isoformat()
+
+
+class ForecastTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.steady = create_product("Doliprane", "F-1", "Antalgiques", 1, 2, 0, 0, False)
+        self.burst = create_product("Smecta", "F-2", "Digestif", 1, 2, 0, 0, False)
+        self.idle = create_product("Spasfon", "F-3", "Digestif", 1, 2, 0, 3, False)
+        batches = {self.steady: add_stock(self.steady, "D-1", FAR, 20)}
+
+        today = datetime.now(timezone.utc).date()
+        sales = []
+        for days_ago in range(1, 61):
+            sales.append((days_ago, self.steady, 2))
+        for days_ago in (1, 3, 5):
+            sales.append((days_ago, self.burst, 10))
+        with db_cursor() as cur:
+            cur.execute("INSERT INTO batches(product_id, batch_number, expiry_date, quantity) VALUES(?, 'S-0', ?, 0)", (self.burst, FAR))
+            batches[self.burst] = cur.lastrowid
+            for days_ago, product_id, qty in sales:
+                stamp = f"{(today - timedelta(days=days_ago)).isoformat()} 10:00:00"
+                cur.execute(
+                    "INSERT INTO sales(cashier_id, total_ht, total_tva, total_ttc, payment_method, created_at) VALUES(1, 0, 0, 0, 'cash', ?)",
+                    (stamp,),
+                )
+                cur.execute(
+                    "INSERT INTO sale_items(sale_id, product_id, batch_id, quantity, unit_price, line_total) VALUES(?, ?, ?, ?, 2, ?)",
+                    (cur.lastrowid, product_id, batches[product_id], qty, 2 * qty),
+                )
+            # Ticket annulé: ignoré.
+            cur.execute(
+                "INSERT INTO sales(cashier_id, total_ht, total_tva, total_ttc, payment_method, created_at) VALUES(1, 0, 0, 0, 'cash', ?)",
+                (f"{(today - timedelta(days=2)).isoformat()} 11:00:00",),
+            )
+            sale_id = cur.lastrowid
+            cur.execute(
+                "INSERT INTO sale_items(sale_id, product_id, batch_id, quantity, unit_price, line_total) VALUES(?, ?, ?, 500, 2, 1000)",
+                (sale_id, self.burst, batches[self.burst]),
+            )
+            cur.execute("INSERT INTO sale_cancellations(sale_id, reason) VALUES(?, 'test')", (sale_id,))
+
+    def _by_product(self, **kwargs) -> dict[int, dict]:
+        return {row["product_id"]: row for row in forecast_demand(history_days=90, **kwargs)}
+
+    def test_indicators_and_suggestions(self) -> None:
+        rows = self._by_product(use_numpy=False)
+        self.assertEqual(set(rows), {self.steady, self.burst})
+
+        steady = rows[self.steady]
+        self.assertEqual((steady["sma_7"], steady["sma_28"], steady["std_28"]), (2.0, 2.0, 0.0))
+        # EWMA sur 60 jours à 2/jour depuis 0: 2 * (1 - 0.9^60).
+        self.assertAlmostEqual(steady["ewma"], 2 * (1 - 0.9**60), places=3)
+        self.assertEqual(steady["suggested_min_stock"], math.ceil(steady["ewma"] * 7))
+        self.assertEqual(steady["reorder_qty"], math.ceil(steady["ewma"] * 14) - 20)
+
+        burst = rows[self.burst]
+        self.assertEqual(burst["sma_7"], round(30 / 7, 3))
+        self.assertGreater(burst["std_28"], 0)
+        # La variabilité augmente le stock de sécurité.
+        self.assertGreater(burst["suggested_min_stock"], math.ceil(burst["ewma"] * 7))
+        self.assertEqual(burst["stock"], 0)
+        self.assertEqual(next(iter(forecast_demand(history_days=90)))["product_id"], self.burst)
+
+    @unittest.skipUnless(forecast_service.np is not None, "NumPy absent")
+    def test_numpy_and_python_paths_agree(self) -> None:
+        self.assertEqual(self._by_product(use_numpy=True), self._by_product(use_numpy=False))
+
+    def test_apply_min_stock_updates_and_reevaluates_alerts(self) -> None:
+        suggestions = forecast_demand(history_days=90)
+        self.assertEqual(apply_suggested_min_stock(suggestions), 2)
+        with db_cursor() as cur:
+            cur.execute("SELECT id, min_stock FROM products ORDER BY id")
+            min_stock = {row["id"]: row["min_stock"] for row in cur.fetchall()}
+        expected = {row["product_id"]: row["suggested_min_stock"] for row in suggestions}
+        self.assertEqual(min_stock, {**expected, self.idle: 3})
+        # Smecta (aucun stock) passe sous son nouveau minimum; Doliprane (20 >= 14) non.
+        low = [a["product_id"] for a in list_active_alerts("low_stock")]
+        self.assertIn(self.burst, low)
+        self.assertNotIn(self.steady, low)
+        self.assertEqual(apply_suggested_min_stock(forecast_demand(history_days=90)), 0)
+
+    def test_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            forecast_demand(history_days=7)
+        with self.assertRaises(ValueError):
+            forecast_demand(alpha=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import init_db
+from pharmacy_pos.services.alert_service import list_active_alerts
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.import_service import import_products_csv, read_delivery_csv
+from pharmacy_pos.services.product_service import create_product, fuzzy_search_products, list_products, search_products
+
+
+class CatalogImportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def _write_csv(self, content: str) -> str:
+        path = os.path.join(self.tmp.name, "catalogue.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_import_upserts_by_barcode_and_reports_rejects(self) -> None:
+        existing = create_product("Doliprane 1g", "340100", "Antalgiques", 100, 150, 0, 5, False)
+        path = self._write_csv(
+            "nom;code_barre;categorie;prix_achat;prix_vente;tva;stock_min;ordonnance\n"
+            "Doliprane 1g;340100;Antalgiques;110;160,5;0;5;non\n"
+            "Amoxicilline 500mg;340200;Antibiotiques;200;300;0;10;oui\n"
+            "Sans code;;Divers;1;2;0;0;non\n"
+            "Prix faux;340300;Divers;abc;2;0;0;non\n"
+            "Négatif;340400;Divers;1;-2;0;0;non\n"
+            "\n"
+            "Zinc 15mg;340500;Compléments;50;80;18;0;\n"
+        )
+
+        report = import_products_csv(path, batch_size=2)
+
+        self.assertEqual((report.inserted, report.updated), (2, 1))
+        self.assertEqual([line for line, _reason in report.rejected], [4, 5, 6])
+        self.assertIn("Code-barres", report.rejected[0][1])
+
+        products = {p["barcode"]: p for p in list_products()}
+        self.assertEqual(products["340100"]["id"], existing)
+        self.assertEqual(products["340100"]["sell_price"], 160.5)
+        self.assertEqual(products["340200"]["category"], "Antibiotiques")
+        self.assertTrue(products["340200"]["requires_prescription"])
+        self.assertEqual(products["340500"]["tva"], 18)
+
+        # Les index de recherche suivent l'import.
+        self.assertEqual([p["barcode"] for p in search_products("amoxicilline")], ["340200"])
+        self.assertEqual([p["barcode"] for p in fuzzy_search_products("amoxiciline")], ["340200"])
+
+    def test_reimport_counts_real_updates_and_rejects_duplicates(self) -> None:
+        header = "nom;code_barre;categorie;prix_achat;prix_vente;tva;stock_min;ordonnance\n"
+        first = self._write_csv(header + "Doliprane;340100;Antalgiques;1;2;0;5;non\nSmecta;340200;Digestif;1;2;0;0;non\n")
+        self.assertEqual(import_products_csv(first).inserted, 2)
+        # Produits importés sans stock: alerte de stock bas comme pour une création manuelle.
+        self.assertEqual(len(list_active_alerts("low_stock")), 2)
+
+        again = self._write_csv(
+            header
+            + "Doliprane;340100;Antalgiques;1;2;0;5;non\n"
+            + "Smecta;340200;Digestif;1;3;0;0;non\n"
+            + "Smecta bis;340200;Digestif;1;4;0;0;non\n"
+        )
+        report = import_products_csv(again)
+
+        self.assertEqual((report.inserted, report.updated, report.unchanged), (0, 1, 1))
+        self.assertEqual([line for line, _reason in report.rejected], [4])
+        self.assertIn("double", report.rejected[0][1])
+        self.assertEqual({p["barcode"]: p["sell_price"] for p in list_products()}["340200"], 3)
+
+    def test_non_finite_numbers_are_rejected(self) -> None:
+        path = self._write_csv(
+            "nom;code_barre;categorie;prix_achat;prix_vente;tva;stock_min;ordonnance\n"
+            "Doliprane;340100;Antalgiques;1;2;0;0;non\n"
+            "Pas un nombre;340200;Divers;nan;2;0;0;non\n"
+            "Infini;340300;Divers;1;inf;0;0;non\n"
+            "Trop grand;340400;Divers;1;1e309;0;0;non\n"
+        )
+        report = import_products_csv(path)
+
+        self.assertEqual(report.inserted, 1)
+        self.assertEqual([line for line, _reason in report.rejected], [3, 4, 5])
+        self.assertIn("invalide", report.rejected[0][1])
+        self.assertEqual([p["barcode"] for p in list_products()], ["340100"])
+
+    def test_missing_required_column_is_rejected(self) -> None:
+        path = self._write_csv("name,barcode\nA,1\n")
+        with self.assertRaises(ValueError):
+            import_products_csv(path)
+
+    def test_read_delivery_csv_resolves_barcodes(self) -> None:
+        product_id = create_product("Smecta", "340600", "Digestif", 1, 2, 0, 0, False)
+        path = self._write_csv("code_barre;lot;peremption;quantite\n340600;S1;2099-01-01;12\n")
+        self.assertEqual(
+            read_delivery_csv(path),
+            [{"product_id": product_id, "batch_number": "S1", "expiry_date": "2099-01-01", "quantity": 12}],
+        )
+
+        path = self._write_csv("code_barre;lot;peremption;quantite\nINCONNU;S1;2099-01-01;12\n")
+        with self.assertRaises(ValueError):
+            read_delivery_csv(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import (
+    disable_instrumentation,
+    dump_instrumentation,
+    enable_instrumentation,
+    init_db,
+    instrumentation_summary,
+)
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.product_service import create_product, list_products
+from pharmacy_pos.services.sales_service import create_sale
+from pharmacy_pos.services.stock_service import add_stock
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+
+    def tearDown(self) -> None:
+        disable_instrumentation()
+
+    def test_statements_are_attributed_to_services(self) -> None:
+        product_id = create_product("Tracé", "TRC1", "Divers", 1, 2, 0, 1, False)
+        add_stock(product_id, "T1", "2029-01-01", 5)
+
+        enable_instrumentation(slow_ms=1000)
+        create_sale(1, [{"product_id": product_id, "quantity": 2}], "cash")
+        list_products()
+        summary = instrumentation_summary()
+
+        self.assertIn("sales_service.create_sale", summary["transactions"])
+        self.assertIn("allocation_service.read_stock_versions", summary["services"])
+        self.assertIn("product_service.list_products", summary["services"])
+        products_stmt = [s for s in summary["statements"] if "FROM products p" in s["sql"]]
+        self.assertEqual(products_stmt[0]["rows"], 1)
+
+    def test_slow_queries_are_logged_with_plan_and_dumped(self) -> None:
+        enable_instrumentation(slow_ms=0)
+        with self.assertLogs("pharmacy_pos.sql", level="WARNING"):
+            list_products()
+
+        slow = instrumentation_summary()["slow_queries"]
+        self.assertTrue(any(entry["plan"] for entry in slow))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = dump_instrumentation(os.path.join(tmp, "sql.json"))
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("statements", json.load(f))
+
+
+if __name__ == "__main__":
+    unittest.main()
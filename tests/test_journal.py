@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import DatabaseUnavailable, db_cursor, init_db
+from pharmacy_pos.services import bootstrap_service, journal_service
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.journal_service import (
+    SalesJournal,
+    list_offline_conflicts,
+    read_journal,
+    replay_journal,
+    submit_sale,
+)
+from pharmacy_pos.services.ledger_service import reconcile_stock_ledger
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.stock_service import add_stock, get_total_stock
+
+FAR = (date.today() + timedelta(days=400)).isoformat()
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.pid = create_product("Doliprane", "3400001", "Antalgiques", 1, 2, 0, 0, False)
+        add_stock(self.pid, "D-1", FAR, 10)
+        self.tmp = tempfile.mkdtemp()
+        self.journal = SalesJournal(Path(self.tmp) / "ventes.jsonl")
+
+    def tearDown(self) -> None:
+        self.journal.close()
+        shutil.rmtree(self.tmp)
+
+    def _sell_offline(self, *quantities: int) -> list[str]:
+        unavailable = DatabaseUnavailable("Base occupée par un autre poste, réessayez")
+        keys = []
+        with mock.patch.object(journal_service, "create_sale", side_effect=unavailable) as create:
+            for quantity in quantities:
+                result = submit_sale(1, [{"product_id": self.pid, "quantity": quantity}], "cash", self.journal)
+                self.assertTrue(result["offline"])
+                self.assertIsNone(result["sale_id"])
+                keys.append(result["key"])
+        # Une fois hors ligne, les ventes suivantes ne tentent plus la base.
+        self.assertEqual(create.call_count, 1)
+        return keys
+
+    def test_outage_journals_sales_then_replays_them_first(self) -> None:
+        keys = self._sell_offline(2, 3)
+        self.assertEqual(self.journal.pending_count(), 2)
+        self.assertEqual(get_total_stock(self.pid), 10)
+
+        self.journal.last_attempt -= journal_service.JOURNAL_RETRY_S
+        result = submit_sale(1, [{"product_id": self.pid, "quantity": 1}], "cash", self.journal)
+        self.assertFalse(result["offline"])
+        self.assertEqual(result["replay"]["applied"], 2)
+        self.assertEqual(get_total_stock(self.pid), 4)
+        self.assertEqual(self.journal.pending_count(), 0)
+        self.assertIsNone(self.journal.offline_since)
+
+        with db_cursor() as cur:
+            cur.execute(
+                """
+                SELECT o.idempotency_key, o.journaled_at, s.created_at
+                FROM offline_sales o JOIN sales s ON s.id = o.sale_id
+                ORDER BY s.id
+                """
+            )
+            rows = cur.fetchall()
+        self.assertEqual([row["idempotency_key"] for row in rows], keys)
+        # La vente garde l'heure où elle a été encaissée.
+        self.assertTrue(all(row["created_at"] == row["journaled_at"] for row in rows))
+        self.assertEqual(reconcile_stock_ledger(), [])
+
+    def test_replay_reports_conflicts_without_blocking_other_sales(self) -> None:
+        self._sell_offline(6, 6, 3)
+        result = replay_journal(self.journal)
+
+        self.assertEqual(result["applied"], 2)
+        self.assertEqual(len(result["conflicts"]), 1)
+        self.assertIn("Stock insuffisant", result["conflicts"][0]["error"])
+        self.assertEqual(get_total_stock(self.pid), 1)
+        conflicts = list_offline_conflicts()
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(conflicts[0]["items"], [{"product_id": self.pid, "quantity": 6, "prescription_ok": False}])
+
+    def test_replay_is_idempotent(self) -> None:
+        self._sell_offline(2)
+        self.assertEqual(replay_journal(self.journal)["applied"], 1)
+
+        # Rejeu interrompu avant le renommage: le fichier est relu.
+        done = next(Path(self.tmp).glob("*.done"))
+        shutil.copy(done, done.with_suffix(".replay"))
+        result = replay_journal(self.journal)
+        self.assertEqual((result["applied"], result["skipped"]), (0, 1))
+        self.assertEqual(get_total_stock(self.pid), 8)
+
+    def test_key_is_shared_between_database_and_journal(self) -> None:
+        # Vente validée en base, mais la caisse a cru à une coupure et l'a journalisée.
+        cart = [{"product_id": self.pid, "quantity": 2}]
+        sale_id = submit_sale(1, cart, "cash", self.journal, idempotency_key="panier-1")["sale_id"]
+        self.journal.append(1, cart, "cash", "panier-1")
+
+        result = replay_journal(self.journal)
+        self.assertEqual(result["conflicts"], [])
+        self.assertEqual(get_total_stock(self.pid), 8)
+        with db_cursor() as cur:
+            cur.execute("SELECT sale_id FROM offline_sales WHERE idempotency_key = 'panier-1'")
+            self.assertEqual(cur.fetchone()["sale_id"], sale_id)
+
+    def test_invalid_entries_become_conflicts_without_blocking_the_replay(self) -> None:
+        cart = [{"product_id": self.pid, "quantity": 2}]
+        self.journal.append(999, cart, "cash")  # caissier supprimé depuis
+        self.journal.close()
+        with open(self.journal.path, "a", encoding="utf-8") as handle:
+            handle.write('{"key": "sans-articles", "cashier_id": 1, "payment_method": "cash", "journaled_at": "2024-01-01 10:00:00"}\n')
+        self.journal.append(1, cart, "cash")
+
+        result = replay_journal(self.journal)
+        self.assertEqual(result["applied"], 1)
+        self.assertEqual(len(result["conflicts"]), 2)
+        self.assertIn("FOREIGN KEY", result["conflicts"][0]["error"])
+        self.assertIn("items", result["conflicts"][1]["error"])
+        self.assertEqual(get_total_stock(self.pid), 8)
+        self.assertEqual(sorted(c["cashier_id"] for c in list_offline_conflicts()), [1, 999])
+        self.assertEqual(replay_journal(self.journal)["applied"], 0)
+
+    def test_failed_replay_journals_the_sale_and_waits_before_retrying(self) -> None:
+        self._sell_offline(1)
+        self.journal.last_attempt -= journal_service.JOURNAL_RETRY_S
+        cart = [{"product_id": self.pid, "quantity": 1}]
+        with mock.patch.object(journal_service, "replay_journal", side_effect=RuntimeError("disque")) as replay:
+            self.assertTrue(submit_sale(1, cart, "cash", self.journal)["offline"])
+            self.assertTrue(submit_sale(1, cart, "cash", self.journal)["offline"])
+        self.assertEqual(replay.call_count, 1)
+        self.assertEqual(self.journal.pending_count(), 3)
+
+    def test_bootstrap_starts_even_if_the_replay_fails(self) -> None:
+        with mock.patch.object(bootstrap_service, "replay_journal", side_effect=RuntimeError("disque")):
+            with self.assertLogs(bootstrap_service.logger, "ERROR"):
+                bootstrap_service.bootstrap()
+
+    def test_torn_last_line_is_ignored(self) -> None:
+        self._sell_offline(1)
+        self.journal.close()
+        with open(self.journal.path, "a", encoding="utf-8") as handle:
+            handle.write('{"key": "coupure')
+        self.assertEqual(len(read_journal(self.journal.path)), 1)
+        self.assertEqual(replay_journal(self.journal)["applied"], 1)
+
+    def test_fsync_is_batched(self) -> None:
+        journal = SalesJournal(Path(self.tmp) / "lot.jsonl", fsync_every=3, fsync_ms=60_000)
+        item = [{"product_id": self.pid, "quantity": 1}]
+        with mock.patch.object(journal_service.os, "fsync") as fsync:
+            for _ in range(7):
+                journal.append(1, item, "cash")
+            self.assertEqual(fsync.call_count, 2)
+            journal.close()
+            self.assertEqual(fsync.call_count, 3)
+        self.assertEqual(len(read_journal(journal.path)), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
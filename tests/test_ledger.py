@@ -0,0 +1,131 @@
+import os
+import unittest
+from datetime import date, timedelta
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.ledger_service import (
+    compact_stock_ledger,
+    ledger_compacted_until,
+    reconcile_stock_ledger,
+    stock_at,
+)
+from pharmacy_pos.services.product_service import create_product, delete_product
+from pharmacy_pos.services.sales_service import create_sale
+from pharmacy_pos.services.stock_service import add_stock, get_total_stock
+
+FAR = (date.today() + timedelta(days=400)).isoformat()
+
+
+class StockLedgerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.product_id = create_product("Doliprane", "L-1", "Antalgiques", 1, 2, 0, 0, False)
+        # Historique daté: +10 en janvier, -3 en février, +5 et -4 en mars.
+        with db_cursor() as cur:
+            cur.executemany(
+                "INSERT INTO stock_movements(product_id, type, quantity, reason, created_at) VALUES(?, ?, ?, 'test', ?)",
+                [
+                    (self.product_id, "IN", 10, "2024-01-15 09:00:00"),
+                    (self.product_id, "OUT", 3, "2024-02-10 10:00:00"),
+                    (self.product_id, "IN", 5, "2024-03-01 08:00:00"),
+                    (self.product_id, "OUT", 4, "2024-03-20 18:30:00"),
+                ],
+            )
+
+    def _points(self) -> list[int]:
+        return [
+            stock_at(self.product_id, moment)
+            for moment in ("2024-01-01", "2024-01-15 09:00:00", "2024-02-15", "2024-03-01 12:00:00", "2024-03-25", "2024-06-01")
+        ]
+
+    def test_compaction_keeps_point_in_time_answers(self) -> None:
+        before = self._points()
+        self.assertEqual(before, [0, 10, 7, 12, 8, 8])
+
+        result = compact_stock_ledger("2024-04-01")
+        self.assertEqual(result, {"months": 3, "snapshots": 3, "archived": 4})
+        self.assertEqual(ledger_compacted_until(), "2024-04-01")
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) AS n FROM stock_movements WHERE product_id = ?", (self.product_id,))
+            self.assertEqual(cur.fetchone()["n"], 0)
+            cur.execute("SELECT taken_at, quantity FROM stock_snapshots WHERE product_id = ? ORDER BY taken_at", (self.product_id,))
+            snapshots = [tuple(row) for row in cur.fetchall()]
+        self.assertEqual(snapshots, [("2024-02-01", 10), ("2024-03-01", 7), ("2024-04-01", 8)])
+        self.assertEqual(self._points(), before)
+
+        # Relance: rien à faire.
+        self.assertEqual(compact_stock_ledger("2024-04-01"), {"months": 0, "snapshots": 0, "archived": 0})
+
+    def test_stock_at_adds_recent_movements_to_snapshot(self) -> None:
+        compact_stock_ledger("2024-04-01")
+        add_stock(self.product_id, "D-1", FAR, 6)
+        create_sale(1, [{"product_id": self.product_id, "quantity": 2}], "cash")
+
+        # Le lot réel ne contient que les 6 unités reçues: seul l'historique a été injecté.
+        self.assertEqual(get_total_stock(self.product_id), 4)
+        self.assertEqual(stock_at(self.product_id, date.today() + timedelta(days=1)), 8 + 6 - 2)
+
+        compact_stock_ledger(date.today())
+        self.assertEqual(stock_at(self.product_id, date.today() + timedelta(days=1)), 12)
+
+    def test_archived_movements_still_block_deletion(self) -> None:
+        compact_stock_ledger("2024-04-01")
+        with self.assertRaises(ValueError):
+            delete_product(self.product_id)
+
+    def test_future_cutoff_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            compact_stock_ledger(date.today() + timedelta(days=1))
+
+
+
+class LedgerReconciliationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.product_id = create_product("Smecta", "R-1", "Digestif", 1, 2, 0, 0, False)
+        self.other_id = create_product("Spasfon", "R-2", "Digestif", 1, 2, 0, 0, False)
+        add_stock(self.product_id, "S-1", FAR, 10)
+        add_stock(self.other_id, "P-1", FAR, 4)
+        self.sale_id = create_sale(1, [{"product_id": self.product_id, "quantity": 3}], "cash")
+
+    def test_movements_carry_batch_id(self) -> None:
+        with db_cursor() as cur:
+            cur.execute("SELECT type, batch_id FROM stock_movements WHERE product_id = ? ORDER BY id", (self.product_id,))
+            rows = [tuple(row) for row in cur.fetchall()]
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all(batch_id is not None for _type, batch_id in rows))
+
+    def test_consistent_ledger_reports_nothing(self) -> None:
+        self.assertEqual(reconcile_stock_ledger(), [])
+        compact_stock_ledger(date.today())
+        self.assertEqual(reconcile_stock_ledger(), [])
+
+    def test_drift_is_reported_and_adjusted(self) -> None:
+        # Écriture directe sur un lot, sans mouvement.
+        with db_cursor() as cur:
+            cur.execute("UPDATE batches SET quantity = quantity - 2 WHERE product_id = ?", (self.product_id,))
+
+        rows = reconcile_stock_ledger()
+        self.assertEqual(
+            [(r["product_id"], r["name"], r["ledger"], r["batches"], r["difference"]) for r in rows],
+            [(self.product_id, "Smecta", 7, 5, -2)],
+        )
+
+        self.assertEqual(len(reconcile_stock_ledger(correct=True)), 1)
+        with db_cursor() as cur:
+            cur.execute("SELECT type, quantity FROM stock_movements WHERE product_id = ? ORDER BY id DESC LIMIT 1", (self.product_id,))
+            self.assertEqual(tuple(cur.fetchone()), ("ADJUST", -2))
+        self.assertEqual(reconcile_stock_ledger(), [])
+        self.assertEqual(stock_at(self.product_id, date.today() + timedelta(days=1)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
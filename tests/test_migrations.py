@@ -0,0 +1,38 @@
+import os
+import unittest
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+from pharmacy_pos.migrations import MIGRATIONS, current_version, migrate
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+
+    def test_init_db_applies_all_migrations_once(self) -> None:
+        init_db()
+        with db_cursor() as cur:
+            self.assertEqual(current_version(cur), MIGRATIONS[-1].version)
+            self.assertEqual(migrate(cur), 0)
+            cur.execute("SELECT COUNT(*) AS n FROM schema_version")
+            self.assertEqual(cur.fetchone()["n"], len(MIGRATIONS))
+
+    def test_hot_queries_use_indexes(self) -> None:
+        with db_cursor() as cur:
+            cur.execute(
+                "EXPLAIN QUERY PLAN SELECT id, quantity FROM batches "
+                "WHERE product_id = 1 AND quantity > 0 ORDER BY expiry_date, id"
+            )
+            fifo_plan = " ".join(row["detail"] for row in cur.fetchall())
+            cur.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM sale_items WHERE product_id = 1")
+            count_plan = " ".join(row["detail"] for row in cur.fetchall())
+
+        self.assertIn("idx_batches_fifo", fifo_plan)
+        self.assertIn("idx_sale_items_product", count_plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,14 @@ import unittest
 from pharmacy_pos.config import DB_PATH
 from pharmacy_pos.database import init_db
 from pharmacy_pos.services.auth_service import ensure_default_admin
-from pharmacy_pos.services.product_service import create_product, delete_product, list_products
+from pharmacy_pos.services.product_service import (
+    create_product,
+    delete_product,
+    fuzzy_search_products,
+    list_products,
+    list_products_page,
+    search_products,
+)
 from pharmacy_pos.services.stock_service import add_stock
 
 
@@ -41,6 +48,58 @@ class ProductServiceTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             delete_product(pid)
 
+    def test_search_is_accent_insensitive_and_prefix_based(self) -> None:
+        pid = create_product("Paracétamol 500mg", "3400010", "Antalgiques", 1, 2, 0, 0, False)
+        create_product("Ibuprofène 400mg", "3400020", "Antalgiques", 1, 2, 0, 0, False)
+
+        self.assertEqual([r["id"] for r in search_products("paracetamol")], [pid])
+        self.assertEqual([r["id"] for r in search_products("PARA 500")], [pid])
+        self.assertEqual([r["id"] for r in search_products("3400010")], [pid])
+
+        delete_product(pid)
+        self.assertEqual(search_products("paracetamol"), [])
+
+    def test_fuzzy_search_tolerates_typos(self) -> None:
+        amox = create_product("Amoxicilline 1g", "3400030", "Antibiotiques", 1, 2, 0, 0, True)
+        para = create_product("Paracétamol 500mg", "3400010", "Antalgiques", 1, 2, 0, 0, False)
+        create_product("Ibuprofène 400mg", "3400020", "Antalgiques", 1, 2, 0, 0, False)
+
+        self.assertEqual([r["id"] for r in fuzzy_search_products("amoxiciline")], [amox])
+        self.assertEqual([r["id"] for r in fuzzy_search_products("paracetemol 500")], [para])
+        # La recherche caisse bascule seule sur la recherche approchée.
+        self.assertEqual([r["id"] for r in search_products("paracetemol")], [para])
+        self.assertEqual(fuzzy_search_products("xyzzy"), [])
+
+        delete_product(amox)
+        self.assertEqual(fuzzy_search_products("amoxiciline"), [])
+
+    def test_keyset_pages_cover_catalogue_with_filters(self) -> None:
+        for i in range(7):
+            create_product(f"Produit {i % 3}", f"PG{i}", "Rx" if i % 2 else "Divers", 1, 2, 0, 5, i % 2 == 1)
+        low = create_product("Produit bas", "PGLOW", "Divers", 1, 2, 0, 5, False)
+        add_stock(low, "L1", "2099-01-01", 2)
+        full = create_product("Produit plein", "PGFULL", "Divers", 1, 2, 0, 0, False)
+        add_stock(full, "L2", "2099-01-01", 10)
+
+        pages, after = [], None
+        while True:
+            page = list_products_page(after, limit=3)
+            if not page:
+                break
+            pages.append(page)
+            after = (page[-1]["name"], page[-1]["id"])
+        expected = sorted(list_products(), key=lambda p: (p["name"], p["id"]))
+        self.assertEqual([p["id"] for page in pages for p in page], [p["id"] for p in expected])
+        self.assertEqual(len(pages), 3)
+
+        rx = list_products_page(category="Rx", prescription_only=True)
+        self.assertEqual(len(rx), 3)
+        self.assertTrue(all(p["requires_prescription"] for p in rx))
+        self.assertNotIn(low, [p["id"] for p in list_products_page(category="Rx")])
+        low_ids = {p["id"] for p in list_products_page(low_stock=True)}
+        self.assertIn(low, low_ids)
+        self.assertEqual(len(low_ids), 8)
+
 
 if __name__ == "__main__":
     unittest.main()
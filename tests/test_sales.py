@@ -76,6 +76,47 @@ class SalesFlowTest(unittest.TestCase):
         )
         self.assertGreater(sale_id, 0)
 
+    def test_multi_line_sale_allocates_across_lots(self) -> None:
+        first = create_product("Compresses", "CMP1", "Divers", 1, 2, 0, 1, False)
+        second = create_product("Bandes", "BND1", "Divers", 1, 3, 0, 1, False)
+        add_stock(first, "C1", "2029-01-01", 2)
+        add_stock(first, "C2", "2029-06-01", 5)
+        add_stock(second, "B1", "2029-01-01", 4)
+
+        sale_id = create_sale(
+            1,
+            [
+                {"product_id": first, "quantity": 1},
+                {"product_id": second, "quantity": 4},
+                {"product_id": first, "quantity": 3},
+            ],
+            "cash",
+        )
+
+        items = get_sale_items(sale_id)
+        self.assertEqual(
+            [(i["batch_number"], i["quantity"]) for i in items],
+            [("C1", 1), ("B1", 4), ("C1", 1), ("C2", 2)],
+        )
+        self.assertEqual(get_total_stock(first), 3)
+        self.assertEqual(get_total_stock(second), 0)
+
+    def test_failed_sale_line_leaves_stock_untouched(self) -> None:
+        free_id = create_product("Sérum", "SER1", "Divers", 1, 2, 0, 1, False)
+        rx_id = create_product("Antibio", "RX2", "Rx", 1, 2, 0, 1, True)
+        add_stock(free_id, "S1", "2029-01-01", 10)
+        add_stock(rx_id, "R1", "2029-01-01", 10)
+
+        with self.assertRaises(ValueError):
+            create_sale(
+                1,
+                [{"product_id": free_id, "quantity": 3}, {"product_id": rx_id, "quantity": 1}],
+                "cash",
+            )
+
+        self.assertEqual(get_total_stock(free_id), 10)
+        self.assertEqual(list_sales(), [])
+
     def test_search_products_by_name_and_barcode(self) -> None:
         create_product("Amoxicilline", "ABC123", "Rx", 2, 6, 0, 1, True)
         create_product("Vitamine D", "VITD", "Supp", 1, 3, 0, 1, False)
@@ -112,6 +153,25 @@ class SalesFlowTest(unittest.TestCase):
 
         self.assertEqual(get_total_stock(product_id), 7)
 
+    def test_resubmitted_sale_with_same_key_is_not_duplicated(self) -> None:
+        product_id = create_product("Smecta", "888", "Digestif", 2, 4, 0, 0, False)
+        add_stock(product_id, "S1", "2099-01-01", 10)
+        cart = [{"product_id": product_id, "quantity": 3}]
+
+        sale_id = create_sale(1, cart, "cash", idempotency_key="panier-1")
+        self.assertEqual(create_sale(1, cart, "cash", idempotency_key="panier-1"), sale_id)
+        self.assertEqual(get_total_stock(product_id), 7)
+        self.assertEqual(len(list_sales()), 1)
+
+        other_id = create_sale(1, cart, "cash", idempotency_key="panier-2")
+        self.assertNotEqual(other_id, sale_id)
+        self.assertEqual(get_total_stock(product_id), 4)
+
+        # Stock désormais insuffisant: la vente déjà enregistrée est rendue sans réallocation.
+        create_sale(1, [{"product_id": product_id, "quantity": 4}], "cash")
+        self.assertEqual(create_sale(1, cart, "cash", idempotency_key="panier-1"), sale_id)
+        self.assertEqual(get_total_stock(product_id), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
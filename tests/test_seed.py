@@ -1,11 +1,13 @@
 import os
+import time
 import unittest
 
 from pharmacy_pos.config import DB_PATH
-from pharmacy_pos.database import init_db
+from pharmacy_pos.database import db_cursor, init_db
 from pharmacy_pos.services.auth_service import ensure_default_admin
-from pharmacy_pos.services.demo_seed_service import seed_demo_products
+from pharmacy_pos.services.demo_seed_service import generate_demo_dataset, seed_demo_products
 from pharmacy_pos.services.product_service import create_product, list_products
+from pharmacy_pos.services.stock_service import verify_stock_counters
 
 
 class SeedDemoTest(unittest.TestCase):
@@ -37,6 +39,45 @@ class SeedDemoTest(unittest.TestCase):
         self.assertIn("340001001", barcodes)
         self.assertIn("340001005", barcodes)
 
+    def test_generated_dataset_keeps_ledger_consistent(self) -> None:
+        seed_demo_products()
+        stats = generate_demo_dataset(products=40, categories=4, months=1, sales_per_day=30, seed=7)
+
+        self.assertEqual(len(list_products()), 45)
+        self.assertGreater(stats["sales"], 0)
+        self.assertGreaterEqual(stats["sale_items"], stats["sales"])
+        self.assertEqual(verify_stock_counters(), [])
+        with db_cursor() as cur:
+            cur.execute(
+                """
+                SELECT (SELECT SUM(CASE type WHEN 'IN' THEN quantity ELSE -quantity END) FROM stock_movements) AS ledger,
+                       (SELECT SUM(quantity) FROM batches) AS stock,
+                       (SELECT COUNT(*) FROM sale_items) AS items
+                """
+            )
+            row = cur.fetchone()
+        self.assertEqual(row["ledger"], row["stock"])
+        self.assertEqual(row["items"], stats["sale_items"])
+
+    def test_generated_history_is_stamped_in_utc(self) -> None:
+        # Fuseau en avance sur UTC: une heure locale donnerait des ventes dans le futur.
+        previous = os.environ.get("TZ")
+        os.environ["TZ"] = "Pacific/Kiritimati"
+        time.tzset()
+        try:
+            stats = generate_demo_dataset(products=20, categories=2, months=1, sales_per_day=30, seed=3)
+        finally:
+            if previous is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = previous
+            time.tzset()
+
+        self.assertGreater(stats["sales"], 0)
+        with db_cursor() as cur:
+            cur.execute("SELECT MAX(created_at) <= CURRENT_TIMESTAMP AS ok FROM sales")
+            self.assertEqual(cur.fetchone()["ok"], 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,13 +1,24 @@
 import os
+import time
 import unittest
 from datetime import date, timedelta
 
 from pharmacy_pos.config import DB_PATH
-from pharmacy_pos.database import init_db
+from pharmacy_pos.database import db_cursor, init_db
 from pharmacy_pos.services.auth_service import ensure_default_admin
 from pharmacy_pos.services.product_service import create_product
-from pharmacy_pos.services.sales_service import create_sale
-from pharmacy_pos.services.stock_service import add_stock, get_expiring_batches, get_low_stock_products
+from pharmacy_pos.services.sales_service import cancel_sale, create_sale
+from pharmacy_pos.services.stock_service import (
+    add_stock,
+    get_expiring_batches,
+    get_expiry_calendar,
+    get_low_stock_products,
+    get_total_stock,
+    rebuild_stock_counters,
+    receive_delivery,
+    roll_expired_stock,
+    verify_stock_counters,
+)
 
 
 class StockAlertTest(unittest.TestCase):
@@ -50,6 +61,112 @@ class StockAlertTest(unittest.TestCase):
         self.assertIn("GEL-10", batch_numbers)
         self.assertNotIn("GEL-180", batch_numbers)
 
+    def test_expiry_dates_are_normalized_and_validated(self) -> None:
+        product_id = create_product("Collyre", "556", "Divers", 1, 2, 0, 1, False)
+        batch_id = add_stock(product_id, "C1", "31/12/2099", 1)
+        with db_cursor() as cur:
+            cur.execute("SELECT expiry_date FROM batches WHERE id = ?", (batch_id,))
+            self.assertEqual(cur.fetchone()["expiry_date"], "2099-12-31")
+
+        for invalid in ("2099-13-01", "demain", ""):
+            with self.assertRaises(ValueError):
+                add_stock(product_id, "C2", invalid, 1)
+
+    def test_expiry_calendar_buckets_quantities_and_value(self) -> None:
+        product_id = create_product("Pommade", "557", "Divers", 10, 15, 0, 1, False)
+        in_5 = date.today() + timedelta(days=5)
+        in_40 = date.today() + timedelta(days=40)
+        add_stock(product_id, "P1", in_5.isoformat(), 2)
+        add_stock(product_id, "P2", in_5.isoformat(), 3)
+        add_stock(product_id, "P3", in_40.isoformat(), 4)
+        add_stock(product_id, "P4", (date.today() + timedelta(days=400)).isoformat(), 9)
+
+        months = get_expiry_calendar(90, "month")
+        self.assertEqual(months[0]["start"], date.today().replace(day=1).isoformat())
+        self.assertEqual(sum(m["quantity"] for m in months), 9)
+        self.assertEqual(sum(m["stock_value"] for m in months), 90)
+
+        weeks = get_expiry_calendar(60, "week")
+        by_start = {w["start"]: w for w in weeks}
+        week_5 = by_start[(in_5 - timedelta(days=in_5.weekday())).isoformat()]
+        self.assertEqual((week_5["batches"], week_5["quantity"], week_5["sale_value"]), (2, 5, 75))
+        self.assertTrue(all(date.fromisoformat(w["start"]).weekday() == 0 for w in weeks))
+
+    def test_stock_counters_follow_batches(self) -> None:
+        product_id = create_product("Collyre", "666", "Divers", 1, 2, 0, 1, False)
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        add_stock(product_id, "COL-OLD", yesterday, 4)
+        add_stock(product_id, "COL-NEW", "2029-01-01", 10)
+        sale_id = create_sale(1, [{"product_id": product_id, "quantity": 3}], "cash")
+
+        with db_cursor() as cur:
+            cur.execute("SELECT stock_total, stock_valid FROM products WHERE id = ?", (product_id,))
+            row = cur.fetchone()
+        self.assertEqual((row["stock_total"], row["stock_valid"]), (11, 7))
+
+        cancel_sale(sale_id)
+        self.assertEqual(verify_stock_counters(), [])
+
+    def test_counters_roll_on_the_utc_day(self) -> None:
+        # Fuseau très éloigné d'UTC: le jour local diffère de DATE('now') une bonne partie de la journée.
+        previous = os.environ.get("TZ")
+        os.environ["TZ"] = "Pacific/Kiritimati"
+        time.tzset()
+        try:
+            roll_expired_stock()
+        finally:
+            if previous is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = previous
+            time.tzset()
+
+        with db_cursor() as cur:
+            cur.execute("SELECT value, DATE('now') AS utc_day FROM app_meta WHERE key = 'stock_valid_as_of'")
+            row = cur.fetchone()
+        self.assertEqual(row["value"], row["utc_day"])
+
+    def test_rebuild_stock_counters_fixes_drift(self) -> None:
+        product_id = create_product("Pommade", "777", "Divers", 1, 2, 0, 1, False)
+        add_stock(product_id, "POM-1", "2029-01-01", 5)
+        with db_cursor() as cur:
+            cur.execute("UPDATE products SET stock_total = 42 WHERE id = ?", (product_id,))
+
+        drift = rebuild_stock_counters()
+
+        self.assertEqual([d["id"] for d in drift], [product_id])
+        self.assertEqual(verify_stock_counters(), [])
+
+    def test_receive_delivery_merges_lines_in_one_transaction(self) -> None:
+        first = create_product("Doliprane", "RCV1", "Antalgiques", 1, 2, 0, 0, False)
+        second = create_product("Smecta", "RCV2", "Digestif", 1, 2, 0, 0, False)
+
+        batch_ids = receive_delivery(
+            [
+                {"product_id": first, "batch_number": "D1", "expiry_date": "2099-01-01", "quantity": 10},
+                {"product_id": second, "batch_number": "S1", "expiry_date": "2099-02-01", "quantity": 4},
+                {"product_id": first, "batch_number": "D1", "expiry_date": "2099-01-01", "quantity": 5},
+            ]
+        )
+
+        self.assertEqual(len(batch_ids), 2)
+        with db_cursor() as cur:
+            cur.execute("SELECT product_id, quantity FROM batches WHERE id IN (?, ?) ORDER BY id", batch_ids)
+            self.assertEqual([tuple(row) for row in cur.fetchall()], [(first, 15), (second, 4)])
+            cur.execute("SELECT COUNT(*) AS n FROM stock_movements WHERE type = 'IN'")
+            self.assertEqual(cur.fetchone()["n"], 2)
+        self.assertEqual(get_total_stock(first), 15)
+
+        # Une ligne invalide annule toute la réception.
+        with self.assertRaises(ValueError):
+            receive_delivery(
+                [
+                    {"product_id": first, "batch_number": "D2", "expiry_date": "2099-01-01", "quantity": 1},
+                    {"product_id": 9999, "batch_number": "X", "expiry_date": "2099-01-01", "quantity": 1},
+                ]
+            )
+        self.assertEqual(get_total_stock(first), 15)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import db_cursor, init_db
+from pharmacy_pos.services.alert_service import list_active_alerts
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.import_service import read_stocktake_csv
+from pharmacy_pos.services.ledger_service import reconcile_stock_ledger
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.sales_service import create_sale
+from pharmacy_pos.services.stock_service import add_stock, get_total_stock
+from pharmacy_pos.services.stocktake_service import start_stocktake
+
+FAR = (date.today() + timedelta(days=400)).isoformat()
+
+
+class StocktakeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.doli = create_product("Doliprane", "3400001", "Antalgiques", 1, 2, 0, 5, False)
+        self.smecta = create_product("Smecta", "3400002", "Digestif", 1, 2, 0, 0, False)
+        self.d1 = add_stock(self.doli, "D-1", FAR, 10)
+        self.d2 = add_stock(self.doli, "D-2", FAR, 4)
+        self.s1 = add_stock(self.smecta, "S-1", FAR, 7)
+
+    def test_scans_are_buffered_and_committed_in_one_pass(self) -> None:
+        session = start_stocktake(user_id=1)
+        for _ in range(8):
+            session.scan("3400001", "D-1")
+        session.scan("3400002", "S-1", 7)
+        session.set_count(self.d2, 3)
+
+        # Aucun écart n'est écrit avant la validation.
+        self.assertEqual(get_total_stock(self.doli), 14)
+        preview = session.preview()
+        self.assertEqual([(r["batch_id"], r["expected"], r["counted"]) for r in preview], [(self.d1, 10, 8), (self.d2, 4, 3)])
+
+        result = session.commit()
+        self.assertEqual(result, {"counted": 3, "adjusted": 2, "delta": -3})
+        self.assertEqual(get_total_stock(self.doli), 11)
+        self.assertEqual(get_total_stock(self.smecta), 7)
+        with db_cursor() as cur:
+            cur.execute("SELECT batch_id, quantity, reason FROM stock_movements WHERE type = 'ADJUST' ORDER BY batch_id")
+            adjustments = [tuple(row) for row in cur.fetchall()]
+            cur.execute("SELECT status, counted_lines, adjusted_lines FROM stocktakes WHERE id = ?", (session.id,))
+            status = tuple(cur.fetchone())
+        self.assertEqual(adjustments, [(self.d1, -2, f"Inventaire #{session.id}"), (self.d2, -1, f"Inventaire #{session.id}")])
+        self.assertEqual(status, ("committed", 3, 2))
+
+        # Registre et lots restent cohérents, le cache FEFO suit.
+        self.assertEqual(reconcile_stock_ledger(), [])
+        create_sale(1, [{"product_id": self.doli, "quantity": 9}], "cash")
+        self.assertEqual(get_total_stock(self.doli), 2)
+
+        with self.assertRaises(ValueError):
+            session.commit()
+
+    def test_full_count_zeroes_uncounted_lots_in_scope(self) -> None:
+        session = start_stocktake(category="Antalgiques")
+        session.scan("3400001", "D-1", 10)
+        with self.assertRaises(ValueError):
+            session.scan("3400002", "S-1")  # hors périmètre
+
+        result = session.commit(zero_uncounted=True)
+        self.assertEqual(result["adjusted"], 1)
+        self.assertEqual(get_total_stock(self.doli), 10)
+        self.assertEqual(get_total_stock(self.smecta), 7)
+
+    def test_adjustment_raises_low_stock_alert(self) -> None:
+        session = start_stocktake()
+        session.scan("3400001", "D-1", 2)
+        session.scan("3400001", "D-2", 1)
+        session.commit()
+        self.assertEqual([a["product_id"] for a in list_active_alerts("low_stock")], [self.doli])
+
+    def test_lot_received_twice_is_counted_across_its_batches(self) -> None:
+        other = add_stock(self.doli, "D-1", FAR, 5)
+        session = start_stocktake()
+        session.scan("3400001", "D-1", 12)
+        session.scan("3400001", "D-1", 3)
+        self.assertEqual(session.counts, {self.d1: 10, other: 5})
+
+        result = session.commit(zero_uncounted=True)
+        # D-2 et S-1 non comptés: mis à zéro; les deux lots D-1 gardent leurs 15 unités.
+        self.assertEqual(result["delta"], -11)
+        self.assertEqual(get_total_stock(self.doli), 15)
+        self.assertEqual(get_total_stock(self.smecta), 0)
+        self.assertEqual(reconcile_stock_ledger(), [])
+
+    def test_count_file(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as f:
+            f.write("code_barre;lot;quantite\n3400001;D-1;6\n3400001;D-1;3\n3400002;S-1;7\n")
+        try:
+            lines = read_stocktake_csv(f.name)
+        finally:
+            os.remove(f.name)
+
+        session = start_stocktake()
+        for line in lines:
+            session.scan(line["barcode"], line["batch_number"], line["quantity"])
+        self.assertEqual(session.counts, {self.d1: 9, self.s1: 7})
+        session.cancel()
+        with self.assertRaises(ValueError):
+            session.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
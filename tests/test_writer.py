@@ -0,0 +1,98 @@
+import os
+import threading
+import unittest
+from datetime import date, timedelta
+
+from pharmacy_pos.config import DB_PATH
+from pharmacy_pos.database import init_db, transaction
+from pharmacy_pos.services.allocation_service import reconcile_fefo_cache
+from pharmacy_pos.services.auth_service import ensure_default_admin
+from pharmacy_pos.services.ledger_service import reconcile_stock_ledger
+from pharmacy_pos.services.product_service import create_product
+from pharmacy_pos.services.sales_service import cancel_sale, create_sale
+from pharmacy_pos.services.stock_service import add_stock, get_total_stock
+from pharmacy_pos.writer import start_writer, stop_writer, writer_stats
+
+FAR = (date.today() + timedelta(days=400)).isoformat()
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        init_db()
+        ensure_default_admin()
+        self.pid = create_product("Doliprane", "3400001", "Antalgiques", 1, 2, 0, 0, False)
+        add_stock(self.pid, "D-1", FAR, 10)
+        self.writer = start_writer()
+
+    def tearDown(self) -> None:
+        stop_writer()
+
+    def _hold_writer(self) -> threading.Event:
+        """Bloque l'écrivain sur une opération: les suivantes s'accumulent dans la file."""
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocker() -> None:
+            started.set()
+            release.wait(5)
+
+        self.writer.submit(blocker)
+        started.wait(5)
+        return release
+
+    def test_calls_keep_their_semantics(self) -> None:
+        new_pid = create_product("Smecta", "3400002", "Digestif", 1, 2, 0, 0, False)
+        add_stock(new_pid, "S-1", FAR, 5)
+        sale_id = create_sale(1, [{"product_id": new_pid, "quantity": 2}], "cash")
+        self.assertIsInstance(sale_id, int)
+        self.assertEqual(get_total_stock(new_pid), 3)
+        with self.assertRaisesRegex(ValueError, "Stock insuffisant"):
+            create_sale(1, [{"product_id": new_pid, "quantity": 9}], "cash")
+        cancel_sale(sale_id)
+        self.assertEqual(get_total_stock(new_pid), 5)
+        self.assertEqual(writer_stats()["operations"], 5)
+
+    def test_pending_operations_share_one_transaction(self) -> None:
+        release = self._hold_writer()
+        sale = {"product_id": self.pid, "quantity": 4}
+        futures = [self.writer.submit(create_sale, 1, [sale], "cash") for _ in range(3)]
+        release.set()
+
+        # 10 en stock: deux ventes passent, la troisième échoue seule.
+        self.assertIsInstance(futures[0].result(5), int)
+        self.assertIsInstance(futures[1].result(5), int)
+        with self.assertRaisesRegex(ValueError, "Stock insuffisant"):
+            futures[2].result(5)
+        stats = writer_stats()
+        self.assertEqual(stats["max_batch"], 3)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(get_total_stock(self.pid), 2)
+        self.assertEqual(reconcile_stock_ledger(), [])
+        # Les caches mémoire n'ont reçu que les opérations validées.
+        self.assertEqual(reconcile_fefo_cache(), 0)
+        create_sale(1, [{"product_id": self.pid, "quantity": 2}], "cash")
+        self.assertEqual(get_total_stock(self.pid), 0)
+
+    def test_caller_transaction_is_not_sent_to_writer(self) -> None:
+        with transaction() as cur:
+            create_sale(1, [{"product_id": self.pid, "quantity": 1}], "cash", cur=cur)
+            cancel_sale(create_sale(1, [{"product_id": self.pid, "quantity": 1}], "cash"))
+        self.assertEqual(get_total_stock(self.pid), 9)
+        self.assertEqual(writer_stats()["operations"], 0)
+
+    def test_stop_runs_pending_operations(self) -> None:
+        release = self._hold_writer()
+        future = self.writer.submit(add_stock, self.pid, "D-2", FAR, 5)
+        threading.Timer(0.05, release.set).start()
+        stop_writer()
+        self.assertIsInstance(future.result(0), int)
+        self.assertEqual(get_total_stock(self.pid), 15)
+        # Écrivain arrêté: appel direct.
+        create_sale(1, [{"product_id": self.pid, "quantity": 1}], "cash")
+        self.assertEqual(get_total_stock(self.pid), 14)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Compacte le registre des mouvements de stock en instantanés mensuels.
+
+Usage:
+    python tools/compact_ledger.py
+    python tools/compact_ledger.py --before 2025-01-01 --db /tmp/pharma.db
+
+Les mouvements antérieurs à la date limite (par défaut: début du mois, trois
+mois en arrière) sont repliés en instantanés par produit et déplacés vers
+stock_movements_archive. Relançable sans effet si déjà fait.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compactage du registre de stock pharmacy_pos")
+    parser.add_argument("--before", help="date limite AAAA-MM-JJ (exclue)")
+    parser.add_argument("--db", help="chemin de la base SQLite (défaut: configuration)")
+    args = parser.parse_args()
+
+    # Le chemin de la base est lu à l'import de la configuration.
+    if args.db:
+        os.environ["PHARMACY_POS_DB"] = str(Path(args.db).resolve())
+
+    from pharmacy_pos.database import close_connections, init_db
+    from pharmacy_pos.services.ledger_service import compact_stock_ledger
+
+    init_db()
+    start = time.perf_counter()
+    result = compact_stock_ledger(args.before)
+    close_connections()
+
+    print(
+        f"{result['months']} mois compactés, {result['snapshots']} instantanés, "
+        f"{result['archived']} mouvements archivés en {time.perf_counter() - start:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
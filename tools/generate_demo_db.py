@@ -0,0 +1,57 @@
+"""Génère une base de démonstration volumineuse (catalogue + historique).
+
+Usage:
+    python tools/generate_demo_db.py --db /tmp/pharma_big.db --products 100000 --months 12 --sales-per-day 5000
+
+La base cible doit être neuve (ou ne contenir que des données de test):
+les identifiants générés suivent les identifiants existants.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Générateur de données synthétiques pharmacy_pos")
+    parser.add_argument("--db", required=True, help="chemin de la base SQLite à remplir")
+    parser.add_argument("--products", type=int, default=1_000)
+    parser.add_argument("--categories", type=int, default=15)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--sales-per-day", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cancel-rate", type=float, default=0.01)
+    parser.add_argument("--return-rate", type=float, default=0.005)
+    args = parser.parse_args()
+
+    # Le chemin de la base est lu à l'import de la configuration.
+    os.environ["PHARMACY_POS_DB"] = str(Path(args.db).resolve())
+
+    from pharmacy_pos.database import close_connections, init_db
+    from pharmacy_pos.services.auth_service import ensure_default_admin
+    from pharmacy_pos.services.demo_seed_service import generate_demo_dataset
+
+    init_db()
+    ensure_default_admin()
+    start = time.perf_counter()
+    stats = generate_demo_dataset(
+        products=args.products,
+        categories=args.categories,
+        months=args.months,
+        sales_per_day=args.sales_per_day,
+        seed=args.seed,
+        cancel_rate=args.cancel_rate,
+        return_rate=args.return_rate,
+    )
+    close_connections()
+    size_mb = Path(args.db).stat().st_size / 1024 / 1024
+    print(f"{stats} en {time.perf_counter() - start:.1f} s ({size_mb:.0f} Mo)")
+
+
+if __name__ == "__main__":
+    main()
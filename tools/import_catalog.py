@@ -0,0 +1,61 @@
+"""Importe un catalogue fournisseur (CSV) dans la base.
+
+Usage:
+    python tools/import_catalog.py catalogue.csv
+    python tools/import_catalog.py catalogue.csv --db /tmp/pharma.db --rejects rejets.csv
+
+Colonnes: name, barcode, category, buy_price, sell_price, tva, min_stock,
+requires_prescription (ou leurs alias français: nom, code_barre, categorie,
+prix_achat, prix_vente, stock_min, ordonnance).
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import CSV du catalogue pharmacy_pos")
+    parser.add_argument("csv", help="fichier CSV fournisseur")
+    parser.add_argument("--db", help="chemin de la base SQLite (défaut: configuration)")
+    parser.add_argument("--delimiter", help="séparateur (détecté si absent)")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    parser.add_argument("--rejects", help="écrit les lignes rejetées (ligne;raison) dans ce fichier")
+    args = parser.parse_args()
+
+    # Le chemin de la base est lu à l'import de la configuration.
+    if args.db:
+        os.environ["PHARMACY_POS_DB"] = str(Path(args.db).resolve())
+
+    from pharmacy_pos.database import close_connections, init_db
+    from pharmacy_pos.services.import_service import import_products_csv
+
+    init_db()
+    start = time.perf_counter()
+    report = import_products_csv(args.csv, delimiter=args.delimiter, encoding=args.encoding)
+    close_connections()
+
+    print(
+        f"{report.inserted} créés, {report.updated} mis à jour, {report.unchanged} inchangés, "
+        f"{len(report.rejected)} rejetés "
+        f"en {time.perf_counter() - start:.1f} s"
+    )
+    for line, reason in report.rejected[:20]:
+        print(f"  ligne {line}: {reason}")
+    if len(report.rejected) > 20:
+        print(f"  ... {len(report.rejected) - 20} autres")
+    if args.rejects:
+        with open(args.rejects, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["ligne", "raison"])
+            writer.writerows(report.rejected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Réconcilie le registre des mouvements de stock avec les lots.
+
+Usage:
+    python tools/reconcile_stock.py
+    python tools/reconcile_stock.py --fix --db /tmp/pharma.db
+
+Affiche les produits dont le stock attendu par le registre diffère de la
+somme des lots. `--fix` écrit un mouvement ADJUST par écart.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Réconciliation registre/lots pharmacy_pos")
+    parser.add_argument("--fix", action="store_true", help="solde les écarts par des mouvements ADJUST")
+    parser.add_argument("--db", help="chemin de la base SQLite (défaut: configuration)")
+    args = parser.parse_args()
+
+    # Le chemin de la base est lu à l'import de la configuration.
+    if args.db:
+        os.environ["PHARMACY_POS_DB"] = str(Path(args.db).resolve())
+
+    from pharmacy_pos.database import close_connections, init_db
+    from pharmacy_pos.services.ledger_service import reconcile_stock_ledger
+
+    init_db()
+    start = time.perf_counter()
+    rows = reconcile_stock_ledger(correct=args.fix)
+    close_connections()
+
+    print(f"{len(rows)} écart(s) en {time.perf_counter() - start:.1f} s" + (" (corrigés)" if args.fix and rows else ""))
+    for row in rows[:50]:
+        print(f"  #{row['product_id']} {row['name']}: registre={row['ledger']} lots={row['batches']} ({row['difference']:+d})")
+    if len(rows) > 50:
+        print(f"  ... {len(rows) - 50} autres")
+
+
+if __name__ == "__main__":
+    main()